@@ -0,0 +1,57 @@
+# server/auth/access.py
+"""
+API key authentication and per-key rate limiting, shared by the blueprints
+that require an API key. `admin_auth` guards the routes that read or write
+tokens wholesale, with the keys in `ADMIN_KEYS`.
+"""
+
+from flask import jsonify, make_response, request
+from flask_httpauth import HTTPTokenAuth
+
+from auth.main import config
+from auth.ratelimit import RateLimiter, retry_after
+from auth.responses import Responses
+
+req_auth = HTTPTokenAuth(header="X-API-Key")
+
+
+@req_auth.verify_token
+def verify_token(token):
+    """
+    Verify api key from header.
+    """
+    return token in config["SECRET_KEYS"]
+
+
+@req_auth.error_handler
+def unauthorized():
+    return make_response(jsonify({"message": "Unauthorized access"}), 403)
+
+
+admin_auth = HTTPTokenAuth(header="X-API-Key")
+admin_auth.error_handler(unauthorized)
+
+
+@admin_auth.verify_token
+def verify_admin_token(token):
+    """
+    Verify admin api key from header.
+    """
+    return bool(token) and token in config["ADMIN_KEYS"]
+
+
+limiter = RateLimiter.from_config(config)
+
+
+def rate_limit():
+    """
+    Reject requests over the API key's rate limit for the route. Requests
+    without a valid key are left to `login_required`.
+    """
+    api_key = request.headers.get("X-API-Key")
+    if not api_key or request.endpoint is None or not verify_token(api_key):
+        return None
+    wait = limiter.acquire(api_key, request.endpoint)
+    if wait:
+        return Responses.too_many_requests(retry_after(wait))
+    return None
@@ -1,40 +1,28 @@
 # server/auth/views.py
-from flask_cors import CORS, cross_origin
-import requests
 import flask_pydantic
-import logging
 
-from flask import Blueprint, request, make_response, jsonify
-from pydantic import BaseModel
-from flask_httpauth import HTTPTokenAuth
-from auth.main import db, config
-from auth.models import Token
+import datetime
+
+from flask import (
+    Blueprint,
+    Response,
+    request,
+    stream_with_context,
+)
+from pydantic import BaseModel, NonNegativeFloat, PositiveInt
+from auth.main import config
+from auth import access, replica, store
+from auth import export as token_export
+from auth import importer
+from auth.access import admin_auth, rate_limit, req_auth
+from auth.ratelimit import fingerprint
 from auth.responses import Responses
-from typing import Optional
+from typing import List, Literal, Optional
 
 
 auth_blueprint = Blueprint("auth", __name__)
-gdrive_blueprint = Blueprint("gdrive", __name__)
-redirect_blueprint = Blueprint("redirect", __name__)
 
-CORS(redirect_blueprint, origins=["https://feedback.gsa.gov"])
-
-req_auth = HTTPTokenAuth(header="X-API-Key")
-
-_timeout: int = config["REQUEST_TIMEOUT"]
-
-
-@req_auth.verify_token
-def verify_token(token):
-    """
-    Verify api key from header.
-    """
-    return token in config["SECRET_KEYS"]
-
-
-@req_auth.error_handler
-def unauthorized():
-    return make_response(jsonify({"message": "Unauthorized access"}), 403)
+auth_blueprint.before_request(rate_limit)
 
 
 """
@@ -55,6 +43,7 @@ def register():
     """
     seconds = config["DEFAULT_SECONDS"]
     uses = config["DEFAULT_USES"]
+    token_format = config.get("TOKEN_FORMAT", "uuid")
 
     # get the post data
     if (
@@ -66,185 +55,320 @@ def register():
             seconds = post_data.get("seconds")
         if post_data.get("uses"):
             uses = post_data.get("uses")
+        if post_data.get("format"):
+            token_format = post_data.get("format")
+
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= 255:
+        return Responses.invalid_idempotency_key(255)
 
     try:
-        token = Token(seconds, uses)
-
-        # insert the user
-        db.session.add(token)
-        db.session.commit()
-        # generate the auth token
-        auth_token = token.id
-        responseObject = {
-            "status": "success",
-            "message": "Successfully registered.",
-            "auth_token": auth_token,
-        }
-        return make_response(jsonify(responseObject)), 201
+        if idempotency_key is None:
+            return Responses.registered(
+                store.register(seconds, uses, signed=token_format == "signed")
+            )
+        key = f"{fingerprint(request.headers['X-API-Key'])}:{idempotency_key}"
+        return Responses.registered(
+            *store.register_once(key, seconds, uses, signed=token_format == "signed")
+        )
     except Exception as e:
         print(e)
         return Responses.error()
 
 
-@auth_blueprint.route("/state", methods=["GET"])
+class TokenSpecModel(BaseModel):
+    """
+    A single token in a `/auth/batch` request
+    """
+
+    seconds: Optional[PositiveInt] = None
+    uses: Optional[PositiveInt] = None
+
+
+class BatchRegisterModel(BaseModel):
+    """
+    Request body format for the `/auth/batch` endpoint. Either `count` tokens
+    sharing `seconds`/`uses`, or one token per entry in `tokens`.
+    """
+
+    count: Optional[PositiveInt] = None
+    seconds: Optional[PositiveInt] = None
+    uses: Optional[PositiveInt] = None
+    tokens: Optional[List[TokenSpecModel]] = None
+    format: Optional[Literal["uuid", "signed"]] = None
+
+
+@auth_blueprint.route("/batch", methods=["POST"])
 @req_auth.login_required
-def state():
+@flask_pydantic.validate()
+def register_batch(body: BatchRegisterModel):
     """
-    Token state
+    Bulk token registration route
     """
-    token_param = request.args.get("token", "")
+    seconds = body.seconds or config["DEFAULT_SECONDS"]
+    uses = body.uses or config["DEFAULT_USES"]
+
+    # checked before any specs are built for an arbitrary `count`
+    count = len(body.tokens) if body.tokens is not None else body.count or 1
+    if count > config["MAX_BATCH_SIZE"]:
+        return Responses.batch_too_large(config["MAX_BATCH_SIZE"])
+
+    if body.tokens is not None:
+        specs = [(spec.seconds or seconds, spec.uses or uses) for spec in body.tokens]
+    else:
+        specs = [(seconds, uses)] * count
+
     try:
-        token = Token.query.filter_by(id=token_param).first()
-        # check if token exists
-        if token:
-            return Responses.state(token.state)
-        return Responses.not_exist()
-    except:
-        return Responses.unauthorized()
+        auth_tokens = store.register_many(
+            specs, signed=(body.format or config.get("TOKEN_FORMAT")) == "signed"
+        )
+    except Exception as e:
+        print(e)
+        return Responses.error()
 
+    def generate():
+        yield '{"status": "success", "message": "Successfully registered.", '
+        yield '"auth_tokens": ['
+        for i, auth_token in enumerate(auth_tokens):
+            yield f'{", " if i else ""}"{auth_token}"'
+        yield "]}"
 
-@auth_blueprint.route("/<token_param>", methods=["GET"])
+    return Response(generate(), status=201, mimetype="application/json")
+
+
+class BatchTokensModel(BaseModel):
+    """
+    Request body format for the `/auth/batch/<operation>` endpoints
+    """
+
+    tokens: List[str]
+    state: str = ""
+
+
+def _reads():
+    """
+    Let a read-only route use the read replica, unless the client asked to
+    see its own writes
+    """
+    return replica.reads(request.headers.get("X-Consistency", "").lower() == "strong")
+
+
+def _parse_token(token_param: str) -> Optional[store.Parsed]:
+    try:
+        return store.parse(token_param)
+    except ValueError:
+        return None
+
+
+@auth_blueprint.route(
+    "/batch/<any(validate, invoke, exhaust):operation>", methods=["POST"]
+)
 @req_auth.login_required
-def validate(token_param):
+@flask_pydantic.validate()
+def batch(operation: str, body: BatchTokensModel):
     """
-    Token validation route
+    Bulk token validation, invocation and exhaustion route
     """
-    # post_data = request.get_json()
+    if len(body.tokens) > config["MAX_BATCH_SIZE"]:
+        return Responses.batch_too_large(config["MAX_BATCH_SIZE"])
+
+    tokens = [_parse_token(token_param) for token_param in body.tokens]
+    valid = [token for token in tokens if token is not None]
     try:
-        token = Token.query.filter_by(id=token_param).first()
-        # check if token exists
-        if token:
-            if token.exhausted:
-                return Responses.exhausted(token.state)
-            # check if token is expired
-            if token.is_expired():
-                return Responses.expired()
-            else:
-                return Responses.exist()
+        if operation == "validate":
+            with _reads():
+                results = store.validate_many(valid)
+        elif operation == "invoke":
+            results = store.invoke_many(valid)
         else:
-            return Responses.not_exist()
-    except:
-        return Responses.unauthorized()
+            results = store.exhaust_many(valid, body.state)
+    except Exception as e:
+        print(e)
+        return Responses.error()
 
+    by_token = dict(zip(valid, results))
+    response = []
+    for token_param, token in zip(body.tokens, tokens):
+        if token is None:
+            token_body, _ = Responses.body("unauthorized")
+        else:
+            result = by_token[token]
+            token_body, _ = Responses.body(result.outcome.value, result.state)
+        response.append({"token": token_param, **token_body})
+    return Responses.batch(response)
 
-@auth_blueprint.route("/<token_param>/decrement", methods=["POST"])
+
+@auth_blueprint.route("/state", methods=["GET"])
 @req_auth.login_required
-def invoke(token_param):
+def state():
     """
-    Token invocation route
+    Token state
     """
+    token_param = request.args.get("token", "")
     try:
-        token = Token.query.filter_by(id=token_param).first()
+        with _reads():
+            token_state = store.state(token_param)
         # check if token exists
-        if token:
-            if token.exhausted:
-                return Responses.exhausted(token.state)
-            # check if token is expired
-            if token.is_expired():
-                return Responses.expired()
-            else:
-                # check if token is has anymore use
-                # if token refresh value is 0 (exhausted)
-                if token.refresh < 1:
-                    token.exhausted = True
-                    db.session.commit()
-                    return Responses.exhausted(token.state)
-                else:
-                    # decrement from the refresh count
-                    # maybe delete if it's now 0?
-                    token.refresh = token.refresh - 1
-                    db.session.commit()
-                    return Responses.refresh()
-        else:
-            return Responses.not_exist()
-    except Exception:
+        if token_state is not None:
+            return Responses.state(token_state)
+        return Responses.not_exist()
+    except:
         return Responses.unauthorized()
 
 
-@auth_blueprint.route("/<token_param>", methods=["DELETE"])
+class StateWaitQueryModel(BaseModel):
+    """
+    Query parameters of the `/auth/state/wait` endpoint: the token, what the
+    client last saw of it, and how many seconds to wait at most
+    """
+
+    token: str
+    state: Optional[str] = None
+    exhausted: Optional[bool] = None
+    timeout: Optional[NonNegativeFloat] = None
+
+
+@auth_blueprint.route("/state/wait", methods=["GET"])
 @req_auth.login_required
-def exhaust(token_param):
+@flask_pydantic.validate()
+def wait_for_state(query: StateWaitQueryModel):
     """
-    Token exhaustion route
+    Long-poll the token state: answer once it differs from what the client
+    knows, or when the timeout runs out
     """
+    timeout = min(
+        config["STATE_WAIT_TIMEOUT"],
+        config["STATE_WAIT_TIMEOUT"] if query.timeout is None else query.timeout,
+    )
     try:
-        token = Token.query.filter_by(id=token_param).first()
-        # check if token exists
-        if token:
-            if token.exhausted:
-                return Responses.exhausted(token.state)
-            # check if token is expired
-            elif token.is_expired():
-                return Responses.expired()
-            else:
-                token.exhausted = True
-                state = request.args.get("state", "")
-                token.state = state
-                db.session.commit()
-                return Responses.exhaust()
-        else:
-            return Responses.not_exist()
-    except Exception:
+        status, changed = store.watch(
+            query.token, query.state, query.exhausted, timeout
+        )
+    except ValueError:
         return Responses.unauthorized()
+    except Exception as e:
+        print(e)
+        return Responses.error()
+    if status is None:
+        return Responses.not_exist()
+    return Responses.state_change(status, changed)
 
 
-class SurveyParticipantModel(BaseModel):
+class ExportQueryModel(BaseModel):
     """
-    Request body format for the `/survey-response` endpoint
+    Query parameters of the `/auth/export` endpoint. Times without an offset
+    are UTC.
     """
 
-    surveyId: str
-    responseId: str
-    participant: Optional[dict] = None
+    format: Literal["ndjson", "csv"] = "ndjson"
+    registered_from: Optional[datetime.datetime] = None
+    registered_to: Optional[datetime.datetime] = None
+    state: Optional[str] = None
+    exhausted: Optional[bool] = None
 
 
-@gdrive_blueprint.route("/survey-response", methods=["POST"])
+@auth_blueprint.route("/export", methods=["GET"])
+@admin_auth.login_required
 @flask_pydantic.validate()
-@req_auth.login_required
-def export(body: SurveyParticipantModel):
+def export_tokens(query: ExportQueryModel):
     """
-    GDrive microservice interface
+    Stream the tokens table, chunked, as NDJSON or CSV. Token ids are bearer
+    credentials, so only admin keys may export them.
     """
-
-    requests.post(
-        f"http://{config['GDRIVE_APP_HOST']}:{config['GDRIVE_APP_PORT']}/survey-export",
-        data=body.json(),
-        timeout=_timeout,
+    chunks = token_export.stream(
+        query.format,
+        registered_from=query.registered_from,
+        registered_to=query.registered_to,
+        state=query.state,
+        exhausted=query.exhausted,
+    )
+    return Response(
+        stream_with_context(chunks),
+        mimetype=token_export.MIMETYPES[query.format],
+        headers={"Content-Disposition": f"attachment; filename=tokens.{query.format}"},
     )
-    return "Response ID successfully posted", 200
 
 
-class RedirectModel(BaseModel):
+class ImportQueryModel(BaseModel):
     """
-    Request body format for the `/redirect` endpoint
+    Query parameters of the `/auth/import` endpoint
     """
 
-    surveyId: str
-    targetSurveyId: str
-    RulesConsentID: str  # Client dependent
-    SurveyswapID: str  # Client dependent
-    SurveyswapGroup: str  # Client dependent
-    utm_campaign: str
-    utm_medium: str
-    utm_source: str
-    email: str
-    firstName: str
-    lastName: str
+    format: Literal["ndjson", "csv"] = "ndjson"
+    on_conflict: Literal["skip", "update"] = "skip"
 
 
-@redirect_blueprint.route("/", methods=["POST"])
+@auth_blueprint.route("/import", methods=["POST"])
+@admin_auth.login_required
 @flask_pydantic.validate()
-def get_redirect(body: RedirectModel):
-    logging.info(
-        f"Redirect request ({body.targetSurveyId}, {body.email}) routing to Qualtrix"
-    )
+def import_tokens(query: ImportQueryModel):
+    """
+    Load the NDJSON or CSV token records of the request body, chunked. An
+    import can create or rewrite any token, so only admin keys may run one.
+    """
+    try:
+        report = importer.load(request.stream, query.format, query.on_conflict)
+    except ValueError as e:
+        return Responses.invalid_import(str(e))
+    except Exception as e:
+        print(e)
+        return Responses.error()
+    return Responses.imported(report)
+
 
-    resp = requests.post(
-        f"http://{config['QUALTRIX_APP_HOST']}:{config['QUALTRIX_APP_PORT']}/redirect",
-        data=body.json(),
-        timeout=_timeout,
+@auth_blueprint.route("/rate-limit", methods=["GET"])
+@req_auth.login_required
+def rate_limit_stats():
+    """
+    Rate limit counters of the calling API key
+    """
+    key_id = fingerprint(request.headers["X-API-Key"])
+    return Responses.json(
+        {"status": "ok", "key": key_id, **access.limiter.stats(key_id)}, 200
     )
 
-    logging.info(f"Qualtrix Request returned with status code {resp.status_code}")
 
-    return resp.json(), resp.status_code
+def _respond(result: store.Result):
+    """
+    Map a token store result onto its http response
+    """
+    if result.outcome is store.Outcome.EXHAUSTED:
+        return Responses.exhausted(result.state)
+    return getattr(Responses, result.outcome.value)()
+
+
+@auth_blueprint.route("/<token_param>", methods=["GET"])
+@req_auth.login_required
+def validate(token_param):
+    """
+    Token validation route
+    """
+    try:
+        with _reads():
+            return _respond(store.validate(token_param))
+    except:
+        return Responses.unauthorized()
+
+
+@auth_blueprint.route("/<token_param>/decrement", methods=["POST"])
+@req_auth.login_required
+def invoke(token_param):
+    """
+    Token invocation route
+    """
+    try:
+        return _respond(store.invoke(token_param))
+    except Exception:
+        return Responses.unauthorized()
+
+
+@auth_blueprint.route("/<token_param>", methods=["DELETE"])
+@req_auth.login_required
+def exhaust(token_param):
+    """
+    Token exhaustion route
+    """
+    try:
+        return _respond(store.exhaust(token_param, request.args.get("state", "")))
+    except Exception:
+        return Responses.unauthorized()
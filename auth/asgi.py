@@ -0,0 +1,150 @@
+# server/auth/asgi.py
+"""
+ASGI serving mode.
+
+The redirect endpoint spends nearly all of its time waiting on Qualtrix, so
+here it is served natively with an async handler and `httpx`, letting one
+process hold hundreds of in-flight upstream calls. Every other route,
+including all token endpoints and the (queue-backed) survey export, is
+passed through unchanged to the Flask application on a worker thread.
+
+    gunicorn auth.asgi:app -k uvicorn.workers.UvicornWorker
+
+Like `auth.main`, importing this module builds nothing: the Flask app and
+the Qualtrix client are created by `_load` when the first event arrives.
+"""
+
+import logging
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from pydantic import ValidationError
+
+from auth.main import create_app
+from auth.responses import dumps
+from auth.upstream import AsyncUpstream, CircuitOpenError
+
+# set by `_load`
+qualtrix = None
+_wsgi = None
+
+
+def _load():
+    """
+    Create the Flask app and the Qualtrix client, once
+    """
+    global qualtrix, _wsgi
+    if _wsgi is not None:
+        return
+    flask_app = create_app()
+    config = flask_app.config
+    if qualtrix is None:
+        qualtrix = AsyncUpstream.from_config(
+            "qualtrix",
+            config["QUALTRIX_APP_HOST"],
+            config["QUALTRIX_APP_PORT"],
+            config,
+            pool_size=config["ASYNC_UPSTREAM_POOL_SIZE"],
+        )
+    _wsgi = WsgiToAsgi(flask_app)
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status: int, body, headers=()):
+    payload = dumps(body)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+                *headers,
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def get_redirect(scope, receive, send):
+    """
+    Async counterpart of `auth.proxy.get_redirect`
+    """
+    from auth.proxy import CORS_ORIGINS, RedirectModel
+
+    headers = dict(scope["headers"])
+    cors = []
+    origin = headers.get(b"origin", b"").decode()
+    if origin in CORS_ORIGINS:
+        cors = [(b"access-control-allow-origin", origin.encode()), (b"vary", b"Origin")]
+
+    try:
+        body = RedirectModel.model_validate_json(await _read_body(receive))
+    except ValidationError as ve:
+        errors = ve.errors(
+            include_url=False, include_context=False, include_input=False
+        )
+        return await _send_json(
+            send, 400, {"validation_error": {"body_params": errors}}, cors
+        )
+
+    logging.info(
+        f"Redirect request ({body.targetSurveyId}, {body.email}) routing to Qualtrix"
+    )
+
+    try:
+        resp = await qualtrix.post("/redirect", content=body.model_dump_json())
+    except CircuitOpenError:
+        return await _send_json(
+            send,
+            503,
+            {"status": "fail", "message": f"{qualtrix.name} unavailable"},
+            cors,
+        )
+    except Exception:
+        return await _send_json(
+            send,
+            502,
+            {"status": "fail", "message": f"{qualtrix.name} request failed"},
+            cors,
+        )
+
+    logging.info(f"Qualtrix Request returned with status code {resp.status_code}")
+
+    await _send_json(send, resp.status_code, resp.json(), cors)
+
+
+# routes served natively, everything else goes to Flask
+ROUTES = {("POST", "/redirect/"): get_redirect}
+
+
+async def app(scope, receive, send):
+    _load()
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await qualtrix.client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    handler = None
+    if scope["type"] == "http":
+        handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is not None:
+        return await handler(scope, receive, send)
+
+    # give each Flask request its own thread instead of asgiref's single
+    # shared one, so slow token requests don't queue behind each other
+    async with ThreadSensitiveContext():
+        await _wsgi(scope, receive, send)
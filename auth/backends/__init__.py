@@ -0,0 +1,132 @@
+# server/auth/backends/__init__.py
+"""
+Token storage backends.
+
+`auth.store` handles caching, signed tokens and the public token API, and
+leaves the rows themselves to a backend chosen by `TOKEN_BACKEND`:
+
+    sql     the tokens table through SQLAlchemy (default)
+    redis   one hash per token in Redis, for high volumes of short-lived tokens
+    memory  a dict in the process, for single-node deployments and benchmarks
+
+Backends only see canonical token ids and report per-token `Result`s; ids
+they don't know are left out and become `NOT_EXIST` in the store.
+"""
+
+import datetime
+import enum
+import importlib
+import uuid
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class Outcome(enum.Enum):
+    """
+    Result of a token lifecycle step, named after the matching `Responses` method
+    """
+
+    EXIST = "exist"
+    REFRESH = "refresh"
+    EXHAUST = "exhaust"
+    EXHAUSTED = "exhausted"
+    EXPIRED = "expired"
+    NOT_EXIST = "not_exist"
+
+
+class Result(NamedTuple):
+    outcome: Outcome
+    state: Optional[str] = None
+
+
+def check(
+    exhausted: bool, expires_on: datetime.datetime, state: str, now
+) -> Optional[Result]:
+    """
+    Result for a token that can no longer be used, or None if it is usable
+    """
+    if exhausted:
+        return Result(Outcome.EXHAUSTED, state)
+    if expires_on < now:
+        return Result(Outcome.EXPIRED)
+    return None
+
+
+class TokenBackend:
+    """
+    Storage for token rows. `invoke` and `exhaust` must be atomic per token:
+    concurrent calls can never both consume the last use.
+    """
+
+    name = None
+
+    def insert(self, rows: List[dict]):
+        """
+        Store new tokens, each a dict of `id`, `registered_on`, `expires_on`
+        and `refresh`
+        """
+        raise NotImplementedError
+
+    def insert_once(
+        self, key: str, rows: List[dict], token: str, expires_on: datetime.datetime
+    ) -> Optional[str]:
+        """
+        Store `rows` and remember `token` as issued for `key` until
+        `expires_on`. If `key` is already remembered, store nothing and
+        return the token issued for it.
+        """
+        raise NotImplementedError
+
+    def validate(self, token_ids: List[uuid.UUID]) -> Dict[uuid.UUID, Result]:
+        raise NotImplementedError
+
+    def invoke(self, token_ids: List[uuid.UUID]) -> Dict[uuid.UUID, Result]:
+        """
+        Use each usable token once, exhausting those with no uses left
+        """
+        raise NotImplementedError
+
+    def exhaust(
+        self, token_ids: List[uuid.UUID], token_state: str
+    ) -> Dict[uuid.UUID, Result]:
+        raise NotImplementedError
+
+    def state(self, token_id: uuid.UUID) -> Optional[str]:
+        raise NotImplementedError
+
+    def status(self, token_id: uuid.UUID) -> Optional[Tuple[str, bool]]:
+        """
+        The token's state and whether it is exhausted, or None if it does
+        not exist
+        """
+        raise NotImplementedError
+
+    def ping(self) -> bool:
+        """
+        Whether the backend is reachable
+        """
+        return True
+
+    def clear(self):
+        """
+        Remove every token and idempotency key
+        """
+        raise NotImplementedError
+
+
+BACKENDS = {
+    "sql": "auth.backends.sql:SQLBackend",
+    "redis": "auth.backends.redis:RedisBackend",
+    "memory": "auth.backends.memory:MemoryBackend",
+}
+
+
+def from_config(config) -> TokenBackend:
+    """
+    Backend named by `TOKEN_BACKEND`, imported on demand so the optional
+    dependencies of the others aren't needed
+    """
+    name = config.get("TOKEN_BACKEND") or "sql"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown token backend {name!r}")
+    module, _, cls = BACKENDS[name].partition(":")
+    return getattr(importlib.import_module(module), cls).from_config(config)
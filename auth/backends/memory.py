@@ -0,0 +1,134 @@
+# server/auth/backends/memory.py
+"""
+In-process backend.
+
+Tokens live in a dict guarded by one lock, so they are only shared by the
+threads of a single process: use it for single-node deployments running one
+worker, and for benchmarks that should leave the database out.
+"""
+
+import datetime
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from auth.backends import Outcome, Result, TokenBackend, check
+
+
+class _Row:
+    __slots__ = ("expires_on", "refresh", "state", "exhausted", "exhausted_on")
+
+    def __init__(self, expires_on: datetime.datetime, refresh: int):
+        self.expires_on = expires_on
+        self.refresh = refresh
+        self.state = "init"
+        self.exhausted = False
+        self.exhausted_on = None
+
+
+class MemoryBackend(TokenBackend):
+    """
+    Tokens in a dict. Tokens expired or exhausted for longer than
+    `grace_seconds` are swept out as the dict grows.
+    """
+
+    name = "memory"
+
+    def __init__(self, grace_seconds: int = 0):
+        self.grace = datetime.timedelta(seconds=grace_seconds)
+        self._rows = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._sweep_at = 1024
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("RETENTION_GRACE_SECONDS", 0))
+
+    def _sweep(self, now: datetime.datetime):
+        cutoff = now - self.grace
+        for token_id in [
+            token_id
+            for token_id, row in self._rows.items()
+            if row.expires_on < cutoff or (row.exhausted and row.exhausted_on < cutoff)
+        ]:
+            del self._rows[token_id]
+        for key in [key for key, (_, expires) in self._keys.items() if expires < now]:
+            del self._keys[key]
+        # sweep again once the dict has doubled, keeping inserts amortized O(1)
+        self._sweep_at = max(1024, 2 * len(self._rows))
+
+    def _insert(self, rows: List[dict]):
+        for row in rows:
+            self._rows[row["id"]] = _Row(row["expires_on"], row["refresh"])
+        if len(self._rows) > self._sweep_at:
+            self._sweep(datetime.datetime.now(datetime.timezone.utc))
+
+    def insert(self, rows: List[dict]):
+        with self._lock:
+            self._insert(rows)
+
+    def insert_once(
+        self, key: str, rows: List[dict], token: str, expires_on: datetime.datetime
+    ) -> Optional[str]:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            issued = self._keys.get(key)
+            if issued is not None and issued[1] >= now:
+                return issued[0]
+            self._keys[key] = (token, expires_on)
+            self._insert(rows)
+        return None
+
+    def _apply(self, token_ids: List[uuid.UUID], step) -> Dict[uuid.UUID, Result]:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        results = {}
+        with self._lock:
+            for token_id in token_ids:
+                row = self._rows.get(token_id)
+                if row is not None and token_id not in results:
+                    results[token_id] = check(
+                        row.exhausted, row.expires_on, row.state, now
+                    ) or step(row, now)
+        return results
+
+    def validate(self, token_ids: List[uuid.UUID]) -> Dict[uuid.UUID, Result]:
+        return self._apply(token_ids, lambda row, now: Result(Outcome.EXIST))
+
+    def invoke(self, token_ids: List[uuid.UUID]) -> Dict[uuid.UUID, Result]:
+        def step(row, now):
+            if row.refresh < 1:
+                row.exhausted = True
+                row.exhausted_on = now
+                return Result(Outcome.EXHAUSTED, row.state)
+            row.refresh -= 1
+            return Result(Outcome.REFRESH, row.state)
+
+        return self._apply(token_ids, step)
+
+    def exhaust(
+        self, token_ids: List[uuid.UUID], token_state: str
+    ) -> Dict[uuid.UUID, Result]:
+        def step(row, now):
+            row.exhausted = True
+            row.exhausted_on = now
+            row.state = token_state
+            return Result(Outcome.EXHAUST, token_state)
+
+        return self._apply(token_ids, step)
+
+    def state(self, token_id: uuid.UUID) -> Optional[str]:
+        with self._lock:
+            row = self._rows.get(token_id)
+            return None if row is None else row.state
+
+    def status(self, token_id: uuid.UUID) -> Optional[Tuple[str, bool]]:
+        with self._lock:
+            row = self._rows.get(token_id)
+            return None if row is None else (row.state, row.exhausted)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._keys.clear()
+            self._sweep_at = 1024
@@ -0,0 +1,189 @@
+# server/auth/backends/redis.py
+"""
+Redis backend.
+
+Each token is a hash under `token-service:token:<id>` that expires with the
+token (plus the retention grace period), so Redis does the cleanup. Every
+lifecycle step runs as a Lua script, which makes the checks and the update
+atomic per token. A batch is sent as one pipeline of per-token scripts, so
+tokens can be spread over a cluster's slots. Idempotent registration claims
+its key and stores the token in one script, so on a cluster those keys
+must share a slot.
+"""
+
+import datetime
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from auth.backends import Outcome, Result, TokenBackend
+
+# ARGV: operation, now, state (exhaust), grace seconds
+_STEP_SCRIPT = """
+local token = redis.call('HMGET', KEYS[1], 'expires_on', 'refresh', 'state', 'exhausted')
+if not token[1] then
+    return {'not_exist'}
+end
+if token[4] == '1' then
+    return {'exhausted', token[3]}
+end
+if tonumber(token[1]) < tonumber(ARGV[2]) then
+    return {'expired'}
+end
+local operation = ARGV[1]
+if operation == 'validate' then
+    return {'exist'}
+end
+if operation == 'invoke' and tonumber(token[2]) > 0 then
+    redis.call('HINCRBY', KEYS[1], 'refresh', -1)
+    return {'refresh', token[3]}
+end
+local state = token[3]
+if operation == 'exhaust' then
+    state = ARGV[3]
+end
+redis.call('HSET', KEYS[1], 'exhausted', '1', 'exhausted_on', ARGV[2], 'state', state)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+if operation == 'exhaust' then
+    return {'exhaust', state}
+end
+return {'exhausted', state}
+"""
+
+# KEYS: idempotency key, then the new tokens' keys
+# ARGV: token issued for the key, when the key expires, then per token its
+# registered_on, expires_on, refresh and when its hash expires
+_INSERT_ONCE_SCRIPT = """
+local issued = redis.call('GET', KEYS[1])
+if issued then
+    return issued
+end
+-- scripts aren't rolled back, so the key is only claimed once all is stored
+for i = 2, #KEYS do
+    local arg = 3 + (i - 2) * 4
+    redis.call(
+        'HSET', KEYS[i], 'registered_on', ARGV[arg], 'expires_on', ARGV[arg + 1],
+        'refresh', ARGV[arg + 2], 'state', 'init', 'exhausted', '0'
+    )
+    redis.call('EXPIREAT', KEYS[i], ARGV[arg + 3])
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EXAT', ARGV[2])
+return false
+"""
+
+
+def _key(token_id: uuid.UUID) -> str:
+    return f"token-service:token:{token_id}"
+
+
+def _idempotency_key(key: str) -> str:
+    return f"token-service:idempotency:{key}"
+
+
+class RedisBackend(TokenBackend):
+    """
+    Tokens as Redis hashes, kept until `grace_seconds` after they expire or
+    are exhausted
+    """
+
+    name = "redis"
+
+    def __init__(self, client, grace_seconds: int = 0):
+        self.client = client
+        self.grace_seconds = max(1, grace_seconds)
+        self._step = client.register_script(_STEP_SCRIPT)
+        self._insert_once = client.register_script(_INSERT_ONCE_SCRIPT)
+
+    @classmethod
+    def from_config(cls, config):
+        # optional dependency, only needed for this backend
+        import redis
+
+        return cls(
+            redis.Redis.from_url(config["TOKEN_REDIS_URL"]),
+            config.get("RETENTION_GRACE_SECONDS", 0),
+        )
+
+    def _expire_at(self, row: dict) -> int:
+        return int(row["expires_on"].timestamp()) + self.grace_seconds + 1
+
+    def insert(self, rows: List[dict]):
+        pipe = self.client.pipeline(transaction=False)
+        for row in rows:
+            pipe.hset(
+                _key(row["id"]),
+                mapping={
+                    "registered_on": row["registered_on"].timestamp(),
+                    "expires_on": row["expires_on"].timestamp(),
+                    "refresh": row["refresh"],
+                    "state": "init",
+                    "exhausted": 0,
+                },
+            )
+            pipe.expireat(_key(row["id"]), self._expire_at(row))
+        pipe.execute()
+
+    def insert_once(
+        self, key: str, rows: List[dict], token: str, expires_on: datetime.datetime
+    ) -> Optional[str]:
+        # the key is claimed and the tokens stored by one script, so neither
+        # can happen without the other; Redis expires the key with the window
+        args = [token, int(expires_on.timestamp()) + 1]
+        for row in rows:
+            args += [
+                row["registered_on"].timestamp(),
+                row["expires_on"].timestamp(),
+                row["refresh"],
+                self._expire_at(row),
+            ]
+        issued = self._insert_once(
+            keys=[_idempotency_key(key), *[_key(row["id"]) for row in rows]],
+            args=args,
+        )
+        return None if issued is None else issued.decode()
+
+    def _run(
+        self, operation: str, token_ids: List[uuid.UUID], token_state: str = ""
+    ) -> Dict[uuid.UUID, Result]:
+        token_ids = list(dict.fromkeys(token_ids))
+        now = datetime.datetime.now().timestamp()
+        pipe = self.client.pipeline(transaction=False)
+        for token_id in token_ids:
+            self._step(
+                keys=[_key(token_id)],
+                args=[operation, now, token_state, self.grace_seconds],
+                client=pipe,
+            )
+
+        results = {}
+        for token_id, reply in zip(token_ids, pipe.execute()):
+            outcome, *state = [value.decode() for value in reply]
+            if outcome != Outcome.NOT_EXIST.value:
+                results[token_id] = Result(Outcome(outcome), *state)
+        return results
+
+    def validate(self, token_ids: List[uuid.UUID]) -> Dict[uuid.UUID, Result]:
+        return self._run("validate", token_ids)
+
+    def invoke(self, token_ids: List[uuid.UUID]) -> Dict[uuid.UUID, Result]:
+        return self._run("invoke", token_ids)
+
+    def exhaust(
+        self, token_ids: List[uuid.UUID], token_state: str
+    ) -> Dict[uuid.UUID, Result]:
+        return self._run("exhaust", token_ids, token_state)
+
+    def state(self, token_id: uuid.UUID) -> Optional[str]:
+        value = self.client.hget(_key(token_id), "state")
+        return None if value is None else value.decode()
+
+    def status(self, token_id: uuid.UUID) -> Optional[Tuple[str, bool]]:
+        state, exhausted = self.client.hmget(_key(token_id), "state", "exhausted")
+        return None if state is None else (state.decode(), exhausted == b"1")
+
+    def ping(self) -> bool:
+        return bool(self.client.ping())
+
+    def clear(self):
+        for pattern in (_key("*"), _idempotency_key("*")):
+            for key in self.client.scan_iter(match=pattern):
+                self.client.delete(key)
@@ -0,0 +1,226 @@
+# server/auth/backends/sql.py
+"""
+Tokens table backend.
+
+Each lifecycle step (validate, invoke, exhaust) is resolved with a single
+statement, for one token or a whole batch. On Postgres writes are a
+conditional `UPDATE ... RETURNING` wrapped in a CTE, so the row lock, the
+existence, expiry and exhaustion checks and the decrement all happen in one
+round trip and concurrent invocations can never both consume the last use.
+Other databases run the `UPDATE ... RETURNING` on its own and then read the
+rows it skipped, within the same transaction.
+"""
+
+import datetime
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, delete, insert, literal, select, text, update
+
+from auth.backends import Outcome, Result, TokenBackend, check
+from auth.main import db
+from auth.models import IdempotencyKey, Token
+from auth.portable import UTCDateTime, any_of, is_postgres, upsert, utcnow
+from auth.replica import Replica
+
+
+def _matching(token_ids: List[uuid.UUID]):
+    return any_of(Token.id, token_ids)
+
+
+def _usable(match, now: datetime.datetime):
+    return (match, Token.exhausted.is_(False), Token.expires_on >= now)
+
+
+def _check(row, now: datetime.datetime) -> Optional[Result]:
+    return check(row.exhausted, row.expires_on, row.state, now)
+
+
+def _success(exhausted: bool, state: str, success: Outcome) -> Result:
+    # the invoke that consumed the last use reports the token exhausted
+    if exhausted and success is Outcome.REFRESH:
+        return Result(Outcome.EXHAUSTED, state)
+    return Result(success, state)
+
+
+def _miss(row, now: datetime.datetime) -> Result:
+    # if the token still looks usable, a concurrent call exhausted it while we
+    # waited for the row lock
+    return _check(row, now) or Result(Outcome.EXHAUSTED, row.state)
+
+
+def _resolve(
+    token_ids: List[uuid.UUID], updating, success: Outcome
+) -> Dict[uuid.UUID, Result]:
+    """
+    Run `updating` (an `UPDATE ... RETURNING`) and explain the rows it
+    skipped. On Postgres the update is a CTE joined to the rows as they were
+    before the statement, so a miss is explained without a second query.
+    """
+    if not is_postgres():
+        return _resolve_portable(token_ids, updating, success)
+
+    updated = updating.cte("updated")
+    rows = db.session.execute(
+        select(
+            Token.id,
+            Token.exhausted,
+            Token.expires_on,
+            Token.state,
+            updated.c.id.label("updated_id"),
+            updated.c.exhausted.label("updated_exhausted"),
+            updated.c.state.label("updated_state"),
+        )
+        .outerjoin(updated, updated.c.id == Token.id)
+        .where(_matching(token_ids))
+    ).all()
+    db.session.commit()
+
+    now = utcnow()
+    results = {}
+    for row in rows:
+        if row.updated_id is None:
+            results[row.id] = _miss(row, now)
+        else:
+            results[row.id] = _success(
+                row.updated_exhausted, row.updated_state, success
+            )
+    return results
+
+
+def _resolve_portable(
+    token_ids: List[uuid.UUID], updating, success: Outcome
+) -> Dict[uuid.UUID, Result]:
+    # the update takes the write lock first, so the rows read afterwards
+    # can't change before the commit
+    results = {
+        row.id: _success(row.exhausted, row.state, success)
+        for row in db.session.execute(updating)
+    }
+    missed = [token_id for token_id in token_ids if token_id not in results]
+    if missed:
+        now = utcnow()
+        for row in db.session.execute(
+            select(Token.id, Token.exhausted, Token.expires_on, Token.state).where(
+                _matching(missed)
+            )
+        ):
+            results[row.id] = _miss(row, now)
+    db.session.commit()
+    return results
+
+
+class SQLBackend(TokenBackend):
+    """
+    Tokens in the `tokens` table of the application database
+    """
+
+    name = "sql"
+
+    def __init__(self, replica: Replica = None):
+        self.replica = replica
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(Replica.from_config(config))
+
+    def _read(self, statement, complete: Callable[[list], bool] = None):
+        if self.replica is None:
+            return db.session.execute(statement).all()
+        return self.replica.execute(statement, complete)
+
+    def insert(self, rows: List[dict]):
+        db.session.execute(insert(Token), rows)
+        db.session.commit()
+
+    def insert_once(
+        self, key: str, rows: List[dict], token: str, expires_on: datetime.datetime
+    ) -> Optional[str]:
+        # claims the key, or takes over an expired one, in the same transaction
+        # as the token insert; a concurrent claim waits on the key's row
+        statement = upsert(IdempotencyKey).values(
+            key=key, token=token, expires_on=expires_on
+        )
+        claimed = db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[IdempotencyKey.key],
+                set_={
+                    "token": statement.excluded.token,
+                    "expires_on": statement.excluded.expires_on,
+                },
+                where=IdempotencyKey.expires_on < utcnow(),
+            ).returning(IdempotencyKey.token)
+        ).scalar()
+        if claimed is not None:
+            db.session.execute(insert(Token), rows)
+            db.session.commit()
+            return None
+
+        issued = db.session.execute(
+            select(IdempotencyKey.token).where(IdempotencyKey.key == key)
+        ).scalar()
+        db.session.rollback()
+        if issued is None:
+            # purged in between, claim it again
+            return self.insert_once(key, rows, token, expires_on)
+        return issued
+
+    def validate(self, token_ids: List[uuid.UUID]) -> Dict[uuid.UUID, Result]:
+        # tokens the replica hasn't seen yet are looked up on the primary
+        rows = self._read(
+            select(Token.id, Token.exhausted, Token.expires_on, Token.state).where(
+                _matching(token_ids)
+            ),
+            lambda rows: len(rows) == len(set(token_ids)),
+        )
+        now = utcnow()
+        return {row.id: _check(row, now) or Result(Outcome.EXIST) for row in rows}
+
+    def invoke(self, token_ids: List[uuid.UUID]) -> Dict[uuid.UUID, Result]:
+        now = utcnow()
+        updating = (
+            update(Token)
+            .where(*_usable(_matching(token_ids), now))
+            .values(
+                refresh=case(
+                    (Token.refresh > 0, Token.refresh - 1), else_=Token.refresh
+                ),
+                exhausted=Token.refresh < 1,
+                exhausted_on=case((Token.refresh < 1, literal(now, UTCDateTime))),
+            )
+            .returning(Token.id, Token.exhausted, Token.state)
+        )
+        return _resolve(token_ids, updating, Outcome.REFRESH)
+
+    def exhaust(
+        self, token_ids: List[uuid.UUID], token_state: str
+    ) -> Dict[uuid.UUID, Result]:
+        now = utcnow()
+        updating = (
+            update(Token)
+            .where(*_usable(_matching(token_ids), now))
+            .values(exhausted=True, exhausted_on=now, state=token_state)
+            .returning(Token.id, Token.exhausted, Token.state)
+        )
+        return _resolve(token_ids, updating, Outcome.EXHAUST)
+
+    def state(self, token_id: uuid.UUID) -> Optional[str]:
+        rows = self._read(select(Token.state).where(Token.id == token_id), bool)
+        return rows[0].state if rows else None
+
+    def status(self, token_id: uuid.UUID) -> Optional[Tuple[str, bool]]:
+        rows = self._read(
+            select(Token.state, Token.exhausted).where(Token.id == token_id), bool
+        )
+        # long polls read this repeatedly, don't hold a connection in between
+        db.session.rollback()
+        return (rows[0].state, rows[0].exhausted) if rows else None
+
+    def ping(self) -> bool:
+        db.session.execute(text("SELECT 1"))
+        return True
+
+    def clear(self):
+        db.session.execute(delete(IdempotencyKey))
+        db.session.execute(delete(Token))
+        db.session.commit()
@@ -0,0 +1,122 @@
+# server/auth/bulkhead.py
+"""
+Bulkheads between the token routes and the upstream proxy routes.
+
+All routes share a worker's threads. When Qualtrix slows down, redirect
+calls hold their threads for up to `REQUEST_TIMEOUT` seconds, and enough of
+them stall every other route. So the proxy blueprints pass through a
+`Bulkhead`, a bounded number of concurrent requests per process:
+
+- `upstream`, shared by all proxy routes, admits at most the worker's
+  threads (`WORKER_THREADS`, set by `gunicorn.conf.py`) minus
+  `BULKHEAD_RESERVED`, and at least one. The rest are kept for the token
+  routes whatever the upstreams are doing; a single-threaded worker has
+  nothing to keep.
+- Each proxy blueprint can get a tighter limit of its own in
+  `BULKHEAD_LIMITS`, a JSON object like `{"redirect": 2}`.
+- Long polls of `/auth/state/wait` hold their threads too, and are served
+  from the token routes' share. `max_waiters` caps them below it so that
+  one reserved thread is always left for the other token routes.
+
+A request waits at most `BULKHEAD_QUEUE_TIMEOUT` seconds for a slot and is
+then shed with a fast `503` and `Retry-After`. Queue time, rejections and
+requests in flight are exported as metrics.
+"""
+
+import json
+import threading
+import time
+
+from flask import g
+
+from auth import metrics
+from auth.responses import Responses
+
+
+class Bulkhead:
+    """
+    At most `limit` concurrent holders; `acquire` waits up to
+    `queue_timeout` seconds for a slot
+    """
+
+    def __init__(self, name: str, limit: int, queue_timeout: float = 0):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        start = time.perf_counter()
+        admitted = self._slots.acquire(timeout=self.queue_timeout)
+        metrics.BULKHEAD_QUEUE_SECONDS.labels(
+            self.name, "admitted" if admitted else "rejected"
+        ).observe(time.perf_counter() - start)
+        if not admitted:
+            metrics.BULKHEAD_REJECTED.labels(self.name).inc()
+            return False
+        with self._lock:
+            self.active += 1
+        metrics.BULKHEAD_ACTIVE.labels(self.name).inc()
+        return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        metrics.BULKHEAD_ACTIVE.labels(self.name).dec()
+        self._slots.release()
+
+
+def _shared(config) -> int:
+    """
+    The threads the proxy routes may hold together
+    """
+    return max(1, config["WORKER_THREADS"] - config["BULKHEAD_RESERVED"])
+
+
+def max_waiters(config) -> int:
+    """
+    How many long polls may wait at once per process: `STATE_WAIT_MAX_WAITERS`,
+    less if that would take the last of the token routes' threads
+    """
+    reserved = config["WORKER_THREADS"] - _shared(config)
+    return max(0, min(config["STATE_WAIT_MAX_WAITERS"], reserved - 1))
+
+
+def from_config(config) -> dict:
+    """
+    The shared `upstream` bulkhead and the per-blueprint ones configured in
+    `BULKHEAD_LIMITS`, by name
+    """
+    if config["WORKER_THREADS"] > 1 and config["BULKHEAD_RESERVED"] < 1:
+        raise ValueError("BULKHEAD_RESERVED must keep a thread for the token routes")
+    queue_timeout = config["BULKHEAD_QUEUE_TIMEOUT"]
+    shared = _shared(config)
+    bulkheads = {"upstream": Bulkhead("upstream", shared, queue_timeout)}
+    for name, limit in json.loads(config["BULKHEAD_LIMITS"]).items():
+        bulkheads[name] = Bulkhead(name, int(limit), queue_timeout)
+    return bulkheads
+
+
+def guard(blueprint, *bulkheads: Bulkhead):
+    """
+    Admit the requests of `blueprint` only while every one of `bulkheads`
+    has a free slot, shedding the rest with a `503`
+    """
+
+    def enter():
+        held = g.setdefault("bulkheads", [])
+        for bulkhead in bulkheads:
+            if not bulkhead.acquire():
+                return Responses.overloaded(bulkhead.name, 1)
+            held.append(bulkhead)
+        return None
+
+    def leave(exc):
+        # also reached when a bulkhead was full or an earlier hook answered
+        for bulkhead in reversed(g.pop("bulkheads", [])):
+            bulkhead.release()
+
+    blueprint.before_request(enter)
+    blueprint.teardown_request(leave)
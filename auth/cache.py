@@ -0,0 +1,142 @@
+# server/auth/cache.py
+"""
+Cache of terminal token results.
+
+A token that is expired or exhausted can never become valid again, so once
+the store has seen one of those outcomes it is remembered here and repeat
+calls for the token skip the database. Only terminal outcomes are stored
+for the full TTL, which is what makes the cache safe without invalidation.
+The exception is a bulk import, which can create or overwrite rows and so
+discards the entries of the ids it writes. A missing token can still turn
+up (an import, or a row not yet replicated), so the store remembers those
+only briefly by passing a shorter `ttl` to `put`.
+
+Hits, by whether the local or the shared cache answered, and misses are
+counted in `token_cache_hits_total` and `token_cache_misses_total`.
+"""
+
+import collections
+import logging
+import threading
+import time
+from typing import Optional
+
+from auth import metrics
+
+
+class TerminalCache:
+    """
+    Bounded in-process LRU cache with a per-entry TTL, optionally backed by a
+    shared Redis so results learned by one instance are seen by all of them.
+    """
+
+    def __init__(self, size: int, ttl: int, redis_url: Optional[str] = None):
+        self.size = size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url and size > 0:
+            # optional dependency, only needed for the shared backend
+            import redis
+
+            self._redis = redis.Redis.from_url(redis_url)
+
+    @classmethod
+    def from_config(cls, config):
+        if not config.get("TOKEN_CACHE_ENABLED", True):
+            return cls(0, 0)
+        return cls(
+            config.get("TOKEN_CACHE_SIZE", 10000),
+            config.get("TOKEN_CACHE_TTL", 3600),
+            config.get("TOKEN_CACHE_REDIS_URL"),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def _redis_key(self, key: str) -> str:
+        return f"token-service:terminal:{key}"
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    metrics.TOKEN_CACHE_HITS.labels("local").inc()
+                    return value
+                del self._entries[key]
+
+        value = None
+        if self._redis is not None:
+            try:
+                # kept locally no longer than Redis keeps it
+                value, ttl = (
+                    self._redis.pipeline()
+                    .get(self._redis_key(key))
+                    .ttl(self._redis_key(key))
+                    .execute()
+                )
+            except Exception as err:
+                logging.warning("Token cache backend unavailable: %s", err)
+            if value is not None:
+                value = value.decode()
+                self._put_local(key, value, min(self.ttl, max(ttl, 0)))
+
+        if value is None:
+            metrics.TOKEN_CACHE_MISSES.inc()
+        else:
+            metrics.TOKEN_CACHE_HITS.labels("shared").inc()
+        return value
+
+    def _put_local(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def put(self, key: str, value: str, ttl: Optional[int] = None):
+        """
+        Remember `value` for `ttl` seconds, by default the cache's TTL
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if not self.enabled or ttl <= 0:
+            return
+
+        self._put_local(key, value, ttl)
+        if self._redis is not None:
+            try:
+                self._redis.set(self._redis_key(key), value, ex=ttl)
+            except Exception as err:
+                logging.warning("Token cache backend unavailable: %s", err)
+
+    def discard(self, keys):
+        """
+        Forget `keys`, for when their tokens are replaced (see `auth.importer`).
+        Other processes keep their local entries until they expire.
+        """
+        if not self.enabled or not keys:
+            return
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if self._redis is not None:
+            try:
+                self._redis.delete(*[self._redis_key(key) for key in keys])
+            except Exception as err:
+                logging.warning("Token cache backend unavailable: %s", err)
+
+    def clear(self):
+        """
+        Drop the local entries
+        """
+        with self._lock:
+            self._entries.clear()
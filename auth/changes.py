@@ -0,0 +1,193 @@
+# server/auth/changes.py
+"""
+Token change notifications for long-polling clients.
+
+On Postgres a trigger on `tokens` (see `auth.models`) sends a `NOTIFY` on
+the `token_changes` channel whenever a token's `state` or `exhausted`
+changes, i.e. when it is exhausted or invoked for the last time. The
+notification goes out when the transaction commits. Each worker process
+runs one `Listener` thread on a dedicated connection outside the pool,
+started when the first request waits. The listener wakes the requests
+waiting on the token that changed.
+
+Changes made by this process are also published locally, which is all
+there is on other databases and token backends. Waiting requests re-read
+the token every `STATE_WAIT_RECHECK` seconds anyway, so a notification
+that is missed (another process on SQLite or Redis, or a dropped listener
+connection) only delays the answer.
+
+The listener also serves the `token_cache` channel: a bulk import (see
+`auth.importer`) can rewrite tokens whose terminal results other processes
+have cached, so once it is done it asks every listening process to drop
+its local token cache with `flush_caches`. Workers serving the token routes
+start their listener with the background workers for this reason.
+"""
+
+import contextlib
+import logging
+import select
+import threading
+import uuid
+from typing import Callable, Iterable
+
+from sqlalchemy import text
+
+from auth.main import db
+from auth.portable import is_postgres
+
+CHANNEL = "token_changes"
+CACHE_CHANNEL = "token_cache"
+
+# seconds without a notification before the listener checks its connection
+_POLL_INTERVAL = 5
+
+
+class Hub:
+    """
+    The threads waiting on each token, by token id, and the caches to drop
+    when tokens were rewritten
+    """
+
+    def __init__(self):
+        self.listener = None
+        self._waiters = {}
+        self._flushes = []
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        with self._lock:
+            return sum(len(events) for events in self._waiters.values())
+
+    @contextlib.contextmanager
+    def waiter(self, token_id: uuid.UUID):
+        """
+        An event set whenever the token may have changed, registered for
+        the duration of the block
+        """
+        key = str(token_id)
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(key, set()).add(event)
+        try:
+            yield event
+        finally:
+            with self._lock:
+                events = self._waiters.get(key)
+                events.discard(event)
+                if not events:
+                    del self._waiters[key]
+
+    def notify(self, token_id: str):
+        with self._lock:
+            events = list(self._waiters.get(token_id, ()))
+        for event in events:
+            event.set()
+
+    def notify_all(self):
+        with self._lock:
+            events = [event for events in self._waiters.values() for event in events]
+        for event in events:
+            event.set()
+
+    def on_flush(self, flush: Callable[[], None]):
+        """
+        Call `flush` whenever cached token results may be stale
+        """
+        self._flushes.append(flush)
+
+    def flush(self):
+        for flush in self._flushes:
+            flush()
+
+    def publish(self, token_ids: Iterable[uuid.UUID]):
+        """
+        Wake the local waiters of tokens this process just changed
+        """
+        if self._waiters:
+            for token_id in token_ids:
+                self.notify(str(token_id))
+
+    def listen(self, app):
+        """
+        Start this process's listener, on Postgres and unless it is running
+        """
+        if self.listener is not None or not is_postgres():
+            return
+        with self._lock:
+            if self.listener is None:
+                self.listener = Listener(app, self)
+                self.listener.start()
+
+
+class Listener(threading.Thread):
+    """
+    `LISTEN`s for token changes and wakes their waiters. Reconnects after
+    `reconnect` seconds when the connection fails, waking every waiter so
+    that none sleeps through a missed notification.
+    """
+
+    def __init__(self, app, hub: Hub, reconnect: float = 1.0):
+        super().__init__(name="token-changes", daemon=True)
+        self.app = app
+        self.hub = hub
+        self.reconnect = reconnect
+        self._stopped = threading.Event()
+
+    def _connect(self):
+        with self.app.app_context():
+            engine = db.engine
+        # a connection of its own, the pool is sized for requests
+        args, kwargs = engine.dialect.create_connect_args(engine.url)
+        connection = engine.dialect.connect(*args, **kwargs)
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}; LISTEN {CACHE_CHANNEL}")
+        return connection
+
+    def _listen(self, connection):
+        while not self._stopped.is_set():
+            if select.select([connection], [], [], _POLL_INTERVAL) == ([], [], []):
+                continue
+            connection.poll()
+            while connection.notifies:
+                notification = connection.notifies.pop(0)
+                if notification.channel == CACHE_CHANNEL:
+                    self.hub.flush()
+                else:
+                    self.hub.notify(notification.payload)
+
+    def run(self):
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                # anything sent before LISTEN took effect was missed
+                self.hub.notify_all()
+                self.hub.flush()
+                self._listen(connection)
+            except Exception as err:
+                logging.warning("Token change listener failed: %s", err)
+                self.hub.notify_all()
+                self._stopped.wait(self.reconnect)
+            finally:
+                if connection is not None:
+                    with contextlib.suppress(Exception):
+                        connection.close()
+
+    def stop(self):
+        self._stopped.set()
+
+
+def flush_caches(connection):
+    """
+    Ask every listening process to drop its cached token results, on
+    Postgres; sent when `connection` commits
+    """
+    if is_postgres():
+        connection.execute(
+            text("SELECT pg_notify(:channel, '')"), {"channel": CACHE_CHANNEL}
+        )
+
+
+hub = Hub()
@@ -3,15 +3,11 @@
 import os
 import json
 import logging
+import tempfile
 
-basedir = os.path.abspath(os.path.dirname(__file__))
-
+from auth.env import getenvbool, getenvfloat, getenvint
 
-def getenvint(name: str, default: int):
-    try:
-        return int(os.getenv(name, ""))
-    except ValueError:
-        return default
+basedir = os.path.abspath(os.path.dirname(__file__))
 
 
 class BaseConfig:
@@ -24,10 +20,53 @@ class BaseConfig:
 class ProdConfig(BaseConfig):
     """Development configuration for cloud foundry deployments."""
 
+    # routes this deployment serves: "all", "auth", "proxy" or a comma-separated
+    # list of "auth", "export" and "redirect" (see auth.main)
+    APP_BLUEPRINTS = os.getenv("APP_BLUEPRINTS", "all")
+
     DEFAULT_SECONDS = 604800  # 7 days
     DEFAULT_USES = 1
-
-    SECRET_KEYS = None
+    MAX_BATCH_SIZE = getenvint("MAX_BATCH_SIZE", 10000)
+
+    # SECRET_KEYS, TOKEN_SIGNING_KEYS (HMAC keys for signed tokens, the first
+    # one signs new tokens), ADMIN_KEYS (token export and import),
+    # PROFILING_ADMIN_KEYS and the database URIs are filled in by
+    # `load_services` when the app is created
+
+    # format issued when a request doesn't ask for one: "uuid" or "signed"
+    TOKEN_FORMAT = os.getenv("TOKEN_FORMAT", "uuid")
+    # look up unexpired signed tokens on validate to catch exhausted ones
+    SIGNED_TOKEN_REVOCATION_CHECK = getenvbool("SIGNED_TOKEN_REVOCATION_CHECK", True)
+
+    # repeated POST /auth with the same Idempotency-Key get the first token
+    IDEMPOTENCY_WINDOW = getenvint("IDEMPOTENCY_WINDOW", 86400)
+
+    # where tokens are stored: "sql", "redis" (TOKEN_REDIS_URL) or "memory"
+    TOKEN_BACKEND = os.getenv("TOKEN_BACKEND", "sql")
+    TOKEN_REDIS_URL = os.getenv("TOKEN_REDIS_URL")
+
+    TOKEN_CACHE_ENABLED = getenvbool("TOKEN_CACHE_ENABLED", True)
+    TOKEN_CACHE_SIZE = getenvint("TOKEN_CACHE_SIZE", 100000)
+    TOKEN_CACHE_TTL = getenvint("TOKEN_CACHE_TTL", 3600)
+    # missing tokens may still appear (imports, replica lag), 0 disables
+    TOKEN_CACHE_MISSING_TTL = getenvint("TOKEN_CACHE_MISSING_TTL", 5)
+    TOKEN_CACHE_REDIS_URL = os.getenv("TOKEN_CACHE_REDIS_URL")
+
+    RETENTION_GRACE_SECONDS = getenvint("RETENTION_GRACE_SECONDS", 2592000)  # 30 days
+    RETENTION_BATCH_SIZE = getenvint("RETENTION_BATCH_SIZE", 1000)
+    RETENTION_ARCHIVE = getenvbool("RETENTION_ARCHIVE", False)
+    RETENTION_INTERVAL = getenvint("RETENTION_INTERVAL", 0)  # seconds, 0 disables
+
+    # token bucket per API key and route, in requests per second (0 disables).
+    # RATE_LIMITS is a JSON object of per-key/per-route overrides, e.g.
+    # {"<key fingerprint>": {"rate": 20, "burst": 40}, "*:auth.register": {...}}
+    # Without RATE_LIMIT_REDIS_URL the buckets are kept per worker process, so
+    # a key gets up to instances * WEB_CONCURRENCY times the rate and burst
+    # (gunicorn.conf.py sizes the workers from the CPUs and memory).
+    RATE_LIMIT_RATE = getenvint("RATE_LIMIT_RATE", 100)
+    RATE_LIMIT_BURST = getenvint("RATE_LIMIT_BURST", 200)
+    RATE_LIMITS = os.getenv("RATE_LIMITS", "{}")
+    RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
 
     REQUEST_TIMEOUT = getenvint("REQUEST_TIMEOUT", 10)
 
@@ -37,25 +76,141 @@ class ProdConfig(BaseConfig):
     QUALTRIX_APP_HOST = os.getenv("QUALTRIX_APP_HOST")
     QUALTRIX_APP_PORT = os.getenv("QUALTRIX_APP_PORT")
 
-    vcap_services = os.getenv("VCAP_SERVICES", "")
-
-    try:
-        services = json.loads(vcap_services)
-        for service in services["user-provided"]:
-            if service["name"] == "token-service-secret":
-                logging.info("Loading secret key from user service")
-                SECRET_KEYS = service["credentials"]["keys"]
-                break
-        if SECRET_KEYS == None:
-            logging.error("Unable to load secret key from user service")
-        db_uri = services["aws-rds"][0]["credentials"]["uri"]
-    except (json.JSONDecodeError, KeyError) as err:
-        logging.warning("Unable to load db_uri from VCAP_SERVICES")
-        logging.debug("Error: %s", str(err))
-        db_uri = os.getenv("IDVA_DB_CONN_STR", "")
-        SECRET_KEYS = [os.getenv("TOKEN_SECRET_KEY")]
-
-    # Sqlalchemy requires 'postgresql' as the protocol
-    db_uri = db_uri.replace("postgres://", "postgresql://", 1)
-
-    SQLALCHEMY_DATABASE_URI = db_uri
+    # the proxy routes together may hold at most WORKER_THREADS (set by
+    # gunicorn.conf.py, read by `load_services`) minus BULKHEAD_RESERVED
+    # threads per worker, the rest are kept for the token routes; long polls
+    # of /auth/state/wait count against the token routes' share and may take
+    # all of it but one thread (see STATE_WAIT_MAX_WAITERS).
+    # BULKHEAD_LIMITS is a JSON object of tighter per-blueprint limits, e.g.
+    # {"redirect": 2}. Requests wait at most BULKHEAD_QUEUE_TIMEOUT seconds
+    # for a slot before a 503.
+    BULKHEAD_RESERVED = getenvint("BULKHEAD_RESERVED", 2)
+    BULKHEAD_LIMITS = os.getenv("BULKHEAD_LIMITS", "{}")
+    BULKHEAD_QUEUE_TIMEOUT = getenvfloat("BULKHEAD_QUEUE_TIMEOUT", 0.1)
+
+    # connection pool per upstream and worker, should match worker threads
+    UPSTREAM_POOL_SIZE = getenvint("UPSTREAM_POOL_SIZE", 10)
+    UPSTREAM_CONNECT_TIMEOUT = getenvint("UPSTREAM_CONNECT_TIMEOUT", 3)
+    UPSTREAM_RETRIES = getenvint("UPSTREAM_RETRIES", 2)
+    UPSTREAM_BREAKER_FAILURES = getenvint("UPSTREAM_BREAKER_FAILURES", 5)
+    UPSTREAM_BREAKER_RESET = getenvint("UPSTREAM_BREAKER_RESET", 30)
+    # in-flight upstream calls per process in the ASGI serving mode
+    ASYNC_UPSTREAM_POOL_SIZE = getenvint("ASYNC_UPSTREAM_POOL_SIZE", 200)
+
+    OUTBOX_DISPATCH_INTERVAL = getenvint("OUTBOX_DISPATCH_INTERVAL", 5)  # 0 disables
+    OUTBOX_BATCH_SIZE = getenvint("OUTBOX_BATCH_SIZE", 50)
+    OUTBOX_MAX_ATTEMPTS = getenvint("OUTBOX_MAX_ATTEMPTS", 10)
+    OUTBOX_LEASE_SECONDS = getenvint("OUTBOX_LEASE_SECONDS", 60)
+    OUTBOX_BACKOFF = getenvint("OUTBOX_BACKOFF", 5)
+    OUTBOX_BACKOFF_MAX = getenvint("OUTBOX_BACKOFF_MAX", 3600)
+
+    # PROFILING_ADMIN_KEYS may profile requests (X-Profile header), none
+    # disables it
+    PROFILING_SAMPLE_RATE = getenvfloat("PROFILING_SAMPLE_RATE", 0.0)
+    PROFILING_INTERVAL_MS = getenvfloat("PROFILING_INTERVAL_MS", 1.0)
+    PROFILING_DIR = os.getenv(
+        "PROFILING_DIR", os.path.join(tempfile.gettempdir(), "token-service-profiles")
+    )
+    PROFILING_KEEP = getenvint("PROFILING_KEEP", 100)
+
+    # GET /auth/state/wait holds a request up to STATE_WAIT_TIMEOUT seconds,
+    # re-reading the token at least every STATE_WAIT_RECHECK seconds. Each
+    # waiting request holds a worker thread: past STATE_WAIT_MAX_WAITERS per
+    # process, or past BULKHEAD_RESERVED - 1 if that is fewer, requests answer
+    # at once instead.
+    STATE_WAIT_TIMEOUT = getenvfloat("STATE_WAIT_TIMEOUT", 25.0)
+    STATE_WAIT_RECHECK = getenvfloat("STATE_WAIT_RECHECK", 5.0)
+    STATE_WAIT_MAX_WAITERS = getenvint("STATE_WAIT_MAX_WAITERS", 2)
+
+    # rows per query of GET /auth/export and `manage.py export_tokens`
+    EXPORT_BATCH_SIZE = getenvint("EXPORT_BATCH_SIZE", 5000)
+    # rows per transaction of POST /auth/import and `manage.py import_tokens`
+    IMPORT_BATCH_SIZE = getenvint("IMPORT_BATCH_SIZE", 10000)
+
+    # retention/outbox threads; gunicorn.conf.py starts them after forking
+    START_BACKGROUND_WORKERS = getenvbool("START_BACKGROUND_WORKERS", True)
+
+    # connections per worker process, gunicorn.conf.py matches DB_POOL_SIZE to
+    # its thread count. Keep instances * workers * (size + overflow) below the
+    # database's connection limit.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": getenvint("DB_POOL_SIZE", 5),
+        "max_overflow": getenvint("DB_MAX_OVERFLOW", 2),
+        "pool_timeout": getenvint("DB_POOL_TIMEOUT", 10),
+        "pool_recycle": getenvint("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": getenvbool("DB_POOL_PRE_PING", True),
+    }
+    DB_WARM_CONNECTIONS = getenvint("DB_WARM_CONNECTIONS", 2)
+
+    # validate and state read from the replica while it lags the primary by at
+    # most DB_REPLICA_MAX_LAG seconds, checked every DB_REPLICA_CHECK_INTERVAL
+    DB_REPLICA_SERVICE = os.getenv("DB_REPLICA_SERVICE", "tokendb-replica")
+    DB_REPLICA_MAX_LAG = getenvint("DB_REPLICA_MAX_LAG", 5)
+    DB_REPLICA_CHECK_INTERVAL = getenvint("DB_REPLICA_CHECK_INTERVAL", 5)
+
+    @classmethod
+    def load_services(cls, config):
+        """
+        Fill in the secrets and database URIs from the bound Cloud Foundry
+        services (VCAP_SERVICES), or from the environment outside Cloud
+        Foundry, and the worker's thread count. Values the config class sets
+        itself are kept.
+        """
+        values = {
+            "SECRET_KEYS": None,
+            "TOKEN_SIGNING_KEYS": [],
+            "ADMIN_KEYS": [],
+            "PROFILING_ADMIN_KEYS": [],
+            # read when the app is created, after gunicorn.conf.py has set it
+            "WORKER_THREADS": getenvint("WORKER_THREADS", 4),
+        }
+        try:
+            services = json.loads(os.getenv("VCAP_SERVICES", ""))
+            for service in services["user-provided"]:
+                if service["name"] == "token-service-secret":
+                    logging.info("Loading secret key from user service")
+                    credentials = service["credentials"]
+                    values["SECRET_KEYS"] = credentials["keys"]
+                    values["TOKEN_SIGNING_KEYS"] = credentials.get("signing_keys", [])
+                    values["ADMIN_KEYS"] = credentials.get("admin_keys", [])
+                    values["PROFILING_ADMIN_KEYS"] = credentials.get("admin_keys", [])
+                    break
+            if values["SECRET_KEYS"] is None:
+                logging.error("Unable to load secret key from user service")
+            rds = {s["name"]: s["credentials"]["uri"] for s in services["aws-rds"]}
+            replica_uri = rds.pop(config["DB_REPLICA_SERVICE"], "")
+            db_uri = list(rds.values())[0]
+        except (json.JSONDecodeError, KeyError) as err:
+            logging.warning("Unable to load db_uri from VCAP_SERVICES")
+            logging.debug("Error: %s", str(err))
+            db_uri = os.getenv("IDVA_DB_CONN_STR", "")
+            replica_uri = os.getenv("IDVA_DB_REPLICA_CONN_STR", "")
+            values["SECRET_KEYS"] = [os.getenv("TOKEN_SECRET_KEY")]
+            for key in ("TOKEN_SIGNING_KEYS", "ADMIN_KEYS", "PROFILING_ADMIN_KEYS"):
+                values[key] = os.getenv(key, "").split(",")
+
+        # Sqlalchemy requires 'postgresql' as the protocol
+        db_uri = db_uri.replace("postgres://", "postgresql://", 1)
+        replica_uri = replica_uri.replace("postgres://", "postgresql://", 1)
+
+        values["SQLALCHEMY_DATABASE_URI"] = db_uri
+        values["SQLALCHEMY_BINDS"] = {"replica": replica_uri} if replica_uri else {}
+        for key, value in values.items():
+            config.setdefault(key, value)
+
+
+class SQLiteConfig(ProdConfig):
+    """
+    Single-node and local runs on SQLite. Relative paths in
+    SQLITE_DATABASE_URI are created under the app's instance folder.
+    """
+
+    SQLALCHEMY_DATABASE_URI = os.getenv(
+        "SQLITE_DATABASE_URI", "sqlite:///idva_token.db"
+    )
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        # seconds a writer waits for SQLite's database lock
+        "connect_args": {"timeout": getenvint("DB_POOL_TIMEOUT", 10)},
+        "pool_size": getenvint("DB_POOL_SIZE", 5),
+        "max_overflow": getenvint("DB_MAX_OVERFLOW", 2),
+    }
@@ -0,0 +1,33 @@
+# server/auth/env.py
+"""
+Typed environment lookups.
+
+Kept apart from `auth.config`, whose config classes read the environment
+as soon as it is imported, so `gunicorn.conf.py` can use these before it
+has set the variables those classes read.
+"""
+
+import os
+
+
+def getenvint(name: str, default: int):
+    try:
+        return int(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+def getenvfloat(name: str, default: float):
+    try:
+        return float(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+def getenvbool(name: str, default: bool):
+    value = os.getenv(name, "").strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    return default
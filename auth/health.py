@@ -0,0 +1,18 @@
+# server/auth/health.py
+
+from flask import Blueprint
+
+from auth import runtime
+from auth.responses import Responses
+
+health_blueprint = Blueprint("health", __name__)
+
+
+@health_blueprint.route("", methods=["GET"])
+def health():
+    """
+    Readiness check: the instance can reach its database
+    """
+    if not runtime.ready():
+        return Responses.unavailable("database")
+    return Responses.ok()
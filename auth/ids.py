@@ -0,0 +1,70 @@
+# server/auth/ids.py
+"""
+Token ids.
+
+New tokens get time-ordered UUIDv7 ids (RFC 9562): the first 48 bits are the
+Unix time in milliseconds, followed by 12 bits of sub-millisecond time and
+62 random bits. Consecutive ids sort next to each other, so inserts append
+to the right edge of the primary key index rather than landing on random
+pages, and the id alone tells when a token was created. Ids issued before
+the switch (UUIDv1) and any other UUID version are still accepted.
+"""
+
+import datetime
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+# 100ns intervals between the Gregorian epoch of UUIDv1 and the Unix epoch
+_V1_EPOCH_OFFSET = 0x01B21DD213814000
+
+_lock = threading.Lock()
+_last = 0
+
+
+def uuid7() -> uuid.UUID:
+    """
+    A new UUIDv7, greater than any generated before it by this process
+    """
+    global _last
+    nanoseconds = time.time_ns()
+    milliseconds, remainder = divmod(nanoseconds, 1_000_000)
+    # sub-millisecond fraction scaled to 12 bits (RFC 9562 method 3)
+    fraction = remainder * 4096 // 1_000_000
+    random = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (
+        (milliseconds << 80) | (0x7 << 76) | (fraction << 64) | (0b10 << 62) | random
+    )
+    with _lock:
+        # ids generated within the same clock tick count up from the last one
+        if value <= _last:
+            value = _last + 1
+        _last = value
+    return uuid.UUID(int=value)
+
+
+def created_on(token_id: uuid.UUID) -> Optional[datetime.datetime]:
+    """
+    When a UUIDv7 or UUIDv1 id was generated, None for other versions
+    """
+    if token_id.version == 7:
+        seconds = (token_id.int >> 80) / 1000
+    elif token_id.version == 1:
+        seconds = (token_id.time - _V1_EPOCH_OFFSET) / 10_000_000
+    else:
+        return None
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
+
+
+def floor(when: datetime.datetime) -> uuid.UUID:
+    """
+    The smallest UUIDv7 generated at or after `when`, so a creation time
+    range becomes a range scan of the primary key: `id >= floor(start) AND
+    id < floor(end)`. A naive `when` is UTC.
+    """
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    milliseconds = int(when.timestamp() * 1000)
+    return uuid.UUID(int=(milliseconds << 80) | (0x7 << 76) | (0b10 << 62))
@@ -0,0 +1,279 @@
+# server/auth/importer.py
+"""
+Bulk import of token records into the `tokens` table.
+
+Records are read from a CSV or NDJSON stream, one token per row or line,
+with the fields of `TokenRecord`. The output of `auth.export` is accepted
+as is, so tokens can be moved between environments with their ids and
+expiries intact. Invalid records are counted and skipped.
+
+Records are written in chunks of `IMPORT_BATCH_SIZE`, each in its own
+transaction, so memory stays flat however large the file is. On Postgres a
+chunk is `COPY`ed into a temporary staging table and moved into `tokens`
+with one `INSERT ... SELECT ... ON CONFLICT`; other databases upsert the
+chunk with a multi-row `INSERT`. A record whose id already exists is either
+skipped or overwrites the row (`on_conflict="update"`). Used by
+`POST /auth/import` and `python manage.py import_tokens`.
+
+The written ids are discarded from this process's and the shared token
+cache as they are written. On Postgres the other processes are told to drop
+their local caches when the import is done; elsewhere they keep cached
+results until they expire or the workers restart.
+"""
+
+import csv
+import datetime
+import io
+import json
+import logging
+import time
+import uuid
+from typing import IO, Iterator, List, Optional, Tuple
+
+from pydantic import AliasChoices, BaseModel, Field, NonNegativeInt, ValidationError
+from sqlalchemy import select, text
+
+from auth import changes
+from auth.main import config, db
+from auth.models import Token
+from auth.portable import is_postgres, upsert, utcnow
+from auth.store import terminal_cache
+
+FORMATS = ("ndjson", "csv")
+CONFLICTS = ("skip", "update")
+
+# how many invalid records are described in the report
+MAX_ERRORS = 10
+
+_COLUMNS = [column.name for column in Token.__table__.columns]
+
+_STAGING = "tokens_import"
+
+# the fields an empty CSV value leaves unset; an empty state is a state
+_OPTIONAL = ("registered_on", "exhausted", "exhausted_on")
+
+# NULL is spelled \N so that an empty state stays an empty string
+_COPY = (
+    f"COPY {_STAGING} ({', '.join(_COLUMNS)}) "
+    "FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+)
+
+_UPDATE = ", ".join(f"{name} = EXCLUDED.{name}" for name in _COLUMNS if name != "id")
+
+# (inserted, written) of the chunk; xmax is 0 only on freshly inserted rows
+_MERGE = """
+    WITH written AS (
+        INSERT INTO tokens ({columns})
+        SELECT {columns} FROM {staging}
+        ON CONFLICT (id) DO {action}
+        RETURNING xmax = 0 AS inserted
+    )
+    SELECT count(*) FILTER (WHERE inserted), count(*) FROM written
+"""
+_MERGES = {
+    conflict: text(
+        _MERGE.format(
+            columns=", ".join(_COLUMNS),
+            staging=_STAGING,
+            action="NOTHING" if conflict == "skip" else f"UPDATE SET {_UPDATE}",
+        )
+    )
+    for conflict in CONFLICTS
+}
+
+
+class TokenRecord(BaseModel):
+    """
+    One imported token. Times without an offset are UTC.
+    """
+
+    id: uuid.UUID
+    expires_on: datetime.datetime
+    refresh: NonNegativeInt = Field(validation_alias=AliasChoices("refresh", "uses"))
+    state: str = "init"
+    registered_on: Optional[datetime.datetime] = None
+    exhausted: bool = False
+    exhausted_on: Optional[datetime.datetime] = None
+
+
+def _utc(value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    """
+    `value` as naive UTC, which is how the columns store it
+    """
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _row(record: TokenRecord, now: datetime.datetime) -> dict:
+    exhausted_on = record.exhausted_on
+    if record.exhausted and exhausted_on is None:
+        # so the retention job can purge it
+        exhausted_on = now
+    return {
+        "id": record.id,
+        "registered_on": _utc(record.registered_on) or now,
+        "expires_on": _utc(record.expires_on),
+        "refresh": record.refresh,
+        "state": record.state,
+        "exhausted": record.exhausted,
+        "exhausted_on": _utc(exhausted_on),
+    }
+
+
+def records(stream: IO[bytes], import_format: str) -> Iterator[Tuple[int, object]]:
+    """
+    The raw records of `stream` with their line numbers
+    """
+    lines = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    if import_format == "csv":
+        reader = csv.DictReader(lines)
+        for fields in reader:
+            yield reader.line_num, {
+                k: v for k, v in fields.items() if v != "" or k not in _OPTIONAL
+            }
+        return
+    for number, line in enumerate(lines, 1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+
+
+def _chunks(stream, import_format, batch_size, report) -> Iterator[List[dict]]:
+    """
+    Valid rows, `batch_size` distinct ids at a time. Invalid records are
+    counted in `report`.
+    """
+    now = utcnow().replace(tzinfo=None)
+    chunk = {}
+    for number, fields in records(stream, import_format):
+        try:
+            if not isinstance(fields, dict):
+                raise ValueError(f"not a {import_format} record")
+            row = _row(TokenRecord.model_validate(fields), now)
+        except (ValidationError, ValueError) as err:
+            report["invalid"] += 1
+            if len(report["errors"]) < MAX_ERRORS:
+                message = str(err).splitlines()
+                report["errors"].append(f"line {number}: {' '.join(message[:3])}")
+            continue
+        report["rows"] += 1
+        # the last record for an id wins
+        chunk[row["id"]] = row
+        if len(chunk) >= batch_size:
+            yield list(chunk.values())
+            chunk = {}
+    if chunk:
+        yield list(chunk.values())
+
+
+def _copy(connection, rows: List[dict], on_conflict: str) -> Tuple[int, int]:
+    """
+    Stage `rows` with `COPY` and merge them into `tokens`. Returns the number
+    of rows inserted and written.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        ["\\N" if row[name] is None else row[name] for name in _COLUMNS] for row in rows
+    )
+    buffer.seek(0)
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(_COPY, buffer)
+    inserted, written = connection.execute(_MERGES[on_conflict]).one()
+    # ON COMMIT DELETE ROWS empties the staging table for the next chunk
+    connection.commit()
+    return inserted, written
+
+
+def _upsert(connection, rows: List[dict], on_conflict: str) -> Tuple[int, int]:
+    existing = len(
+        connection.execute(
+            select(Token.id).where(Token.id.in_([row["id"] for row in rows]))
+        ).all()
+    )
+    statement = upsert(Token.__table__)
+    if on_conflict == "skip":
+        statement = statement.on_conflict_do_nothing(index_elements=["id"])
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=["id"],
+            set_={name: statement.excluded[name] for name in _COLUMNS if name != "id"},
+        )
+    connection.execute(statement, rows)
+    connection.commit()
+    inserted = len(rows) - existing
+    return inserted, len(rows) if on_conflict == "update" else inserted
+
+
+def load(
+    stream: IO[bytes],
+    import_format: str = "ndjson",
+    on_conflict: str = "skip",
+    batch_size: int = None,
+) -> dict:
+    """
+    Import the token records of `stream`. Returns the number of valid rows
+    read, how many were inserted, updated or skipped as duplicates, how many
+    records were invalid (with the first few errors) and the import rate.
+    """
+    if (config.get("TOKEN_BACKEND") or "sql") != "sql":
+        raise ValueError("Token import needs the sql token backend")
+    if import_format not in FORMATS:
+        raise ValueError(f"Unknown import format {import_format!r}")
+    if on_conflict not in CONFLICTS:
+        raise ValueError(f"Unknown conflict action {on_conflict!r}")
+    batch_size = batch_size or config["IMPORT_BATCH_SIZE"]
+
+    report = {"rows": 0, "inserted": 0, "updated": 0, "skipped": 0, "invalid": 0}
+    report["errors"] = []
+    start = time.perf_counter()
+    with db.engine.connect() as connection:
+        staged = is_postgres()
+        write = _copy if staged else _upsert
+        if staged:
+            connection.execute(
+                text(
+                    f"CREATE TEMPORARY TABLE {_STAGING} "
+                    "(LIKE tokens INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+                )
+            )
+            connection.commit()
+        try:
+            for rows in _chunks(stream, import_format, batch_size, report):
+                inserted, written = write(connection, rows, on_conflict)
+                # cached terminal results of the written ids are stale now
+                terminal_cache.discard([str(row["id"]) for row in rows])
+                report["inserted"] += inserted
+                report["updated"] += written - inserted
+                report["skipped"] += len(rows) - written
+            if report["inserted"] or report["updated"]:
+                # and so are those cached by the other processes
+                changes.flush_caches(connection)
+                connection.commit()
+        finally:
+            if staged:
+                connection.rollback()
+                connection.execute(text(f"DROP TABLE IF EXISTS {_STAGING}"))
+                connection.commit()
+
+    # records superseded by a later one for the same id count as skipped
+    report["skipped"] += report["rows"] - (
+        report["inserted"] + report["updated"] + report["skipped"]
+    )
+    seconds = time.perf_counter() - start
+    report["seconds"] = round(seconds, 3)
+    report["rows_per_second"] = round(report["rows"] / seconds, 1) if seconds else 0.0
+    logging.info(
+        "Token import of %d rows: %d inserted, %d updated, %d skipped, "
+        "%d invalid in %.3fs (%.1f rows/s)",
+        report["rows"],
+        report["inserted"],
+        report["updated"],
+        report["skipped"],
+        report["invalid"],
+        seconds,
+        report["rows_per_second"],
+    )
+    return report
@@ -1,21 +1,118 @@
+# server/auth/main.py
+"""
+Application factory.
+
+`create_app` builds the Flask app from the `APP_SETTINGS` config class and
+registers the blueprints named in `APP_BLUEPRINTS`: `auth` (the token
+API), `export` (survey responses) and `redirect`, or the groups `proxy`
+(export and redirect) and `all` (the default). `health` is always
+registered. A route module is only imported when one of its blueprints is
+enabled, so an auth-only deployment never loads the upstream HTTP clients
+and a proxy-only one never loads the token store.
+
+Importing this module builds nothing; `app` and `config` are created on
+first access, which keeps `gunicorn auth.main:app` and
+`from auth.main import config` working. The token modules configure
+per-process state from the app (storage backend, caches, upstream pools)
+when they are imported, so there is one app per process and later calls to
+`create_app` return it.
+"""
+
+import importlib
 import logging
 import os
+from typing import Iterable, List, Optional, Union
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.utils import import_string
 
-app = Flask(__name__)
+from auth import metrics, profiling
 
-app_settings = os.getenv("APP_SETTINGS")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 logging.getLogger().setLevel(LOG_LEVEL)
 
-app.config.from_object(app_settings)
+# name: (module, blueprint, url prefix)
+BLUEPRINTS = {
+    "auth": ("auth.api", "auth_blueprint", "/auth"),
+    "export": ("auth.proxy", "gdrive_blueprint", "/export"),
+    "redirect": ("auth.proxy", "redirect_blueprint", "/redirect"),
+    "health": ("auth.health", "health_blueprint", "/health"),
+}
+GROUPS = {"all": ["auth", "export", "redirect"], "proxy": ["export", "redirect"]}
+
+# engines are created by create_app and connect on first use
+db = SQLAlchemy(engine_options={"poolclass": metrics.TimedQueuePool})
+
+_app = None
+
+
+def enabled_blueprints(names: Union[str, Iterable[str]]) -> List[str]:
+    """
+    The blueprints `names` (comma-separated or a list) stand for
+    """
+    if isinstance(names, str):
+        names = names.split(",")
+    enabled = []
+    for name in (name.strip() for name in names):
+        if not name:
+            continue
+        for blueprint in GROUPS.get(name, [name]):
+            if blueprint not in BLUEPRINTS:
+                raise ValueError(f"Unknown blueprint {blueprint!r}")
+            if blueprint not in enabled:
+                enabled.append(blueprint)
+    if "health" not in enabled:
+        enabled.append("health")
+    return enabled
+
+
+def create_app(
+    settings: Optional[str] = None, blueprints: Union[str, Iterable[str]] = None
+) -> Flask:
+    """
+    The process's app, configured from `settings` (default `APP_SETTINGS`)
+    with `blueprints` (default `APP_BLUEPRINTS`) enabled
+    """
+    global _app
+    if _app is not None:
+        return _app
+
+    app = Flask(__name__)
+    settings = settings or os.getenv("APP_SETTINGS")
+    if settings:
+        settings = import_string(settings)
+        app.config.from_object(settings)
+        if hasattr(settings, "load_services"):
+            settings.load_services(app.config)
+    app.config["APP_BLUEPRINTS"] = enabled_blueprints(
+        blueprints or app.config.get("APP_BLUEPRINTS", "all")
+    )
+
+    db.init_app(app)
+    metrics.init_app(app)
+    # route modules read `config` while they are imported
+    _app = app
+
+    for name in app.config["APP_BLUEPRINTS"]:
+        module, blueprint, url_prefix = BLUEPRINTS[name]
+        app.register_blueprint(
+            getattr(importlib.import_module(module), blueprint),
+            url_prefix=url_prefix,
+        )
+    profiling.init_app(app)
+
+    # under gunicorn these are started per worker after forking, see gunicorn.conf.py
+    if app.config.get("START_BACKGROUND_WORKERS", True):
+        from auth import runtime
 
-config = app.config
-db = SQLAlchemy(app)
+        runtime.start_background_workers(app)
+    return app
 
-from auth.api import auth_blueprint, gdrive_blueprint, redirect_blueprint
 
-app.register_blueprint(auth_blueprint, url_prefix="/auth")
-app.register_blueprint(gdrive_blueprint, url_prefix="/export")
-app.register_blueprint(redirect_blueprint, url_prefix="/redirect")
+def __getattr__(name: str):
+    if name == "app":
+        return create_app()
+    if name == "config":
+        return create_app().config
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
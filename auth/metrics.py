@@ -0,0 +1,185 @@
+# server/auth/metrics.py
+"""
+Prometheus metrics, served on `/metrics`.
+
+Request latency is recorded per route and status, query time and pool
+checkout wait through SQLAlchemy events, and upstream latency by
+`auth.upstream`. Under gunicorn each worker writes its samples to
+`PROMETHEUS_MULTIPROC_DIR` (set up by `gunicorn.conf.py`) and `/metrics`
+aggregates all workers; without it the process' own registry is served.
+"""
+
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+# the token routes answer in milliseconds, upstream calls can take seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by route",
+    ["endpoint", "method", "status"],
+    buckets=BUCKETS,
+)
+QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Database statement execution time by statement type",
+    ["statement"],
+    buckets=BUCKETS,
+)
+POOL_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a database connection from the pool",
+    buckets=BUCKETS,
+)
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds",
+    "Upstream call latency",
+    ["upstream", "outcome"],
+    buckets=BUCKETS,
+)
+UPSTREAM_REJECTED = Counter(
+    "upstream_rejected_total",
+    "Upstream calls refused by an open circuit breaker",
+    ["upstream"],
+)
+DB_READS = Counter(
+    "db_reads_total",
+    "Read-only token lookups by the database that served them",
+    ["target"],
+)
+TOKENS_REGISTERED = Counter("tokens_registered_total", "Tokens registered", ["format"])
+TOKEN_OPERATIONS = Counter(
+    "token_operations_total",
+    "Token lifecycle steps by outcome",
+    ["operation", "outcome"],
+)
+TOKEN_CACHE_HITS = Counter(
+    "token_cache_hits_total",
+    "Token lookups answered by the terminal result cache, by the cache tier",
+    ["tier"],
+)
+TOKEN_CACHE_MISSES = Counter(
+    "token_cache_misses_total",
+    "Token lookups the terminal result cache could not answer",
+)
+BULKHEAD_QUEUE_SECONDS = Histogram(
+    "bulkhead_queue_seconds",
+    "Time requests waited for a bulkhead slot, by whether they got one",
+    ["bulkhead", "outcome"],
+    buckets=BUCKETS,
+)
+BULKHEAD_REJECTED = Counter(
+    "bulkhead_rejected_total",
+    "Requests shed with a 503 because their bulkhead was full",
+    ["bulkhead"],
+)
+BULKHEAD_ACTIVE = Gauge(
+    "bulkhead_active_requests",
+    "Requests holding a bulkhead slot",
+    ["bulkhead"],
+    multiprocess_mode="livesum",
+)
+STATE_WAITS = Counter(
+    "token_state_waits_total",
+    "Long polls of a token's state by how they ended",
+    ["result"],
+)
+OUTBOX_DELIVERIES = Counter(
+    "outbox_deliveries_total",
+    "Survey response delivery attempts by result: sent, retried or dead",
+    ["result"],
+)
+# every worker's dispatcher measures the same shared queue
+OUTBOX_DEPTH = Gauge(
+    "outbox_queued_responses",
+    "Survey responses waiting for delivery",
+    multiprocess_mode="livemax",
+)
+OUTBOX_DEAD_LETTERS = Gauge(
+    "outbox_dead_letters",
+    "Survey responses dead-lettered after failed deliveries",
+    multiprocess_mode="livemax",
+)
+OUTBOX_OLDEST_SECONDS = Gauge(
+    "outbox_oldest_age_seconds",
+    "Age of the oldest survey response waiting for delivery",
+    multiprocess_mode="livemax",
+)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    `QueuePool` that records how long each checkout waited, which SQLAlchemy
+    has no event for
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+
+# the start time is kept on the statement's execution context, which a
+# failed statement takes with it, rather than on the pooled connection
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    if context is not None:
+        context.metrics_query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    start = getattr(context, "metrics_query_start", None)
+    if start is not None:
+        QUERY_SECONDS.labels(statement.lstrip().split(" ", 1)[0].upper()).observe(
+            time.perf_counter() - start
+        )
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _observe(response):
+    start = g.pop("metrics_start", None)
+    if start is not None:
+        REQUEST_SECONDS.labels(
+            request.endpoint or "unmatched", request.method, response.status_code
+        ).observe(time.perf_counter() - start)
+    return response
+
+
+def export():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    """
+    Time every request and serve `/metrics`
+    """
+    app.before_request(_start_timer)
+    app.after_request(_observe)
+    app.add_url_rule("/metrics", "metrics", export)
@@ -1,30 +1,131 @@
 import datetime
-import uuid
-from sqlalchemy.dialects.postgresql import UUID
+
+from sqlalchemy import DDL, event
+
+from auth import ids
 from auth.main import db
+from auth.portable import UTCDateTime, utcnow
+
+
+def new_token_id():
+    return ids.uuid7()
 
 
 class Token(db.Model):
     """Token Model for storing a token with meta information"""
 
     __tablename__ = "tokens"
-
-    id = db.Column(
-        UUID(as_uuid=True), primary_key=True, default=lambda: uuid.uuid1().hex
+    __table_args__ = (
+        db.Index("ix_tokens_expires_on", "expires_on", "id"),
+        db.Index(
+            "ix_tokens_exhausted_on",
+            "exhausted_on",
+            "id",
+            postgresql_where=db.text("exhausted"),
+            sqlite_where=db.text("exhausted"),
+        ),
     )
-    registered_on = db.Column(db.DateTime, nullable=False)
-    expires_on = db.Column(db.DateTime, nullable=False)
+
+    id = db.Column(db.Uuid, primary_key=True, default=new_token_id)
+    registered_on = db.Column(UTCDateTime, nullable=False)
+    expires_on = db.Column(UTCDateTime, nullable=False)
     refresh = db.Column(db.Integer, nullable=False)
     state = db.Column(db.String, nullable=False, default="init")
     exhausted = db.Column(db.Boolean, nullable=False, default=False)
+    exhausted_on = db.Column(UTCDateTime, nullable=True)
 
     def __init__(self, seconds, uses):
-        self.registered_on = datetime.datetime.now()
-        self.expires_on = datetime.datetime.now() + datetime.timedelta(
+        self.registered_on = utcnow()
+        self.expires_on = self.registered_on + datetime.timedelta(
             days=0, seconds=seconds
         )
         self.refresh = uses
 
     def is_expired(self):
-        time_of_request = datetime.datetime.now()
+        time_of_request = utcnow()
         return self.expires_on < time_of_request
+
+
+# NOTIFY token_changes with the id of a token whose state or exhaustion changed,
+# see auth.changes. Also created by migration 9b3f6d2e8a57.
+TOKEN_CHANGE_TRIGGER = [
+    """
+    CREATE OR REPLACE FUNCTION notify_token_change() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('token_changes', NEW.id::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tokens_notify_change
+    AFTER UPDATE OF state, exhausted ON tokens
+    FOR EACH ROW
+    WHEN (
+        OLD.state IS DISTINCT FROM NEW.state
+        OR OLD.exhausted IS DISTINCT FROM NEW.exhausted
+    )
+    EXECUTE PROCEDURE notify_token_change()
+    """,
+]
+for statement in TOKEN_CHANGE_TRIGGER:
+    event.listen(
+        Token.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
+
+
+class TokenArchive(db.Model):
+    """Tokens removed from `tokens` by the retention job"""
+
+    __tablename__ = "tokens_archive"
+
+    id = db.Column(db.Uuid, primary_key=True)
+    registered_on = db.Column(UTCDateTime, nullable=False)
+    expires_on = db.Column(UTCDateTime, nullable=False)
+    refresh = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.String, nullable=False)
+    exhausted = db.Column(db.Boolean, nullable=False)
+    exhausted_on = db.Column(UTCDateTime, nullable=True)
+    archived_on = db.Column(UTCDateTime, nullable=False)
+
+
+class SurveyOutbox(db.Model):
+    """Survey responses waiting to be forwarded to the GDrive service"""
+
+    __tablename__ = "survey_outbox"
+    __table_args__ = (
+        db.Index(
+            "ix_survey_outbox_due",
+            "next_attempt_on",
+            "id",
+            postgresql_where=db.text("NOT dead"),
+            sqlite_where=db.text("NOT dead"),
+        ),
+    )
+
+    # SQLite only autoincrements INTEGER primary keys
+    id = db.Column(
+        db.BigInteger().with_variant(db.Integer, "sqlite"),
+        primary_key=True,
+        autoincrement=True,
+    )
+    payload = db.Column(db.Text, nullable=False)
+    created_on = db.Column(UTCDateTime, nullable=False)
+    next_attempt_on = db.Column(UTCDateTime, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String, nullable=True)
+    dead = db.Column(db.Boolean, nullable=False, default=False)
+
+
+class IdempotencyKey(db.Model):
+    """Token issued for an `Idempotency-Key`, per API key"""
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (db.Index("ix_idempotency_keys_expires_on", "expires_on"),)
+
+    # "<API key fingerprint>:<Idempotency-Key>"
+    key = db.Column(db.String(300), primary_key=True)
+    token = db.Column(db.String, nullable=False)
+    expires_on = db.Column(UTCDateTime, nullable=False)
@@ -0,0 +1,196 @@
+# server/auth/outbox.py
+"""
+Outbox for survey responses.
+
+`/export/survey-response` only stores the response in `survey_outbox`; a
+dispatcher forwards queued responses to the GDrive service in batches. Rows
+are claimed with a lease (`next_attempt_on` is pushed forward) so several
+dispatchers can share the queue, failed sends are retried with exponential
+backoff, and responses that keep failing, or that GDrive rejects outright,
+are dead-lettered (`dead`) for inspection instead of being retried forever.
+
+Deliveries are counted on `/metrics` by result, and the dispatcher refreshes
+the queue's depth, dead letters and oldest age there after every batch.
+"""
+
+import datetime
+import logging
+import random
+
+import requests
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+from auth import metrics, worker
+from auth.main import db, config
+from auth.models import SurveyOutbox
+from auth.portable import any_of, utcnow
+from auth.upstream import CircuitOpenError, Upstream
+
+gdrive = Upstream.from_config(
+    "gdrive", config["GDRIVE_APP_HOST"], config["GDRIVE_APP_PORT"], config
+)
+
+_random = random.SystemRandom()
+
+
+def enqueue(payload: str):
+    """
+    Queue a survey response for delivery
+    """
+    now = utcnow()
+    db.session.execute(
+        insert(SurveyOutbox).values(
+            payload=payload, created_on=now, next_attempt_on=now, attempts=0
+        )
+    )
+    db.session.commit()
+
+
+def _backoff(attempts: int) -> datetime.timedelta:
+    """
+    Exponential backoff with jitter, capped at OUTBOX_BACKOFF_MAX
+    """
+    seconds = min(
+        config["OUTBOX_BACKOFF"] * 2 ** (attempts - 1), config["OUTBOX_BACKOFF_MAX"]
+    )
+    return datetime.timedelta(seconds=seconds * _random.uniform(0.5, 1))
+
+
+def _claim(batch_size: int):
+    """
+    Lease up to `batch_size` due rows to this dispatcher
+    """
+    now = utcnow()
+    due = (
+        select(SurveyOutbox.id)
+        .where(SurveyOutbox.dead.is_(False), SurveyOutbox.next_attempt_on <= now)
+        .order_by(SurveyOutbox.next_attempt_on, SurveyOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    rows = db.session.execute(
+        update(SurveyOutbox)
+        .where(SurveyOutbox.id.in_(due))
+        .values(
+            attempts=SurveyOutbox.attempts + 1,
+            next_attempt_on=now
+            + datetime.timedelta(seconds=config["OUTBOX_LEASE_SECONDS"]),
+        )
+        .returning(SurveyOutbox.id, SurveyOutbox.payload, SurveyOutbox.attempts)
+    ).all()
+    db.session.commit()
+    return sorted(rows)
+
+
+def dispatch(batch_size: int = None) -> dict:
+    """
+    Forward one batch of due survey responses to GDrive
+    """
+    batch_size = batch_size or config["OUTBOX_BATCH_SIZE"]
+    rows = _claim(batch_size)
+
+    sent = []
+    failed = []
+    for i, row in enumerate(rows):
+        try:
+            response = gdrive.post("/survey-export", data=row.payload)
+        except CircuitOpenError:
+            # GDrive is down, hand the rest back without using up an attempt
+            retry_on = utcnow() + datetime.timedelta(
+                seconds=gdrive.breaker.reset_seconds
+            )
+            for rest in rows[i:]:
+                failed.append((rest, rest.attempts - 1, retry_on, None, False))
+            break
+        except requests.RequestException as err:
+            error = str(err)
+            dead = row.attempts >= config["OUTBOX_MAX_ATTEMPTS"]
+        else:
+            if response.status_code < 400:
+                sent.append(row.id)
+                continue
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            # a 4xx will be rejected again, only server errors are retried
+            dead = (
+                response.status_code < 500
+                or row.attempts >= config["OUTBOX_MAX_ATTEMPTS"]
+            )
+        retry_on = utcnow() + _backoff(row.attempts)
+        failed.append((row, row.attempts, retry_on, error, dead))
+
+    if sent:
+        db.session.execute(delete(SurveyOutbox).where(any_of(SurveyOutbox.id, sent)))
+    if failed:
+        db.session.execute(
+            update(SurveyOutbox.__table__)
+            .where(SurveyOutbox.id == bindparam("row_id"))
+            .values(
+                attempts=bindparam("row_attempts"),
+                next_attempt_on=bindparam("row_next"),
+                last_error=func.coalesce(
+                    bindparam("row_error"), SurveyOutbox.last_error
+                ),
+                dead=bindparam("row_dead"),
+            ),
+            [
+                {
+                    "row_id": row.id,
+                    "row_attempts": attempts,
+                    "row_next": retry_on,
+                    "row_error": error,
+                    "row_dead": dead,
+                }
+                for row, attempts, retry_on, error, dead in failed
+            ],
+        )
+    db.session.commit()
+
+    dead = sum(1 for *_, is_dead in failed if is_dead)
+    metrics.OUTBOX_DELIVERIES.labels("sent").inc(len(sent))
+    metrics.OUTBOX_DELIVERIES.labels("retried").inc(len(failed) - dead)
+    metrics.OUTBOX_DELIVERIES.labels("dead").inc(dead)
+    if dead:
+        logging.error("Dead-lettered %d survey responses", dead)
+
+    return {
+        "claimed": len(rows),
+        "sent": len(sent),
+        "retried": len(failed) - dead,
+        "dead": dead,
+    }
+
+
+def stats() -> dict:
+    """
+    Queue depth, dead letters and the age of the oldest queued response,
+    also set on the outbox gauges
+    """
+    depth, dead, oldest = db.session.execute(
+        select(
+            func.count().filter(SurveyOutbox.dead.is_(False)),
+            func.count().filter(SurveyOutbox.dead.is_(True)),
+            func.min(SurveyOutbox.created_on).filter(SurveyOutbox.dead.is_(False)),
+        )
+    ).one()
+    oldest_seconds = (utcnow() - oldest).total_seconds() if oldest else 0.0
+    metrics.OUTBOX_DEPTH.set(depth)
+    metrics.OUTBOX_DEAD_LETTERS.set(dead)
+    metrics.OUTBOX_OLDEST_SECONDS.set(oldest_seconds)
+    return {"depth": depth, "dead_letters": dead, "oldest_seconds": oldest_seconds}
+
+
+def start_worker(app):
+    """
+    Drain the outbox on a daemon thread, polling every
+    `OUTBOX_DISPATCH_INTERVAL` seconds while it is empty
+    """
+    batch_size = app.config["OUTBOX_BATCH_SIZE"]
+
+    def task():
+        more = dispatch(batch_size)["claimed"] == batch_size
+        stats()
+        return more
+
+    return worker.start(
+        app, "survey-outbox", app.config["OUTBOX_DISPATCH_INTERVAL"], task
+    )
@@ -0,0 +1,75 @@
+# server/auth/portable.py
+"""
+Dialect-portable column types and helpers.
+
+The service runs on Postgres in production and on SQLite for local and CI
+runs (see `tests.config.SQLiteTestConfig`). Timestamps are stored as UTC in
+plain `TIMESTAMP` columns and handed to the application as timezone-aware
+datetimes, so they compare correctly whatever the server's local timezone.
+Statements that rely on Postgres features (`UPDATE ... RETURNING` in CTEs,
+`= ANY(array)`, advisory locks) check `is_postgres()` and fall back to
+portable SQL elsewhere.
+"""
+
+import datetime
+from typing import List
+
+from sqlalchemy import DateTime, any_, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.types import TypeDecorator
+
+from auth.main import db
+
+
+def utcnow() -> datetime.datetime:
+    """
+    The current time, timezone-aware in UTC
+    """
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class UTCDateTime(TypeDecorator):
+    """
+    `DateTime` stored as naive UTC and loaded as aware UTC. Naive values are
+    taken to be UTC already.
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value
+
+
+def is_postgres() -> bool:
+    return db.engine.dialect.name == "postgresql"
+
+
+def any_of(column, values: List):
+    """
+    `column = ANY(:values)` on Postgres, binding the list as one array
+    parameter so the statement is cached once for any length; `IN` elsewhere
+    """
+    if len(values) == 1:
+        return column == values[0]
+    if is_postgres():
+        return column == any_(literal(values, ARRAY(column.type)))
+    return column.in_(values)
+
+
+def upsert(table):
+    """
+    `INSERT` for `table` supporting `ON CONFLICT`, which Postgres and SQLite
+    share but spell through their own dialects
+    """
+    if is_postgres():
+        return postgresql.insert(table)
+    return sqlite.insert(table)
@@ -0,0 +1,261 @@
+# server/auth/profiling.py
+"""
+On-demand request profiling.
+
+Enabled by configuring `PROFILING_ADMIN_KEYS`; otherwise nothing is
+installed and requests don't pay for it. A request is profiled when it
+carries `X-Profile: <admin key>`, or at random with probability
+`PROFILING_SAMPLE_RATE`.
+
+A profiled request is sampled by a background thread every
+`PROFILING_INTERVAL_MS` milliseconds, from the WSGI entry point on. That
+covers Flask dispatch, `flask_pydantic` validation, SQLAlchemy and upstream
+calls. The request's SQL statements are counted and timed. The result is
+stored in `PROFILING_DIR` as folded stacks (`<id>.folded`, for
+`flamegraph.pl` or speedscope) and a summary (`<id>.json`). Only the newest
+`PROFILING_KEEP` profiles are kept.
+
+Requests profiled via the header get the summary as a `Server-Timing`
+header and the profile id as `X-Profile-Id`. `GET /profiles` lists stored
+profiles and `GET /profiles/<id>` returns one's folded stacks. Both require
+the `X-Profile` header.
+"""
+
+import collections
+import datetime
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+from flask import Response, abort, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_random = random.SystemRandom()
+_local = threading.local()
+
+
+class Sampler(threading.Thread):
+    """
+    Counts the stacks of one thread, sampled every `interval` seconds
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{frame.f_globals.get('__name__')}:{code.co_qualname}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> collections.Counter:
+        self._done.set()
+        self.join()
+        return self.stacks
+
+
+class Profile:
+    """
+    One profiled request
+    """
+
+    def __init__(self, environ, interval: float):
+        self.id = uuid.uuid4().hex
+        self.method = environ.get("REQUEST_METHOD")
+        self.path = environ.get("PATH_INFO")
+        self.started_on = datetime.datetime.now(datetime.timezone.utc)
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.stacks = collections.Counter()
+        self._start = time.perf_counter()
+        self._sampler = Sampler(threading.get_ident(), interval)
+        self._sampler.start()
+
+    def stop(self):
+        self.stacks = self._sampler.stop()
+
+    def finish(self, status: str) -> dict:
+        self.seconds = time.perf_counter() - self._start
+        self.stop()
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": int(status.split(" ", 1)[0]),
+            "started_on": self.started_on.isoformat(),
+            "ms": round(self.seconds * 1000, 3),
+            "samples": sum(self.stacks.values()),
+            "sql_count": self.sql_count,
+            "sql_ms": round(self.sql_seconds * 1000, 3),
+        }
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    profile = getattr(_local, "profile", None)
+    if profile is not None:
+        profile.sql_count += 1
+        _local.sql_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    profile = getattr(_local, "profile", None)
+    if profile is not None:
+        profile.sql_seconds += time.perf_counter() - _local.sql_start
+
+
+class Profiler:
+    """
+    WSGI middleware profiling the requests that ask for it
+    """
+
+    def __init__(
+        self,
+        wsgi_app,
+        admin_keys,
+        directory: str,
+        sample_rate: float = 0,
+        interval: float = 0.001,
+        keep: int = 100,
+    ):
+        self.wsgi_app = wsgi_app
+        self.admin_keys = [key.encode() for key in admin_keys]
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def is_admin(self, key: str) -> bool:
+        key = (key or "").encode()
+        return any(hmac.compare_digest(key, admin) for admin in self.admin_keys)
+
+    def __call__(self, environ, start_response):
+        requested = (
+            "HTTP_X_PROFILE" in environ
+            and not environ.get("PATH_INFO", "").startswith("/profiles")
+            and self.is_admin(environ["HTTP_X_PROFILE"])
+        )
+        if not requested and not (
+            self.sample_rate and _random.random() < self.sample_rate
+        ):
+            return self.wsgi_app(environ, start_response)
+
+        profile = _local.profile = Profile(environ, self.interval)
+
+        def profiled_start_response(status, headers, exc_info=None):
+            # Flask starts the response once the body is built
+            summary = profile.finish(status)
+            self._store(profile, summary)
+            if requested:
+                headers.append(("X-Profile-Id", profile.id))
+                headers.append(
+                    (
+                        "Server-Timing",
+                        f'app;dur={summary["ms"]}, '
+                        f'sql;desc="{summary["sql_count"]} queries";'
+                        f'dur={summary["sql_ms"]}',
+                    )
+                )
+            return start_response(status, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, profiled_start_response)
+        finally:
+            _local.profile = None
+            # in case the response was never started
+            profile.stop()
+
+    def _store(self, profile: Profile, summary: dict):
+        path = os.path.join(self.directory, profile.id)
+        with open(f"{path}.folded", "w") as out:
+            out.write(profile.folded())
+        with open(f"{path}.json", "w") as out:
+            json.dump(summary, out)
+        self._prune()
+
+    def _summaries(self):
+        names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        modified = {}
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                modified[path] = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue  # pruned by another worker
+        return sorted(modified, key=modified.get, reverse=True)
+
+    def _prune(self):
+        for path in self._summaries()[self.keep :]:
+            for name in (path, path[: -len(".json")] + ".folded"):
+                try:
+                    os.remove(name)
+                except FileNotFoundError:
+                    pass  # pruned by another worker
+
+    def _authorize(self):
+        if not self.is_admin(request.headers.get("X-Profile")):
+            abort(403)
+
+    def list_profiles(self):
+        self._authorize()
+        summaries = []
+        for path in self._summaries():
+            try:
+                with open(path) as summary:
+                    summaries.append(json.load(summary))
+            except (FileNotFoundError, ValueError):
+                continue
+        return {"profiles": summaries}
+
+    def get_profile(self, profile_id: str):
+        self._authorize()
+        try:
+            # ids are hex, so this can't leave the directory
+            with open(
+                os.path.join(self.directory, f"{uuid.UUID(profile_id).hex}.folded")
+            ) as folded:
+                return Response(folded.read(), mimetype="text/plain")
+        except (ValueError, FileNotFoundError):
+            abort(404)
+
+
+def init_app(app):
+    """
+    Install the profiler when `PROFILING_ADMIN_KEYS` is configured
+    """
+    admin_keys = [key for key in app.config.get("PROFILING_ADMIN_KEYS", []) if key]
+    if not admin_keys:
+        return None
+
+    profiler = Profiler(
+        app.wsgi_app,
+        admin_keys,
+        app.config["PROFILING_DIR"],
+        app.config["PROFILING_SAMPLE_RATE"],
+        app.config["PROFILING_INTERVAL_MS"] / 1000,
+        app.config["PROFILING_KEEP"],
+    )
+    app.wsgi_app = profiler
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    app.add_url_rule("/profiles", "profiles", profiler.list_profiles)
+    app.add_url_rule("/profiles/<profile_id>", "profile", profiler.get_profile)
+    return profiler
@@ -0,0 +1,111 @@
+# server/auth/proxy.py
+"""
+Routes in front of the GDrive and Qualtrix microservices: survey responses
+are queued for delivery to GDrive (see `auth.outbox`) and redirects are
+forwarded to Qualtrix. Both are limited by bulkheads (see `auth.bulkhead`)
+so they can't take every worker thread from the token routes.
+"""
+
+import logging
+from typing import Optional
+
+import flask_pydantic
+import requests
+from flask import Blueprint
+from flask_cors import CORS
+from pydantic import BaseModel
+
+from auth import bulkhead, outbox
+from auth.access import rate_limit, req_auth
+from auth.main import config
+from auth.responses import Responses
+from auth.upstream import CircuitOpenError, Upstream
+
+gdrive_blueprint = Blueprint("gdrive", __name__)
+redirect_blueprint = Blueprint("redirect", __name__)
+
+CORS_ORIGINS = ["https://feedback.gsa.gov"]
+CORS(redirect_blueprint, origins=CORS_ORIGINS)
+
+gdrive_blueprint.before_request(rate_limit)
+
+bulkheads = bulkhead.from_config(config)
+for blueprint in (gdrive_blueprint, redirect_blueprint):
+    # the blueprint's own limit first, so a request queued on it holds no
+    # shared slot
+    bulkhead.guard(
+        blueprint,
+        *[
+            limit
+            for limit in (bulkheads.get(blueprint.name), bulkheads["upstream"])
+            if limit is not None
+        ],
+    )
+
+qualtrix = Upstream.from_config(
+    "qualtrix", config["QUALTRIX_APP_HOST"], config["QUALTRIX_APP_PORT"], config
+)
+
+
+class SurveyParticipantModel(BaseModel):
+    """
+    Request body format for the `/survey-response` endpoint
+    """
+
+    surveyId: str
+    responseId: str
+    participant: Optional[dict] = None
+
+
+@gdrive_blueprint.route("/survey-response", methods=["POST"])
+@flask_pydantic.validate()
+@req_auth.login_required
+def export(body: SurveyParticipantModel):
+    """
+    GDrive microservice interface
+    """
+
+    # delivered to GDrive in the background by the outbox dispatcher
+    try:
+        outbox.enqueue(body.model_dump_json())
+    except Exception as e:
+        print(e)
+        return Responses.error()
+    return "Response ID successfully posted", 200
+
+
+class RedirectModel(BaseModel):
+    """
+    Request body format for the `/redirect` endpoint
+    """
+
+    surveyId: str
+    targetSurveyId: str
+    RulesConsentID: str  # Client dependent
+    SurveyswapID: str  # Client dependent
+    SurveyswapGroup: str  # Client dependent
+    utm_campaign: str
+    utm_medium: str
+    utm_source: str
+    email: str
+    firstName: str
+    lastName: str
+
+
+@redirect_blueprint.route("/", methods=["POST"])
+@flask_pydantic.validate()
+def get_redirect(body: RedirectModel):
+    logging.info(
+        f"Redirect request ({body.targetSurveyId}, {body.email}) routing to Qualtrix"
+    )
+
+    try:
+        resp = qualtrix.post("/redirect", data=body.model_dump_json())
+    except CircuitOpenError:
+        return Responses.unavailable(qualtrix.name)
+    except requests.RequestException:
+        return Responses.bad_gateway(qualtrix.name)
+
+    logging.info(f"Qualtrix Request returned with status code {resp.status_code}")
+
+    return resp.json(), resp.status_code
@@ -0,0 +1,173 @@
+# server/auth/ratelimit.py
+"""
+Per-API-key rate limiting.
+
+Every API key gets a token bucket per route: it holds up to `burst`
+requests and refills at `rate` requests per second. Buckets live in process
+memory by default, so each worker process enforces the limit on its own and
+a key can make the configured rate times the number of processes; with a
+Redis URL configured the buckets are shared and the limit holds across all
+workers and instances.
+
+API keys are never used as-is outside this module. Limits and counters are
+keyed by `fingerprint(api_key)`, so they can be configured and exposed
+without handling the key itself.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+# refill and take one token atomically, using the Redis clock so instances
+# don't need synchronized clocks. Returns the seconds to wait, 0 if allowed.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class Limit(NamedTuple):
+    rate: float  # requests per second, 0 for unlimited
+    burst: float
+
+
+def fingerprint(api_key: str) -> str:
+    """
+    Short, stable identifier of an API key
+    """
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by API key fingerprint and route.
+
+    `limits` overrides the default limit, looked up in the order
+    `"<fingerprint>:<endpoint>"`, `"<fingerprint>"`, `"*:<endpoint>"`.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        limits: Optional[Dict[str, Limit]] = None,
+        redis_url: Optional[str] = None,
+    ):
+        self.default = Limit(rate, max(burst, 1))
+        self.limits = limits or {}
+        self._buckets = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._take_shared = None
+        if redis_url:
+            # optional dependency, only needed for the shared backend
+            import redis
+
+            self._take_shared = redis.Redis.from_url(redis_url).register_script(
+                _TAKE_SCRIPT
+            )
+
+    @classmethod
+    def from_config(cls, config):
+        limits = {
+            name: Limit(float(limit["rate"]), float(limit.get("burst", limit["rate"])))
+            for name, limit in json.loads(config.get("RATE_LIMITS") or "{}").items()
+        }
+        return cls(
+            config.get("RATE_LIMIT_RATE", 0),
+            config.get("RATE_LIMIT_BURST", 1),
+            limits,
+            config.get("RATE_LIMIT_REDIS_URL"),
+        )
+
+    def limit_for(self, key_id: str, endpoint: str) -> Limit:
+        for name in (f"{key_id}:{endpoint}", key_id, f"*:{endpoint}"):
+            if name in self.limits:
+                return self.limits[name]
+        return self.default
+
+    def _take_local(self, bucket: str, limit: Limit) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(bucket, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+        if tokens >= 1:
+            self._buckets[bucket] = (tokens - 1, now)
+            return 0.0
+        self._buckets[bucket] = (tokens, now)
+        return (1 - tokens) / limit.rate
+
+    def acquire(self, api_key: str, endpoint: str) -> float:
+        """
+        Take one request from the bucket of `api_key` on `endpoint`. Returns
+        0 when the request may go ahead, otherwise the seconds until it would
+        be allowed.
+        """
+        key_id = fingerprint(api_key)
+        limit = self.limit_for(key_id, endpoint)
+        if limit.rate <= 0:
+            return 0.0
+
+        bucket = f"{key_id}:{endpoint}"
+        wait = None
+        if self._take_shared is not None:
+            try:
+                wait = float(
+                    self._take_shared(
+                        keys=[f"token-service:ratelimit:{bucket}"],
+                        args=[limit.rate, limit.burst],
+                    )
+                )
+            except Exception as err:
+                # fall back to this instance's buckets rather than failing open
+                logging.warning("Rate limit backend unavailable: %s", err)
+
+        with self._lock:
+            if wait is None:
+                wait = self._take_local(bucket, limit)
+            counters = self._counters.setdefault(key_id, {"allowed": 0, "limited": 0})
+            counters["limited" if wait else "allowed"] += 1
+        return wait
+
+    def clear(self):
+        """
+        Drop the local buckets and reset the counters
+        """
+        with self._lock:
+            self._buckets.clear()
+            self._counters.clear()
+
+    def stats(self, key_id: Optional[str] = None) -> dict:
+        """
+        Allowed and limited request counts per API key fingerprint, or for
+        one fingerprint
+        """
+        with self._lock:
+            if key_id is not None:
+                return dict(self._counters.get(key_id, {"allowed": 0, "limited": 0}))
+            return {key: dict(counters) for key, counters in self._counters.items()}
+
+
+def retry_after(wait: float) -> int:
+    """
+    `Retry-After` header value, in whole seconds
+    """
+    return max(1, math.ceil(wait))
@@ -0,0 +1,145 @@
+# server/auth/replica.py
+"""
+Read-replica routing.
+
+When a `replica` bind is configured (`SQLALCHEMY_BINDS`, filled from the
+`DB_REPLICA_SERVICE` RDS instance or `IDVA_DB_REPLICA_CONN_STR`), the
+read-only routes, validate and state, run their lookups on the replica
+instead of the primary's pool. A lookup goes to the primary instead when:
+
+- it runs outside `reads()`, e.g. as part of a write or a background job;
+- the client asked for read-after-write consistency (`X-Consistency: strong`);
+- the replica lags the primary by more than `DB_REPLICA_MAX_LAG` seconds;
+- the replica can't be reached. It is then left alone until the next check.
+
+A lookup that finds fewer rows on the replica than it asked for is repeated
+on the primary, since the missing tokens may just not have been replayed
+yet. A missing token is therefore always confirmed by the primary.
+
+Replication lag is measured at most every `DB_REPLICA_CHECK_INTERVAL`
+seconds per process.
+"""
+
+import contextlib
+import contextvars
+import logging
+import time
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from auth import metrics
+from auth.main import db
+
+BIND = "replica"
+
+# replay lag in seconds, 0 on a primary and on a standby that has replayed
+# everything it received (an idle primary sends nothing to replay)
+_LAG = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+    """
+)
+
+_eligible = contextvars.ContextVar("replica_eligible", default=False)
+_consistent = contextvars.ContextVar("replica_consistent", default=False)
+
+
+class Replica:
+    """
+    Decides per lookup whether the replica may serve it
+    """
+
+    def __init__(self, max_lag: float, check_interval: float):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag = None
+        self._usable = False
+        self._checked_at = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["DB_REPLICA_MAX_LAG"], config["DB_REPLICA_CHECK_INTERVAL"])
+
+    @staticmethod
+    def engine():
+        return db.engines.get(BIND)
+
+    def _check(self, engine) -> bool:
+        try:
+            with engine.connect() as connection:
+                lag = (
+                    connection.execute(_LAG).scalar()
+                    if engine.dialect.name == "postgresql"
+                    else 0
+                )
+        except SQLAlchemyError as err:
+            logging.warning("Read replica unavailable: %s", err)
+            self.lag = None
+            return False
+        self.lag = float(lag or 0)
+        if self.lag > self.max_lag:
+            logging.warning("Read replica lagging by %.1fs", self.lag)
+            return False
+        return True
+
+    def usable(self) -> bool:
+        engine = self.engine()
+        if engine is None:
+            return False
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            # concurrent checks are harmless, the last one wins
+            self._checked_at = now
+            self._usable = self._check(engine)
+        return self._usable
+
+    def mark_unusable(self):
+        self._usable = False
+        self._checked_at = time.monotonic()
+
+    def execute(self, statement, complete: Callable[[list], bool] = None):
+        """
+        Run a read-only `statement` on the replica when this lookup may use
+        it, otherwise (or if the replica fails) on the primary. Returns the
+        rows. Rows that `complete` finds lacking are read again from the
+        primary.
+        """
+        if _eligible.get() and self.usable():
+            try:
+                with self.engine().connect() as connection:
+                    rows = connection.execute(statement).all()
+                metrics.DB_READS.labels(BIND).inc()
+                if complete is None or complete(rows):
+                    return rows
+            except SQLAlchemyError as err:
+                logging.warning("Read replica failed, using the primary: %s", err)
+                self.mark_unusable()
+        metrics.DB_READS.labels("primary").inc()
+        return db.session.execute(statement).all()
+
+
+@contextlib.contextmanager
+def reads(consistent: bool = False):
+    """
+    Let the lookups in this block use the replica, unless `consistent`
+    """
+    eligible = _eligible.set(not consistent)
+    strong = _consistent.set(consistent)
+    try:
+        yield
+    finally:
+        _consistent.reset(strong)
+        _eligible.reset(eligible)
+
+
+def consistent() -> bool:
+    """
+    Whether the client asked to see its own writes, see `reads`
+    """
+    return _consistent.get()
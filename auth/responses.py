@@ -1,6 +1,52 @@
 # server/auth/responses.py
+"""
+Token responses. Constant bodies are serialized once at import time and
+only wrapped in a new `Response` per request; the few dynamic bodies go
+through `dumps`, which uses `orjson` when it is installed.
+"""
 
-from flask import make_response, jsonify
+import json
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def dumps(body) -> bytes:
+    """
+    Serialize `body` to compact JSON bytes. UUIDs are written as strings.
+    """
+    if orjson is not None:
+        return orjson.dumps(body)
+    return json.dumps(body, separators=(",", ":"), default=str).encode()
+
+
+# body and status code of each token response, keyed by `Responses` method
+BODIES = {
+    "exist": ({"status": "success", "message": "Token exists"}, 200),
+    "refresh": ({"status": "success", "message": "Token successfully invoked"}, 200),
+    "exhaust": ({"status": "success", "message": "Token successfully exhausted"}, 200),
+    "error": (
+        {"status": "fail", "message": "Some error occurred. Please try again."},
+        401,
+    ),
+    "expired": ({"status": "fail", "message": "Token expired"}, 403),
+    "exhausted": ({"status": "fail", "message": "Token exhausted"}, 403),
+    "not_exist": ({"status": "fail", "message": "Bad token"}, 400),
+    "unauthorized": ({"status": "fail", "message": "Unauthorized"}, 403),
+    "ok": ({"status": "ok"}, 200),
+    "too_many_requests": ({"status": "fail", "message": "Too many requests"}, 429),
+}
+
+# serialized BODIES, except `exhausted` which carries the token state
+PAYLOADS = {name: dumps(body) for name, (body, _) in BODIES.items()}
+
+
+def _response(payload: bytes, status: int):
+    return Response(payload, status=status, mimetype="application/json"), status
 
 
 class Responses:
@@ -8,73 +54,122 @@ class Responses:
     Functions that generate and return specific http responses
     """
 
+    def body(name: str, state: str = None):
+        """
+        Body and status code of the `name` response, without building it
+        """
+        body, status = BODIES[name]
+        if name == "exhausted":
+            body = {**body, "state": state}
+        return body, status
+
+    def _make(name: str):
+        return _response(PAYLOADS[name], BODIES[name][1])
+
+    def json(body, status: int):
+        return _response(dumps(body), status)
+
     def exist():
-        return (
-            make_response(jsonify({"status": "success", "message": "Token exists"})),
-            200,
-        )
+        return Responses._make("exist")
 
     def refresh():
-        return (
-            make_response(
-                jsonify({"status": "success", "message": "Token successfully invoked"})
-            ),
-            200,
-        )
+        return Responses._make("refresh")
 
     def exhaust():
-        return (
-            make_response(
-                jsonify(
-                    {"status": "success", "message": "Token successfully exhausted"}
-                )
-            ),
-            200,
-        )
+        return Responses._make("exhaust")
 
     def error():
-        return (
-            make_response(
-                jsonify(
-                    {
-                        "status": "fail",
-                        "message": "Some error occurred. Please try again.",
-                    }
-                )
-            ),
-            401,
+        return Responses._make("error")
+
+    def ok():
+        return Responses._make("ok")
+
+    def registered(auth_token, replayed: bool = False):
+        response, status = Responses.json(
+            {
+                "status": "success",
+                "message": "Successfully registered.",
+                "auth_token": auth_token,
+            },
+            201,
         )
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return response, status
 
-    def expired():
-        return (
-            make_response(jsonify({"status": "fail", "message": "Token expired"})),
-            403,
+    def invalid_idempotency_key(limit: int):
+        return Responses.json(
+            {
+                "status": "fail",
+                "message": f"Idempotency-Key must be 1 to {limit} characters",
+            },
+            400,
         )
 
-    def exhausted(state: str):
-        return (
-            make_response(
-                jsonify(
-                    {"status": "fail", "message": "Token exhausted", "state": state}
-                )
-            ),
-            403,
+    def imported(report: dict):
+        return Responses.json({"status": "success", **report}, 200)
+
+    def invalid_import(message: str):
+        return Responses.json({"status": "fail", "message": message}, 400)
+
+    def batch_too_large(limit: int):
+        return Responses.json(
+            {
+                "status": "fail",
+                "message": f"Batch size exceeds the maximum of {limit}",
+            },
+            400,
         )
 
+    def batch(results: list):
+        return Responses.json({"status": "ok", "results": results}, 200)
+
+    def expired():
+        return Responses._make("expired")
+
+    def exhausted(state: str):
+        return Responses.json(*Responses.body("exhausted", state))
+
     def state(state: str):
-        return (
-            make_response(jsonify({"status": "ok", "state": state})),
+        return Responses.json({"status": "ok", "state": state}, 200)
+
+    def state_change(status, changed: bool):
+        state, exhausted = status
+        return Responses.json(
+            {
+                "status": "ok",
+                "state": state,
+                "exhausted": exhausted,
+                "changed": changed,
+            },
             200,
         )
 
     def not_exist():
-        return (
-            make_response(jsonify({"status": "fail", "message": "Bad token"})),
-            400,
+        return Responses._make("not_exist")
+
+    def unavailable(service: str):
+        return Responses.json(
+            {"status": "fail", "message": f"{service} unavailable"}, 503
         )
 
-    def unauthorized():
-        return (
-            make_response(jsonify({"status": "fail", "message": "Unauthorized"})),
-            403,
+    def overloaded(name: str, retry_after: int):
+        response, status = Responses.json(
+            {"status": "fail", "message": f"Too many concurrent {name} requests"},
+            503,
         )
+        response.headers["Retry-After"] = str(retry_after)
+        return response, status
+
+    def bad_gateway(service: str):
+        return Responses.json(
+            {"status": "fail", "message": f"{service} request failed"}, 502
+        )
+
+    def too_many_requests(retry_after: int):
+        response, status = Responses._make("too_many_requests")
+        response.headers["Retry-After"] = str(retry_after)
+        return response, status
+
+    def unauthorized():
+        return Responses._make("unauthorized")
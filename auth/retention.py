@@ -0,0 +1,204 @@
+# server/auth/retention.py
+"""
+Token retention.
+
+Expired and exhausted tokens are deleted (or moved to `tokens_archive`) once
+they are older than the configured grace period, and idempotency keys once
+their window has passed. Rows are removed in small
+keyset-paginated batches, each in its own short transaction, and rows locked
+by in-flight requests are skipped rather than waited on. On Postgres each
+batch is one statement and an advisory lock keeps a single purge running;
+other databases select, copy and delete the batch in separate statements.
+"""
+
+import datetime
+import logging
+import time
+
+from sqlalchemy import delete, insert, literal, select, text, tuple_
+
+from auth import worker
+from auth.main import db, config
+from auth.models import IdempotencyKey, Token, TokenArchive
+from auth.portable import UTCDateTime, is_postgres, utcnow
+
+# arbitrary key for the advisory lock that keeps one purge running at a time
+LOCK_KEY = 0x746F6B656E73
+
+_ARCHIVED = [column.name for column in Token.__table__.columns]
+
+
+def _batch(connection, column, conditions, last, batch_size, archive):
+    """
+    Delete (and optionally archive) the next batch of rows ordered by
+    `(column, id)` after `last`. Returns the removed `(column, id)` keys.
+    """
+    if last is not None:
+        conditions = conditions + (tuple_(column, Token.id) > tuple_(*last),)
+    batch = (
+        select(Token.id, column.label("key"))
+        .where(*conditions)
+        .order_by(column, Token.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    if not is_postgres():
+        return _batch_portable(connection, batch, archive)
+
+    batch = batch.cte("batch")
+    gone = (
+        delete(Token.__table__)
+        .where(Token.id == batch.c.id)
+        .returning(*Token.__table__.columns, batch.c.key)
+        .cte("gone")
+    )
+    statement = select(gone.c.key, gone.c.id).order_by(gone.c.key, gone.c.id)
+    if archive:
+        archived = insert(TokenArchive).from_select(
+            _ARCHIVED + ["archived_on"],
+            select(
+                *[gone.c[name] for name in _ARCHIVED],
+                literal(utcnow(), UTCDateTime),
+            ),
+        )
+        statement = statement.add_cte(archived.cte("archived"))
+
+    keys = connection.execute(statement).all()
+    connection.commit()
+    return keys
+
+
+def _batch_portable(connection, batch, archive):
+    keys = connection.execute(batch).all()
+    if keys:
+        ids = [token_id for token_id, _ in keys]
+        if archive:
+            connection.execute(
+                insert(TokenArchive).from_select(
+                    _ARCHIVED + ["archived_on"],
+                    select(
+                        *Token.__table__.columns, literal(utcnow(), UTCDateTime)
+                    ).where(Token.id.in_(ids)),
+                )
+            )
+        connection.execute(delete(Token.__table__).where(Token.id.in_(ids)))
+    connection.commit()
+    return [(key, token_id) for token_id, key in keys]
+
+
+def _purge_keys(connection, batch_size: int) -> int:
+    """
+    Delete idempotency keys past their window, in batches
+    """
+    removed = 0
+    while True:
+        expired = (
+            select(IdempotencyKey.key)
+            .where(IdempotencyKey.expires_on < utcnow())
+            .limit(batch_size)
+        )
+        count = connection.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired))
+        ).rowcount
+        connection.commit()
+        removed += count
+        if count < batch_size:
+            return removed
+
+
+def purge(
+    grace_seconds: int = None,
+    batch_size: int = None,
+    archive: bool = None,
+    pause: float = 0,
+) -> dict:
+    """
+    Remove tokens that expired, or were exhausted, more than `grace_seconds`
+    ago. Returns the number of rows removed and the rate they were removed at.
+    """
+    if grace_seconds is None:
+        grace_seconds = config["RETENTION_GRACE_SECONDS"]
+    if batch_size is None:
+        batch_size = config["RETENTION_BATCH_SIZE"]
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive")
+    if archive is None:
+        archive = config["RETENTION_ARCHIVE"]
+
+    cutoff = utcnow() - datetime.timedelta(seconds=grace_seconds)
+    passes = (
+        (Token.expires_on, (Token.expires_on < cutoff,)),
+        (
+            Token.exhausted_on,
+            (Token.exhausted.is_(True), Token.exhausted_on < cutoff),
+        ),
+    )
+
+    removed = 0
+    start = time.perf_counter()
+    with db.engine.connect() as connection:
+        locking = is_postgres()
+        if (
+            locking
+            and not connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": LOCK_KEY}
+            ).scalar()
+        ):
+            logging.info("Token purge already running elsewhere, skipping")
+            return {
+                "removed": 0,
+                "seconds": 0.0,
+                "rows_per_second": 0.0,
+                "idempotency_keys": 0,
+            }
+        connection.commit()
+
+        try:
+            for column, conditions in passes:
+                last = None
+                while True:
+                    keys = _batch(
+                        connection, column, conditions, last, batch_size, archive
+                    )
+                    if not keys:
+                        break
+                    removed += len(keys)
+                    last = tuple(keys[-1])
+                    if pause:
+                        time.sleep(pause)
+            expired_keys = _purge_keys(connection, batch_size)
+        finally:
+            if locking:
+                # a failed batch leaves its transaction aborted
+                connection.rollback()
+                connection.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY}
+                )
+                connection.commit()
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "removed": removed,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(removed / seconds, 1) if seconds else 0.0,
+        "idempotency_keys": expired_keys,
+    }
+    logging.info(
+        "Token purge %s %d rows in %.3fs (%.1f rows/s)",
+        "archived" if archive else "deleted",
+        removed,
+        seconds,
+        stats["rows_per_second"],
+    )
+    return stats
+
+
+def start_worker(app):
+    """
+    Run `purge` every `RETENTION_INTERVAL` seconds on a daemon thread
+    """
+
+    def task():
+        purge()
+
+    return worker.start(app, "token-retention", app.config["RETENTION_INTERVAL"], task)
@@ -0,0 +1,143 @@
+# server/auth/runtime.py
+"""
+Process lifecycle helpers used by `gunicorn.conf.py`.
+
+Nothing here imports the application at module level, so the gunicorn
+config can size the server before the app is loaded.
+"""
+
+import logging
+import os
+import time
+
+from sqlalchemy import text
+
+# resident memory of one worker, used to decide how many fit in the instance
+WORKER_MEMORY_MB = 48
+
+
+def memory_limit_mb(default: int = 512) -> int:
+    """
+    Instance memory in MB from Cloud Foundry's `MEMORY_LIMIT` (e.g. `128m`,
+    `1G`)
+    """
+    value = os.getenv("MEMORY_LIMIT", "").strip().upper().rstrip("B")
+    units = {"K": 1 / 1024, "M": 1, "G": 1024}
+    try:
+        if value and value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value)
+    except ValueError:
+        return default
+
+
+def cpu_count() -> int:
+    """
+    CPUs this process may run on, which inside a container can be fewer
+    than the host has
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def worker_count(memory_mb: int, cpus: int, worker_memory_mb: int) -> int:
+    """
+    The usual `2 * cpus + 1` workers, capped by how many fit in memory
+    """
+    return max(1, min(2 * cpus + 1, memory_mb // worker_memory_mb))
+
+
+def warm_pool(app, connections: int):
+    """
+    Open `connections` database connections and return them to the pool so
+    the first requests on a new worker don't pay for the connect
+    """
+    from auth.main import db
+
+    start = time.perf_counter()
+    with app.app_context():
+        opened = []
+        try:
+            for _ in range(connections):
+                conn = db.engine.connect()
+                opened.append(conn)
+                conn.exec_driver_sql("SELECT 1")
+        except Exception as err:
+            logging.warning("Database pool warmup failed: %s", err)
+        finally:
+            for conn in opened:
+                conn.close()
+    logging.info(
+        "Warmed %d database connections in %.3fs",
+        len(opened),
+        time.perf_counter() - start,
+    )
+    return len(opened)
+
+
+def ready() -> bool:
+    """
+    Whether the database and, when the token routes are served, the token
+    backend answer a trivial query
+    """
+    from flask import current_app
+
+    from auth.main import db
+
+    try:
+        db.session.execute(text("SELECT 1"))
+        if "auth" not in current_app.blueprints:
+            return True
+        from auth import store
+
+        return store.backend.ping()
+    except Exception as err:
+        logging.warning("Readiness check failed: %s", err)
+        db.session.rollback()
+        return False
+
+
+def start_background_workers(app):
+    """
+    Start the retention and outbox workers that are enabled in the config
+    and the token change listener, each only where the routes that need it
+    are served
+    """
+    # only the sql token backend needs purging, the others expire tokens
+    sql_backend = (app.config.get("TOKEN_BACKEND") or "sql") == "sql"
+    if (
+        "auth" in app.blueprints
+        and sql_backend
+        and app.config.get("RETENTION_INTERVAL")
+    ):
+        from auth import retention
+
+        retention.start_worker(app)
+
+    if "auth" in app.blueprints and sql_backend:
+        from auth import changes
+
+        # drops cached token results when another process imports tokens
+        with app.app_context():
+            changes.hub.listen(app)
+
+    if "gdrive" in app.blueprints and app.config.get("OUTBOX_DISPATCH_INTERVAL"):
+        from auth import outbox
+
+        outbox.start_worker(app)
+
+
+def after_fork(app):
+    """
+    Prepare a freshly forked worker: drop any connections inherited from the
+    parent, warm the pool and start background workers, which don't survive
+    a fork
+    """
+    with app.app_context():
+        from auth.main import db
+
+        db.engine.dispose(close=False)
+    warm_pool(app, app.config.get("DB_WARM_CONNECTIONS", 1))
+    start_background_workers(app)
@@ -0,0 +1,360 @@
+# server/auth/store.py
+"""
+Token store.
+
+The public token API used by the routes. Rows are kept by the storage
+backend selected with `TOKEN_BACKEND` (see `auth.backends`), each of which
+resolves a lifecycle step (validate, invoke, exhaust) for one token or a
+whole batch atomically.
+
+Terminal results (expired, exhausted) are kept in a `TerminalCache` so
+repeat validations of dead tokens never reach the backend. Invoke, exhaust
+and reads that asked for strong consistency always go to the backend. Missing tokens are
+remembered for `TOKEN_CACHE_MISSING_TTL` seconds only, since an import or a
+replica catching up can still make them appear.
+
+Tokens can also be issued in the signed format (see `auth.signing`). Their
+signature and expiry are checked before the backend is asked, so forged and
+expired tokens never reach it either.
+
+`watch` lets a request wait for a token's state to change, woken by the
+notifications of `auth.changes`.
+"""
+
+import datetime
+import time
+import uuid
+from typing import Iterable, List, Optional, Tuple, Union
+
+from flask import current_app
+
+from auth import backends, bulkhead, changes, metrics, replica, signing
+from auth.backends import Outcome, Result
+from auth.cache import TerminalCache
+from auth.main import config
+from auth.models import new_token_id
+from auth.portable import utcnow
+
+# outcomes a token can never leave, and so are safe to cache
+TERMINAL = (Outcome.EXHAUSTED, Outcome.EXPIRED)
+
+backend = backends.from_config(config)
+terminal_cache = TerminalCache.from_config(config)
+signer = signing.Signer.from_config(config)
+# imports by other processes rewrite tokens, see `auth.changes`
+changes.hub.on_flush(terminal_cache.clear)
+
+# a parsed token: the id of a plain token, or the claims of a signed one
+Parsed = Union[uuid.UUID, signing.Claims]
+
+
+def _recall(token_id: uuid.UUID) -> Optional[Result]:
+    value = terminal_cache.get(str(token_id))
+    if value is None:
+        return None
+    outcome, _, token_state = value.partition(":")
+    if outcome == Outcome.EXHAUSTED.value:
+        return Result(Outcome.EXHAUSTED, token_state)
+    return Result(Outcome(outcome))
+
+
+def _remember(token_id: uuid.UUID, result: Result):
+    if result.outcome is Outcome.EXHAUST:
+        result = Result(Outcome.EXHAUSTED, result.state)
+    if result.outcome in TERMINAL:
+        terminal_cache.put(
+            str(token_id), f"{result.outcome.value}:{result.state or ''}"
+        )
+    elif result.outcome is Outcome.NOT_EXIST:
+        terminal_cache.put(
+            str(token_id),
+            f"{result.outcome.value}:",
+            config.get("TOKEN_CACHE_MISSING_TTL", 5),
+        )
+
+
+def _recalls() -> bool:
+    """
+    Whether a read may be answered from the terminal cache: not when the
+    client asked to see its own writes
+    """
+    return not replica.consistent()
+
+
+def _cached(token_ids: List[uuid.UUID], run, recall: bool = True) -> List[Result]:
+    """
+    Answer what we can from the terminal cache, unless not `recall`, and
+    `run` the rest against the backend, remembering any new terminal results.
+    """
+    results = {}
+    misses = []
+    for token_id in dict.fromkeys(token_ids):
+        cached = _recall(token_id) if recall else None
+        if cached is None:
+            misses.append(token_id)
+        else:
+            results[token_id] = cached
+
+    if misses:
+        found = run(misses)
+        for token_id in misses:
+            result = found.get(token_id, Result(Outcome.NOT_EXIST))
+            _remember(token_id, result)
+            results[token_id] = result
+
+    return [results[token_id] for token_id in token_ids]
+
+
+def parse(token) -> Parsed:
+    """
+    Parse a token as given by a client; raises ValueError for malformed ids
+    and for signed tokens that fail verification
+    """
+    if isinstance(token, (uuid.UUID, signing.Claims)):
+        return token
+    if signing.is_signed(token):
+        return signer.verify(token)
+    return uuid.UUID(token)
+
+
+def _id(token: Parsed) -> uuid.UUID:
+    return token.id if isinstance(token, signing.Claims) else token
+
+
+def _stateless(
+    operation: str, tokens: List[Parsed], run, trust_signed=False, recall=True
+) -> List[Result]:
+    """
+    Settle what the signed tokens' claims can settle, expiry and, when
+    `trust_signed` is set, existence, and pass the remaining ids to
+    `_cached(ids, run, recall)`
+    """
+    now = utcnow()
+    results = {}
+    pending = []
+    for token in tokens:
+        if not isinstance(token, signing.Claims):
+            pending.append(token)
+        elif token.expires_on < now:
+            results[token.id] = Result(Outcome.EXPIRED)
+        elif trust_signed:
+            results[token.id] = Result(Outcome.EXIST)
+        else:
+            pending.append(token.id)
+
+    if pending:
+        results.update(zip(pending, _cached(pending, run, recall)))
+    results = [results[_id(token)] for token in tokens]
+    for result in results:
+        metrics.TOKEN_OPERATIONS.labels(operation, result.outcome.value).inc()
+    return results
+
+
+def register(seconds: int, uses: int, signed: bool = False) -> Union[uuid.UUID, str]:
+    """
+    Create a token and return its id, or the signed token when `signed`
+    """
+    return register_many([(seconds, uses)], signed)[0]
+
+
+def register_many(
+    specs: Iterable[Tuple[int, int]], signed: bool = False
+) -> List[Union[uuid.UUID, str]]:
+    """
+    Create one token per `(seconds, uses)` spec in a single multi-row insert
+    and transaction. Signed tokens get a row as well, which is what invoke
+    and exhaust act on.
+    """
+    rows = _rows(specs, signed)
+    backend.insert(rows)
+    metrics.TOKENS_REGISTERED.labels("signed" if signed else "uuid").inc(len(rows))
+    return _issue(rows, signed)
+
+
+def register_once(
+    key: str, seconds: int, uses: int, signed: bool = False
+) -> Tuple[Union[uuid.UUID, str], bool]:
+    """
+    `register`, unless a token was already issued for `key` in the last
+    `IDEMPOTENCY_WINDOW` seconds. Returns the token and whether it is that
+    earlier one, in which case nothing was inserted.
+    """
+    rows = _rows([(seconds, uses)], signed)
+    token = _issue(rows, signed)[0]
+    issued = backend.insert_once(
+        key,
+        rows,
+        str(token),
+        utcnow() + datetime.timedelta(seconds=config["IDEMPOTENCY_WINDOW"]),
+    )
+    if issued is not None:
+        return issued, True
+    metrics.TOKENS_REGISTERED.labels("signed" if signed else "uuid").inc()
+    return token, False
+
+
+def _rows(specs: Iterable[Tuple[int, int]], signed: bool) -> List[dict]:
+    """
+    New token rows. Ids are generated up front so nothing is read back.
+    """
+    if signed and not signer.enabled:
+        raise ValueError("No token signing keys configured")
+    now = utcnow()
+    return [
+        {
+            "id": new_token_id(),
+            "registered_on": now,
+            "expires_on": now + datetime.timedelta(seconds=seconds),
+            "refresh": uses,
+        }
+        for seconds, uses in specs
+    ]
+
+
+def _issue(rows: List[dict], signed: bool) -> List[Union[uuid.UUID, str]]:
+    if signed:
+        return [
+            signer.sign(row["id"], row["expires_on"], row["refresh"]) for row in rows
+        ]
+    return [row["id"] for row in rows]
+
+
+def state(token_id) -> Optional[str]:
+    """
+    Return the token state, or None if the token does not exist
+    """
+    token_id = _id(parse(token_id))
+    cached = _recall(token_id) if _recalls() else None
+    if cached is not None and cached.outcome is not Outcome.EXPIRED:
+        return cached.state if cached.outcome is Outcome.EXHAUSTED else None
+    return backend.state(token_id)
+
+
+def status(token_id) -> Optional[Tuple[str, bool]]:
+    """
+    Return the token state and whether it is exhausted, or None if the token
+    does not exist
+    """
+    token_id = _id(parse(token_id))
+    cached = _recall(token_id) if _recalls() else None
+    if cached is not None and cached.outcome is not Outcome.EXPIRED:
+        return (cached.state, True) if cached.outcome is Outcome.EXHAUSTED else None
+    return backend.status(token_id)
+
+
+def watch(
+    token,
+    known_state: Optional[str] = None,
+    known_exhausted: Optional[bool] = None,
+    timeout: float = 0,
+) -> Tuple[Optional[Tuple[str, bool]], bool]:
+    """
+    Wait up to `timeout` seconds for the token's state or exhaustion to
+    differ from what the caller knows, by default what they are now.
+    Returns the token's `status` and whether it changed. Returns at once
+    if the token doesn't exist, or without waiting when this process
+    already has as many requests waiting as `bulkhead.max_waiters` allows.
+    """
+    token_id = _id(parse(token))
+    deadline = time.monotonic() + timeout
+    if changes.hub.waiting >= bulkhead.max_waiters(config):
+        current = status(token_id)
+        metrics.STATE_WAITS.labels("busy").inc()
+        return current, False
+
+    changes.hub.listen(current_app._get_current_object())
+    # subscribed before the first read, so no change can slip in between
+    with changes.hub.waiter(token_id) as event:
+        current = status(token_id)
+        if current is None:
+            return None, False
+        known = (
+            current[0] if known_state is None else known_state,
+            current[1] if known_exhausted is None else known_exhausted,
+        )
+        while current == known:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                metrics.STATE_WAITS.labels("timeout").inc()
+                return current, False
+            event.wait(min(remaining, config["STATE_WAIT_RECHECK"]))
+            event.clear()
+            current = status(token_id)
+            if current is None:
+                return None, False
+    metrics.STATE_WAITS.labels("changed").inc()
+    return current, True
+
+
+def validate(token) -> Result:
+    """
+    Check a token without changing it
+    """
+    return validate_many([parse(token)])[0]
+
+
+def invoke(token) -> Result:
+    """
+    Use a token once. A token with no uses left is marked exhausted instead.
+    """
+    return invoke_many([parse(token)])[0]
+
+
+def exhaust(token, token_state: str) -> Result:
+    """
+    Mark a token exhausted and record its final state
+    """
+    return exhaust_many([parse(token)], token_state)[0]
+
+
+def validate_many(tokens: List[Parsed]) -> List[Result]:
+    """
+    `validate` for every token in `tokens` with one query. Unless
+    `SIGNED_TOKEN_REVOCATION_CHECK` is set, unexpired signed tokens are
+    trusted without checking whether they were exhausted.
+    """
+    return _stateless(
+        "validate",
+        tokens,
+        backend.validate,
+        not config.get("SIGNED_TOKEN_REVOCATION_CHECK", True),
+        _recalls(),
+    )
+
+
+def invoke_many(tokens: List[Parsed]) -> List[Result]:
+    """
+    `invoke` every token in `tokens` with one set-based update. A token
+    listed more than once is only invoked once. Writes always ask the
+    backend, the cache only learns from them.
+    """
+    return _published(
+        tokens, _stateless("invoke", tokens, backend.invoke, recall=False)
+    )
+
+
+def exhaust_many(tokens: List[Parsed], token_state: str) -> List[Result]:
+    """
+    `exhaust` every token in `tokens` with one set-based update
+    """
+    return _published(
+        tokens,
+        _stateless(
+            "exhaust",
+            tokens,
+            lambda misses: backend.exhaust(misses, token_state),
+            recall=False,
+        ),
+    )
+
+
+def _published(tokens: List[Parsed], results: List[Result]) -> List[Result]:
+    """
+    Wake this process's `watch`ers of the tokens that may have been exhausted
+    """
+    changes.hub.publish(
+        _id(token)
+        for token, result in zip(tokens, results)
+        if result.outcome in (Outcome.EXHAUST, Outcome.EXHAUSTED)
+    )
+    return results
@@ -0,0 +1,31 @@
+# server/auth/worker.py
+"""
+Background jobs that run inside each application process.
+"""
+
+import logging
+import threading
+import time
+
+
+def start(app, name: str, interval: float, task):
+    """
+    Call `task` in an app context every `interval` seconds on a daemon
+    thread. A task that returns True has more work queued and is called
+    again straight away.
+    """
+
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    more = task()
+            except Exception as err:
+                logging.error("%s failed: %s", name, err)
+                more = False
+            if not more:
+                time.sleep(interval)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
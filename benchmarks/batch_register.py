@@ -0,0 +1,62 @@
+# benchmarks/batch_register.py
+"""
+Compare token registration throughput between `POST /auth` (one token per
+request) and `POST /auth/batch`.
+
+Runs in-process against the database configured by APP_SETTINGS, e.g.
+
+    APP_SETTINGS=tests.config.TestConfig python -m benchmarks.batch_register -n 5000
+"""
+
+import argparse
+import json
+import time
+
+from auth.main import app, config, db
+
+
+def single(client, headers, count):
+    for _ in range(count):
+        response = client.post("/auth", headers=headers)
+        assert response.status_code == 201, response.data
+
+
+def batch(client, headers, count, size):
+    for offset in range(0, count, size):
+        response = client.post(
+            "/auth/batch",
+            headers=headers,
+            data=json.dumps({"count": min(size, count - offset)}),
+            content_type="application/json",
+        )
+        assert response.status_code == 201, response.data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--count", type=int, default=2000)
+    parser.add_argument("-b", "--batch-size", type=int, default=None)
+    args = parser.parse_args()
+    size = args.batch_size or config["MAX_BATCH_SIZE"]
+    config["MAX_BATCH_SIZE"] = size
+
+    headers = {"X-API-Key": config["SECRET_KEYS"][0]}
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        results = {}
+        for name, run in (
+            ("single", lambda: single(client, headers, args.count)),
+            (f"batch({size})", lambda: batch(client, headers, args.count, size)),
+        ):
+            start = time.perf_counter()
+            run()
+            results[name] = args.count / (time.perf_counter() - start)
+
+    for name, rate in results.items():
+        print(f"{name:>16}: {rate:12.0f} tokens/s")
+    print(f"{'speedup':>16}: {max(results.values()) / results['single']:12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# benchmarks/lifecycle.py
+"""
+Load test of the token lifecycle and proxy routes.
+
+Drives `register`, `validate`, `invoke`, `exhaust`, `state`, `redirect` and
+`export` over HTTP at a fixed concurrency and reports throughput and
+p50/p95/p99 latency per route. By default the app is served in-process on
+a threaded server, using the Postgres from APP_SETTINGS or, with
+`--backend memory`, the in-process token backend. Stub Qualtrix and GDrive
+services are started on the configured ports. `--url` points the load at an
+already running server instead, e.g. gunicorn with `gunicorn.conf.py`. Rate
+limiting has to be disabled there (`RATE_LIMIT_RATE=0`).
+
+    APP_SETTINGS=tests.config.TestConfig python -m benchmarks.lifecycle \\
+        --backend sql -c 8 -n 2000 --output results.json \\
+        --baseline benchmarks/baselines/lifecycle-sql.json
+
+With `--baseline` the run is compared against earlier results and exits
+non-zero if any route's throughput dropped, or its p95 latency rose, by
+more than `--tolerance` percent.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import itertools
+import json
+import logging
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from auth.main import app, config, db
+from auth import access, backends, store
+from auth.ratelimit import RateLimiter
+from benchmarks import stubs
+
+ROUTES = ["register", "validate", "invoke", "exhaust", "state", "redirect", "export"]
+
+SURVEY = {
+    "surveyId": "SV_1",
+    "responseId": "R_1",
+    "participant": {"first": "First", "last": "Last", "email": "a@b.c"},
+}
+
+
+class Client:
+    """
+    One keep-alive session per load thread
+    """
+
+    def __init__(self, url: str, api_key: str):
+        self.url = url
+        self.headers = {"X-API-Key": api_key}
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            self._local.session.headers.update(self.headers)
+        return self._local.session
+
+    def register_many(self, count: int, uses: int = 1):
+        tokens = []
+        size = min(count, config["MAX_BATCH_SIZE"])
+        for offset in range(0, count, size):
+            response = self.session.post(
+                f"{self.url}/auth/batch",
+                json={"count": min(size, count - offset), "uses": uses},
+            )
+            response.raise_for_status()
+            tokens += response.json()["auth_tokens"]
+        return tokens
+
+
+def _requests(route: str, client: Client, count: int):
+    """
+    `count` `(method, path, json)` requests for `route`. Tokens are
+    registered up front.
+    """
+    if route == "register":
+        return [("POST", "/auth", None)] * count
+    if route == "redirect":
+        return [("POST", "/redirect/", stubs.REDIRECT)] * count
+    if route == "export":
+        return [("POST", "/export/survey-response", SURVEY)] * count
+
+    if route == "invoke":
+        # enough uses that every invoke succeeds
+        tokens = itertools.cycle(client.register_many(100, uses=count))
+    elif route == "exhaust":
+        tokens = iter(client.register_many(count))
+    else:
+        tokens = itertools.cycle(client.register_many(100))
+    tokens = [next(tokens) for _ in range(count)]
+
+    method, path = {
+        "validate": ("GET", "/auth/{}"),
+        "invoke": ("POST", "/auth/{}/decrement"),
+        "exhaust": ("DELETE", "/auth/{}?state=done"),
+        "state": ("GET", "/auth/state?token={}"),
+    }[route]
+    return [(method, path.format(token), None) for token in tokens]
+
+
+def _percentile(ordered, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_route(route: str, client: Client, count: int, concurrency: int) -> dict:
+    calls = _requests(route, client, count)
+    latencies = []
+    errors = 0
+
+    def timed(call):
+        method, path, body = call
+        start = time.perf_counter()
+        status = client.session.request(
+            method, client.url + path, json=body
+        ).status_code
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        for seconds, status in pool.map(timed, calls):
+            latencies.append(seconds)
+            errors += status >= 400
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": count,
+        "errors": errors,
+        "throughput": count / elapsed,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """
+    Routes whose throughput or p95 latency regressed by more than
+    `tolerance` percent
+    """
+    regressions = []
+    for route, result in results["routes"].items():
+        base = baseline["routes"].get(route)
+        if base is None:
+            continue
+        if result["throughput"] < base["throughput"] * (1 - tolerance / 100):
+            regressions.append(
+                f"{route}: throughput {result['throughput']:.0f}/s "
+                f"vs {base['throughput']:.0f}/s"
+            )
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance / 100):
+            regressions.append(
+                f"{route}: p95 {result['p95_ms']:.1f}ms vs {base['p95_ms']:.1f}ms"
+            )
+    return regressions
+
+
+def _serve() -> str:
+    """
+    Serve the app in-process on a threaded WSGI server, returning its URL
+    """
+    from werkzeug.serving import make_server
+
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        port = sock.getsockname()[1]
+    server = make_server("localhost", port, app, threaded=True)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://localhost:{port}"
+
+
+def _revision() -> str:
+    try:
+        return subprocess.run(  # nosec B603 B607 - fixed argument list
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--requests", type=int, default=1000)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--backend", choices=sorted(backends.BACKENDS), default="sql")
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--url", help="load an already running server instead")
+    parser.add_argument("--upstream-delay", type=float, default=0.0)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="compare against earlier results")
+    parser.add_argument("--tolerance", type=float, default=10.0)
+    args = parser.parse_args()
+    # per-request log lines would cost more than some of the routes
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    # the upstream pools are sized for the app's threads, not this load
+    logging.getLogger("urllib3").setLevel(logging.ERROR)
+
+    services = [
+        stubs.start(config[port], args.upstream_delay)
+        for port in ("QUALTRIX_APP_PORT", "GDRIVE_APP_PORT")
+    ]
+    url = args.url
+    if url is None:
+        with app.app_context():
+            db.create_all()
+        store.backend = backends.from_config({**config, "TOKEN_BACKEND": args.backend})
+        store.terminal_cache.clear()
+        access.limiter = RateLimiter(0, 1)
+        url = _serve()
+
+    client = Client(url, config["SECRET_KEYS"][0])
+    results = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "revision": _revision(),
+            "python": platform.python_version(),
+            "backend": args.backend if args.url is None else "external",
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+        },
+        "routes": {},
+    }
+
+    print(
+        f"{'route':>10} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'errors':>7}"
+    )
+    for route in args.routes.split(","):
+        result = run_route(route, client, args.requests, args.concurrency)
+        results["routes"][route] = result
+        print(
+            f"{route:>10} {result['throughput']:9.0f} {result['p50_ms']:8.2f} "
+            f"{result['p95_ms']:8.2f} {result['p99_ms']:8.2f} {result['errors']:7d}"
+        )
+
+    for service in services:
+        service.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as base:
+            regressions = compare(results, json.load(base), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0f}% of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
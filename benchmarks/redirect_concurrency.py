@@ -0,0 +1,105 @@
+# benchmarks/redirect_concurrency.py
+"""
+Compare concurrent `/redirect/` throughput between the sync (WSGI) and async
+(ASGI) serving modes.
+
+A stub Qualtrix that answers after `--delay` seconds is started on the port
+the app is configured for, then the app is run under gunicorn in each mode
+with a single worker and hit with `--concurrency` parallel requests, e.g.
+
+    APP_SETTINGS=tests.config.TestConfig ASYNC_UPSTREAM_POOL_SIZE=200 \
+        python -m benchmarks.redirect_concurrency
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from auth.main import config
+from benchmarks import stubs
+
+MODES = {
+    "sync": ["auth.main:app"],
+    "async": ["auth.asgi:app", "-k", "uvicorn.workers.UvicornWorker"],
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+async def _load(url: str, requests: int, concurrency: int) -> float:
+    # sync gunicorn workers close the connection after every response
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                response = await client.post(url, json=stubs.REDIRECT)
+                assert response.status_code == 200, response.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return requests / (time.perf_counter() - start)
+
+
+def run(mode: str, requests: int, concurrency: int) -> float:
+    port = _free_port()
+    server = subprocess.Popen(  # nosec B603 - fixed argument list
+        [sys.executable, "-m", "gunicorn", "--bind", f"localhost:{port}", "-w", "1"]
+        + MODES[mode],
+        env=os.environ.copy(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_for(port)
+        return asyncio.run(
+            _load(f"http://localhost:{port}/redirect/", requests, concurrency)
+        )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=100)
+    parser.add_argument("--delay", type=float, default=0.2)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    stub = stubs.start(config["QUALTRIX_APP_PORT"], args.delay)
+
+    try:
+        for mode in MODES:
+            rate = run(mode, args.requests, args.concurrency)
+            print(f"{mode:>6}: {rate:8.1f} redirects/s")
+    finally:
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
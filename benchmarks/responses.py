@@ -0,0 +1,90 @@
+# benchmarks/responses.py
+"""
+Measure the per-response overhead of building token responses with
+`make_response(jsonify(...))` (the previous approach) against `Responses`.
+
+Runs inside a request context, no database is needed, e.g.
+
+    APP_SETTINGS=tests.config.TestConfig python -m benchmarks.responses -n 100000
+"""
+
+import argparse
+import time
+import uuid
+
+from flask import jsonify, make_response
+
+from auth.main import app
+from auth.responses import BODIES, Responses
+
+
+def jsonified(name, state=None):
+    body, status = BODIES[name]
+    if name == "exhausted":
+        body = {**body, "state": state}
+    return make_response(jsonify(body)), status
+
+
+CASES = {
+    "exist": (
+        lambda: jsonified("exist"),
+        Responses.exist,
+    ),
+    "not_exist": (
+        lambda: jsonified("not_exist"),
+        Responses.not_exist,
+    ),
+    "exhausted": (
+        lambda: jsonified("exhausted", "completed"),
+        lambda: Responses.exhausted("completed"),
+    ),
+    "state": (
+        lambda: (make_response(jsonify({"status": "ok", "state": "completed"})), 200),
+        lambda: Responses.state("completed"),
+    ),
+    "register": (
+        lambda: (
+            make_response(
+                jsonify(
+                    {
+                        "status": "success",
+                        "message": "Successfully registered.",
+                        "auth_token": uuid.uuid4(),
+                    }
+                )
+            ),
+            201,
+        ),
+        lambda: Responses.registered(uuid.uuid4()),
+    ),
+}
+
+
+def measure(build, count: int) -> float:
+    """
+    Microseconds per response, including reading the body back out
+    """
+    start = time.perf_counter()
+    for _ in range(count):
+        response, _ = build()
+        response.get_data()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--count", type=int, default=50000)
+    args = parser.parse_args()
+
+    with app.test_request_context():
+        print(
+            f"{'response':>10} {'jsonify us':>11} {'Responses us':>13} {'speedup':>8}"
+        )
+        for name, (before, after) in CASES.items():
+            old = measure(before, args.count)
+            new = measure(after, args.count)
+            print(f"{name:>10} {old:11.2f} {new:13.2f} {old / new:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/startup.py
+"""
+Measure app startup time and resident memory per worker for each blueprint
+selection (`APP_BLUEPRINTS`).
+
+Every run is a fresh interpreter, like a freshly started worker without
+`preload_app`. It reports the wall time to a created app (interpreter start
+included), the time spent in `create_app` alone, and the resident set size
+once the app is created and again after its first `/health` request, which
+opens the first database connection. E.g.
+
+    APP_SETTINGS=tests.config.TestConfig python -m benchmarks.startup -n 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROFILES = ["all", "auth", "proxy"]
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child(blueprints: str):
+    start = time.perf_counter()
+    from auth.main import create_app
+
+    app = create_app(blueprints=blueprints)
+    created = time.perf_counter() - start
+    created_rss = _rss_mb()
+    response = app.test_client().get("/health")
+    assert response.status_code == 200, response.data
+    print(
+        json.dumps(
+            {
+                "create_ms": created * 1000,
+                "rss_mb": created_rss,
+                "served_rss_mb": _rss_mb(),
+                "modules": len(sys.modules),
+            }
+        )
+    )
+
+
+def run(blueprints: str) -> dict:
+    env = {**os.environ, "START_BACKGROUND_WORKERS": "false"}
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", blueprints],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.splitlines()[-1])
+    result["wall_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child)
+
+    print(
+        f"{'blueprints':<10} {'wall ms':>8} {'create ms':>10} {'RSS MB':>7} "
+        f"{'served MB':>10} {'modules':>8}"
+    )
+    for profile in PROFILES:
+        runs = [run(profile) for _ in range(args.runs)]
+
+        def median(key):
+            return statistics.median(result[key] for result in runs)
+
+        print(
+            f"{profile:<10} {median('wall_ms'):>8.0f} {median('create_ms'):>10.0f} "
+            f"{median('rss_mb'):>7.1f} {median('served_rss_mb'):>10.1f} "
+            f"{median('modules'):>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
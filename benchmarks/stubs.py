@@ -0,0 +1,57 @@
+# benchmarks/stubs.py
+"""
+Stand-ins for the Qualtrix and GDrive services, answering every POST with a
+small JSON body after a configurable delay, and the request bodies sent
+through them.
+"""
+
+import http.server
+import threading
+import time
+
+# a valid `/redirect/` request body
+REDIRECT = {
+    "surveyId": "SV_1",
+    "targetSurveyId": "SV_2",
+    "RulesConsentID": "1",
+    "SurveyswapID": "2",
+    "SurveyswapGroup": "3",
+    "utm_campaign": "c",
+    "utm_medium": "m",
+    "utm_source": "s",
+    "email": "test@example.com",
+    "firstName": "First",
+    "lastName": "Last",
+}
+
+
+class StubService(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.delay)
+        body = b'{"url": "https://example.com"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start(port: int, delay: float = 0.0) -> http.server.HTTPServer:
+    """
+    Serve the stub on `port` from a daemon thread; call `shutdown()` to stop
+    """
+    server = _Server(("localhost", int(port)), StubService)
+    server.delay = delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
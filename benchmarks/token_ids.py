@@ -0,0 +1,101 @@
+# benchmarks/token_ids.py
+"""
+Compare insert throughput and primary key index size for UUIDv1, UUIDv4 and
+UUIDv7 token ids.
+
+Each generator fills its own copy of the `tokens` table in batches, one
+transaction per batch as `POST /auth/batch` does, and reports the overall
+insert rate, the rate over the last tenth of the rows (once the index no
+longer fits in cache, random ids slow down the most), and the size of the
+primary key index. Needs Postgres, e.g.
+
+    APP_SETTINGS=tests.config.TestConfig python -m benchmarks.token_ids -n 2000000
+"""
+
+import argparse
+import datetime
+import time
+import uuid
+
+from sqlalchemy import Column, MetaData, Table, text
+
+from auth.main import app, db
+from auth.models import Token
+from auth import ids
+
+GENERATORS = {"uuid1": uuid.uuid1, "uuid4": uuid.uuid4, "uuid7": ids.uuid7}
+
+
+def _table(name: str) -> Table:
+    return Table(
+        f"bench_tokens_{name}",
+        MetaData(),
+        *[Column(c.name, c.type, primary_key=c.primary_key) for c in Token.__table__.c],
+    )
+
+
+def fill(name: str, count: int, batch_size: int) -> dict:
+    table = _table(name)
+    generate = GENERATORS[name]
+    now = datetime.datetime.now(datetime.timezone.utc)
+    expires = now + datetime.timedelta(days=7)
+    tail = count - count // 10
+    with db.engine.connect() as connection:
+        table.drop(connection, checkfirst=True)
+        table.create(connection)
+        connection.commit()
+
+        start = time.perf_counter()
+        tail_start = start
+        for offset in range(0, count, batch_size):
+            if offset >= tail and tail_start == start:
+                tail_start = time.perf_counter()
+            connection.execute(
+                table.insert(),
+                [
+                    {
+                        "id": generate(),
+                        "registered_on": now,
+                        "expires_on": expires,
+                        "refresh": 1,
+                        "state": "init",
+                        "exhausted": False,
+                    }
+                    for _ in range(min(batch_size, count - offset))
+                ],
+            )
+            connection.commit()
+        end = time.perf_counter()
+
+        index_bytes = connection.execute(
+            text("SELECT pg_relation_size(:index)"), {"index": f"{table.name}_pkey"}
+        ).scalar()
+        table.drop(connection)
+        connection.commit()
+
+    return {
+        "rows_per_second": count / (end - start),
+        "tail_rows_per_second": (count - tail) / (end - tail_start),
+        "index_mb": index_bytes / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--count", type=int, default=2_000_000)
+    parser.add_argument("-b", "--batch-size", type=int, default=10_000)
+    parser.add_argument("--ids", default=",".join(GENERATORS))
+    args = parser.parse_args()
+
+    print(f"{'id':>6} {'rows/s':>10} {'last 10%':>10} {'pkey MB':>9}")
+    with app.app_context():
+        for name in args.ids.split(","):
+            result = fill(name, args.count, args.batch_size)
+            print(
+                f"{name:>6} {result['rows_per_second']:10.0f} "
+                f"{result['tail_rows_per_second']:10.0f} {result['index_mb']:9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
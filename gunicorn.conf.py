@@ -0,0 +1,77 @@
+# gunicorn.conf.py
+"""
+Production runtime profile, picked up automatically by `gunicorn` from the
+working directory. Everything can be overridden from the environment:
+
+    WEB_CONCURRENCY          worker processes (default: fit CPUs and MEMORY_LIMIT)
+    GUNICORN_WORKER_CLASS    gthread (default), sync, or
+                             uvicorn.workers.UvicornWorker with auth.asgi:app
+    GUNICORN_THREADS         threads per gthread worker (default 4)
+    GUNICORN_WORKER_MEMORY   MB one worker needs (default 48)
+    GUNICORN_MAX_REQUESTS    recycle workers after this many requests (default
+                             2000, 0 disables), staggered by
+                             GUNICORN_MAX_REQUESTS_JITTER (default 200)
+    GUNICORN_PRELOAD         load the app once before forking (default true)
+"""
+
+import os
+import tempfile
+
+# not auth.config: its config classes read the variables set below on import
+from auth.env import getenvbool, getenvint
+from auth import runtime
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = getenvint("GUNICORN_THREADS", 4)
+workers = getenvint(
+    "WEB_CONCURRENCY",
+    runtime.worker_count(
+        runtime.memory_limit_mb(),
+        runtime.cpu_count(),
+        getenvint("GUNICORN_WORKER_MEMORY", runtime.WORKER_MEMORY_MB),
+    ),
+)
+
+# request threads per worker, which the upstream bulkhead leaves some of to
+# the token routes; read when the app is created
+os.environ.setdefault("WORKER_THREADS", str(1 if worker_class == "sync" else threads))
+# one database connection per request thread (the ASGI mode also runs Flask
+# requests on threads), plus one for the background workers
+os.environ.setdefault("DB_POOL_SIZE", str(int(os.environ["WORKER_THREADS"]) + 1))
+# background threads don't survive the fork, post_fork starts them instead
+os.environ["START_BACKGROUND_WORKERS"] = "false"
+# workers write metrics here so /metrics can aggregate them; must be set
+# before prometheus_client is imported
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="token-metrics-")
+)
+
+preload_app = getenvbool("GUNICORN_PRELOAD", True)
+max_requests = getenvint("GUNICORN_MAX_REQUESTS", 2000)
+max_requests_jitter = getenvint("GUNICORN_MAX_REQUESTS_JITTER", 200)
+timeout = getenvint("GUNICORN_TIMEOUT", 30)
+graceful_timeout = getenvint("GUNICORN_GRACEFUL_TIMEOUT", 20)
+keepalive = getenvint("GUNICORN_KEEPALIVE", 5)
+
+
+def when_ready(server):
+    server.log.info(
+        "Serving with %d %s workers, database pool of %s per worker",
+        workers,
+        worker_class,
+        os.environ["DB_POOL_SIZE"],
+    )
+
+
+def post_fork(server, worker):
+    from auth.main import app
+
+    runtime.after_fork(app)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
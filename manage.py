@@ -1,42 +1,134 @@
 # manage.py
 
+import sys
 import unittest
 
-from flask_script import Manager
-from flask_migrate import Migrate, MigrateCommand
+import click
+from flask.cli import FlaskGroup
+from flask_migrate import Migrate
 
-from server import app, db
+from auth.main import create_app, db
 
 
-migrate = Migrate(app, db)
-manager = Manager(app)
+migrate = Migrate()
 
-# migrations
-manager.add_command("db", MigrateCommand)
 
+def make_app():
+    app = create_app()
+    # migrations are available as `python manage.py db ...`
+    migrate.init_app(app, db)
+    return app
 
-@manager.command
+
+manager = FlaskGroup(create_app=make_app)
+
+
+@manager.command("test")
 def test():
     """Runs the unit tests without test coverage."""
     tests = unittest.TestLoader().discover("tests", pattern="test*.py")
     result = unittest.TextTestRunner(verbosity=2).run(tests)
-    if result.wasSuccessful():
-        return 0
-    return 1
+    # click ignores the return value, the exit status has to be set
+    sys.exit(0 if result.wasSuccessful() else 1)
 
 
-@manager.command
+@manager.command("create_db")
 def create_db():
     """Creates the db tables."""
     db.create_all()
 
 
-@manager.command
+@manager.command("drop_db")
 def drop_db():
     """Drops the db tables."""
     db.drop_all()
 
 
+@manager.command("purge_tokens")
+@click.option("--grace-seconds", type=int, help="Keep tokens this long after expiry.")
+@click.option("--batch-size", type=int, help="Rows removed per transaction.")
+@click.option("--archive/--delete", default=None, help="Move rows to tokens_archive.")
+@click.option(
+    "--pause", type=float, default=0, help="Seconds to sleep between batches."
+)
+def purge_tokens(grace_seconds, batch_size, archive, pause):
+    """Deletes or archives expired and exhausted tokens."""
+    from auth import retention
+
+    stats = retention.purge(grace_seconds, batch_size, archive, pause)
+    click.echo(
+        f"Removed {stats['removed']} tokens in {stats['seconds']}s "
+        f"({stats['rows_per_second']} rows/s)"
+    )
+
+
+@manager.command("export_tokens")
+@click.option("--format", "export_format", type=click.Choice(["ndjson", "csv"]))
+@click.option("--from", "registered_from", type=click.DateTime(), help="UTC.")
+@click.option("--to", "registered_to", type=click.DateTime(), help="UTC.")
+@click.option("--state", help="Only tokens in this state.")
+@click.option("--exhausted/--usable", default=None, help="Only (not) exhausted.")
+@click.option("--output", type=click.File("wb"), default="-")
+def export_tokens(
+    export_format, registered_from, registered_to, state, exhausted, output
+):
+    """Streams the tokens table as NDJSON or CSV."""
+    from auth import export
+
+    for chunk in export.stream(
+        export_format or "ndjson",
+        registered_from=registered_from,
+        registered_to=registered_to,
+        state=state,
+        exhausted=exhausted,
+    ):
+        output.write(chunk)
+
+
+@manager.command("import_tokens")
+@click.argument("source", type=click.File("rb"), default="-")
+@click.option("--format", "import_format", type=click.Choice(["ndjson", "csv"]))
+@click.option(
+    "--on-conflict",
+    type=click.Choice(["skip", "update"]),
+    default="skip",
+    help="Skip or overwrite tokens whose id already exists.",
+)
+@click.option("--batch-size", type=int, help="Rows written per transaction.")
+def import_tokens(source, import_format, on_conflict, batch_size):
+    """Loads NDJSON or CSV token records into the tokens table."""
+    from auth import importer
+    from auth.portable import is_postgres
+
+    stats = importer.load(source, import_format or "ndjson", on_conflict, batch_size)
+    click.echo(
+        f"Imported {stats['rows']} tokens ({stats['inserted']} inserted, "
+        f"{stats['updated']} updated, {stats['skipped']} skipped, "
+        f"{stats['invalid']} invalid) in {stats['seconds']}s "
+        f"({stats['rows_per_second']} rows/s)"
+    )
+    for error in stats["errors"]:
+        click.echo(error, err=True)
+    if stats["updated"] and not is_postgres():
+        click.echo(
+            "Restart the workers: their cached token results are not invalidated "
+            "on this database",
+            err=True,
+        )
+
+
+@manager.command("dispatch_outbox")
+def dispatch_outbox():
+    """Forwards all due survey responses to GDrive."""
+    from auth import outbox
+
+    while outbox.dispatch()["sent"]:
+        pass
+    stats = outbox.stats()
+    click.echo(f"{stats['depth']} queued, {stats['dead_letters']} dead-lettered")
+
+
 if __name__ == "__main__":
-    db.create_all()
-    manager.run()
+    with make_app().app_context():
+        db.create_all()
+    manager()
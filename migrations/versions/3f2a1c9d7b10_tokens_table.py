@@ -0,0 +1,40 @@
+"""tokens table
+
+Revision ID: 3f2a1c9d7b10
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "3f2a1c9d7b10"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases set up before migrations were introduced already have the
+    # table from `db.create_all()`
+    if sa.inspect(op.get_bind()).has_table("tokens"):
+        return
+
+    op.create_table(
+        "tokens",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("registered_on", sa.DateTime(), nullable=False),
+        sa.Column("expires_on", sa.DateTime(), nullable=False),
+        sa.Column("refresh", sa.Integer(), nullable=False),
+        sa.Column("state", sa.String(), nullable=False),
+        sa.Column("exhausted", sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade():
+    op.drop_table("tokens")
@@ -0,0 +1,38 @@
+"""idempotency keys
+
+Revision ID: 5d8e3a7c1f42
+Revises: c7e29b4f6a01
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5d8e3a7c1f42"
+down_revision = "c7e29b4f6a01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("idempotency_keys"):
+        return
+
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("key", sa.String(length=300), nullable=False),
+        sa.Column("token", sa.String(), nullable=False),
+        sa.Column("expires_on", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index(
+        "ix_idempotency_keys_expires_on", "idempotency_keys", ["expires_on"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_idempotency_keys_expires_on", table_name="idempotency_keys")
+    op.drop_table("idempotency_keys")
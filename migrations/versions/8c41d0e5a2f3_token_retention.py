@@ -0,0 +1,66 @@
+"""token retention
+
+Revision ID: 8c41d0e5a2f3
+Revises: 3f2a1c9d7b10
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "8c41d0e5a2f3"
+down_revision = "3f2a1c9d7b10"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # tables created by `db.create_all()` may already have everything below
+    inspector = sa.inspect(op.get_bind())
+    columns = [column["name"] for column in inspector.get_columns("tokens")]
+    if "exhausted_on" not in columns:
+        op.add_column("tokens", sa.Column("exhausted_on", sa.DateTime(), nullable=True))
+
+    # built concurrently so a large table is not locked against writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tokens_expires_on",
+            "tokens",
+            ["expires_on", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_tokens_exhausted_on",
+            "tokens",
+            ["exhausted_on", "id"],
+            postgresql_where=sa.text("exhausted"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+    if inspector.has_table("tokens_archive"):
+        return
+    op.create_table(
+        "tokens_archive",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("registered_on", sa.DateTime(), nullable=False),
+        sa.Column("expires_on", sa.DateTime(), nullable=False),
+        sa.Column("refresh", sa.Integer(), nullable=False),
+        sa.Column("state", sa.String(), nullable=False),
+        sa.Column("exhausted", sa.Boolean(), nullable=False),
+        sa.Column("exhausted_on", sa.DateTime(), nullable=True),
+        sa.Column("archived_on", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade():
+    op.drop_table("tokens_archive")
+    op.drop_index("ix_tokens_exhausted_on", table_name="tokens")
+    op.drop_index("ix_tokens_expires_on", table_name="tokens")
+    op.drop_column("tokens", "exhausted_on")
@@ -0,0 +1,54 @@
+"""token change notifications
+
+Revision ID: 9b3f6d2e8a57
+Revises: 5d8e3a7c1f42
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "9b3f6d2e8a57"
+down_revision = "5d8e3a7c1f42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_token_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('token_changes', NEW.id::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    # tables created by `db.create_all()` already have it
+    op.execute("DROP TRIGGER IF EXISTS tokens_notify_change ON tokens")
+    op.execute(
+        """
+        CREATE TRIGGER tokens_notify_change
+        AFTER UPDATE OF state, exhausted ON tokens
+        FOR EACH ROW
+        WHEN (
+            OLD.state IS DISTINCT FROM NEW.state
+            OR OLD.exhausted IS DISTINCT FROM NEW.exhausted
+        )
+        EXECUTE PROCEDURE notify_token_change()
+        """
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("DROP TRIGGER IF EXISTS tokens_notify_change ON tokens")
+    op.execute("DROP FUNCTION IF EXISTS notify_token_change()")
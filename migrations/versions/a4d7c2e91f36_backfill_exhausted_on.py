@@ -0,0 +1,42 @@
+"""backfill exhausted_on
+
+Revision ID: a4d7c2e91f36
+Revises: 9b3f6d2e8a57
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a4d7c2e91f36"
+down_revision = "9b3f6d2e8a57"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # tokens exhausted before exhausted_on existed; their grace period runs
+    # from now, since when they were exhausted is unknown
+    tokens = sa.table(
+        "tokens",
+        sa.column("exhausted", sa.Boolean),
+        sa.column("exhausted_on", sa.DateTime),
+    )
+    op.execute(
+        tokens.update()
+        .where(tokens.c.exhausted.is_(True), tokens.c.exhausted_on.is_(None))
+        .values(
+            exhausted_on=datetime.datetime.now(datetime.timezone.utc).replace(
+                tzinfo=None
+            )
+        )
+    )
+
+
+def downgrade():
+    pass
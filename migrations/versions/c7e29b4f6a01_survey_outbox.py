@@ -0,0 +1,45 @@
+"""survey outbox
+
+Revision ID: c7e29b4f6a01
+Revises: 8c41d0e5a2f3
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c7e29b4f6a01"
+down_revision = "8c41d0e5a2f3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("survey_outbox"):
+        return
+
+    op.create_table(
+        "survey_outbox",
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("created_on", sa.DateTime(), nullable=False),
+        sa.Column("next_attempt_on", sa.DateTime(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.Column("dead", sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_survey_outbox_due",
+        "survey_outbox",
+        ["next_attempt_on", "id"],
+        postgresql_where=sa.text("NOT dead"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_survey_outbox_due", table_name="survey_outbox")
+    op.drop_table("survey_outbox")
@@ -1 +1,5 @@
 # server/tests/__init__.py
+import os
+
+# the app is created when a test module first imports it from auth.main
+os.environ.setdefault("APP_SETTINGS", "tests.config.TestConfig")
@@ -1,16 +1,28 @@
 # server/tests/base.py
 
+import os
+import unittest
 
 from flask_testing import TestCase
 
 from auth.main import app, db
+from auth.store import terminal_cache
+
+
+# an in-memory SQLite database is a single connection shared by every thread,
+# so there is no pool and no concurrency to test
+SINGLE_CONNECTION = app.config["SQLALCHEMY_DATABASE_URI"] in (
+    "sqlite://",
+    "sqlite:///:memory:",
+)
+needs_pool = unittest.skipIf(SINGLE_CONNECTION, "needs a connection pool")
 
 
 class BaseTestCase(TestCase):
     """Base Tests"""
 
     def create_app(self):
-        app.config.from_object("tests.config.TestConfig")
+        app.config.from_object(os.getenv("APP_SETTINGS", "tests.config.TestConfig"))
         return app
 
     def setUp(self):
@@ -20,3 +32,4 @@ class BaseTestCase(TestCase):
     def tearDown(self):
         db.session.remove()
         db.drop_all()
+        terminal_cache.clear()
@@ -0,0 +1,74 @@
+# tests/test_asgi.py
+
+import asyncio
+import http.server
+import json
+import threading
+import unittest
+from unittest import mock
+
+import httpx
+
+from auth.main import config
+from auth import asgi, proxy
+from auth.upstream import AsyncUpstream
+from benchmarks.stubs import REDIRECT
+from tests.base import BaseTestCase
+from tests.test_upstream import StubHandler
+
+
+class TestAsgi(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = http.server.ThreadingHTTPServer(("localhost", 0), StubHandler)
+        self.server.status = 200
+        self.server.connections = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def _request(self, method, url, **kwargs):
+        async def run():
+            qualtrix = AsyncUpstream(
+                "qualtrix", f"http://localhost:{self.server.server_port}", retries=0
+            )
+            with mock.patch.object(asgi, "qualtrix", qualtrix):
+                transport = httpx.ASGITransport(app=asgi.app)
+                async with httpx.AsyncClient(
+                    transport=transport, base_url="http://test"
+                ) as client:
+                    return await client.request(method, url, **kwargs)
+
+        return asyncio.run(run())
+
+    def test_redirect_is_proxied(self):
+        response = self._request(
+            "POST",
+            "/redirect/",
+            json=REDIRECT,
+            headers={"Origin": proxy.CORS_ORIGINS[0]},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"ok": True})
+        self.assertEqual(
+            response.headers["access-control-allow-origin"], proxy.CORS_ORIGINS[0]
+        )
+
+    def test_redirect_validation(self):
+        response = self._request("POST", "/redirect/", json={"surveyId": "SV_1"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("body_params", response.json()["validation_error"])
+
+    def test_token_routes_use_flask(self):
+        response = self._request(
+            "POST", "/auth", headers={"X-API-Key": config["SECRET_KEYS"][0]}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["message"], "Successfully registered.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -25,6 +25,124 @@ class TestAuthBlueprint(BaseTestCase):
             self.assertTrue(response.content_type == "application/json")
             self.assertEqual(response.status_code, 201)
 
+    def test_idempotent_registration(self):
+        """Test that a repeated Idempotency-Key returns the first token"""
+        headers = {"X-API-Key": config["SECRET_KEYS"][0], "Idempotency-Key": "retry"}
+        with self.client:
+            first = self.client.post("/auth", headers=headers)
+            second = self.client.post("/auth", headers=headers)
+            other = self.client.post(
+                "/auth", headers={**headers, "Idempotency-Key": "other"}
+            )
+            self.assertEqual(first.status_code, 201)
+            self.assertEqual(second.status_code, 201)
+            self.assertNotIn("Idempotent-Replayed", first.headers)
+            self.assertEqual(second.headers["Idempotent-Replayed"], "true")
+            self.assertEqual(first.json["auth_token"], second.json["auth_token"])
+            self.assertNotEqual(first.json["auth_token"], other.json["auth_token"])
+
+            response = self.client.post(
+                "/auth", headers={**headers, "Idempotency-Key": "x" * 256}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_batch_registration(self):
+        """Test for bulk token registration"""
+        with self.client:
+            response = self.client.post(
+                "/auth/batch",
+                headers={"X-API-Key": config["SECRET_KEYS"][0]},
+                data=json.dumps({"count": 5, "uses": 2}),
+                content_type="application/json",
+            )
+            data = json.loads(response.data)
+            self.assertEqual(data["status"], "success")
+            self.assertEqual(data["message"], "Successfully registered.")
+            self.assertEqual(len(set(data["auth_tokens"])), 5)
+            self.assertTrue(response.content_type == "application/json")
+            self.assertEqual(response.status_code, 201)
+
+            response = self.client.get(
+                "/auth/" + data["auth_tokens"][4],
+                headers={"X-API-Key": config["SECRET_KEYS"][0]},
+            )
+            data = json.loads(response.data)
+            self.assertEqual(data["message"], "Token exists")
+
+    def test_batch_registration_specs(self):
+        """Test for bulk token registration with per-token specs"""
+        with self.client:
+            response = self.client.post(
+                "/auth/batch",
+                headers={"X-API-Key": config["SECRET_KEYS"][0]},
+                data=json.dumps({"tokens": [{"seconds": 60}, {"uses": 3}, {}]}),
+                content_type="application/json",
+            )
+            data = json.loads(response.data)
+            self.assertEqual(len(data["auth_tokens"]), 3)
+            self.assertEqual(response.status_code, 201)
+
+    def test_batch_registration_too_large(self):
+        """Test that batches above MAX_BATCH_SIZE are rejected"""
+        with self.client:
+            for count in (config["MAX_BATCH_SIZE"] + 1, 10**12):
+                response = self.client.post(
+                    "/auth/batch",
+                    headers={"X-API-Key": config["SECRET_KEYS"][0]},
+                    data=json.dumps({"count": count}),
+                    content_type="application/json",
+                )
+                data = json.loads(response.data)
+                self.assertEqual(data["status"], "fail")
+                self.assertEqual(response.status_code, 400)
+
+    def test_batch_invoke(self):
+        """Test for bulk token invocation"""
+        with self.client:
+            response = self.client.post(
+                "/auth/batch",
+                headers={"X-API-Key": config["SECRET_KEYS"][0]},
+                data=json.dumps({"count": 2}),
+                content_type="application/json",
+            )
+            auth_tokens = json.loads(response.data)["auth_tokens"]
+
+            response = self.client.post(
+                "/auth/batch/invoke",
+                headers={"X-API-Key": config["SECRET_KEYS"][0]},
+                data=json.dumps({"tokens": auth_tokens + ["NOT_A_TOKEN"]}),
+                content_type="application/json",
+            )
+            data = json.loads(response.data)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [r["message"] for r in data["results"]],
+                ["Token successfully invoked"] * 2 + ["Unauthorized"],
+            )
+            self.assertEqual(data["results"][0]["token"], auth_tokens[0])
+
+            response = self.client.post(
+                "/auth/batch/exhaust",
+                headers={"X-API-Key": config["SECRET_KEYS"][0]},
+                data=json.dumps({"tokens": auth_tokens[:1], "state": "done"}),
+                content_type="application/json",
+            )
+            data = json.loads(response.data)
+            self.assertEqual(
+                data["results"][0]["message"], "Token successfully exhausted"
+            )
+
+            response = self.client.post(
+                "/auth/batch/validate",
+                headers={"X-API-Key": config["SECRET_KEYS"][0]},
+                data=json.dumps({"tokens": auth_tokens}),
+                content_type="application/json",
+            )
+            data = json.loads(response.data)
+            self.assertEqual(data["results"][0]["message"], "Token exhausted")
+            self.assertEqual(data["results"][0]["state"], "done")
+            self.assertEqual(data["results"][1]["message"], "Token exists")
+
     def test_validation(self):
         """Test for validity of registered token"""
         with self.client:
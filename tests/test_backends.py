@@ -0,0 +1,242 @@
+# tests/test_backends.py
+"""
+Conformance suite for the token storage backends. Every backend runs the
+same lifecycle tests, plus the route tests of `tests/test_auth.py`.
+"""
+
+import datetime
+import threading
+import unittest
+import uuid
+from unittest import mock
+
+from tests import test_auth
+from tests.base import BaseTestCase, needs_pool
+from auth import store
+from auth.backends import Outcome
+from auth.backends.memory import MemoryBackend
+from auth.backends.redis import RedisBackend
+from auth.backends.sql import SQLBackend
+from auth.main import app, db
+
+try:
+    import fakeredis
+except ImportError:  # pragma: no cover
+    fakeredis = None
+
+
+def redis_backend():
+    # in-process stand-in for a Redis server, including Lua scripting
+    return RedisBackend(fakeredis.FakeRedis(server=fakeredis.FakeServer()), 60)
+
+
+class BackendConformance:
+    """
+    Lifecycle behaviour shared by every backend
+    """
+
+    def make_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        super().setUp()
+        self.backend = self.make_backend()
+
+    def tearDown(self):
+        self.backend.clear()
+        super().tearDown()
+
+    def _row(self, seconds=60, uses=1):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return {
+            "id": uuid.uuid4(),
+            "registered_on": now,
+            "expires_on": now + datetime.timedelta(seconds=seconds),
+            "refresh": uses,
+        }
+
+    def _token(self, seconds=60, uses=1):
+        row = self._row(seconds, uses)
+        self.backend.insert([row])
+        return row["id"]
+
+    def test_insert_once(self):
+        window = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=60
+        )
+        first, second = self._row(), self._row()
+        self.assertIsNone(
+            self.backend.insert_once("fp:key", [first], str(first["id"]), window)
+        )
+        self.assertEqual(
+            self.backend.insert_once("fp:key", [second], str(second["id"]), window),
+            str(first["id"]),
+        )
+        self.assertEqual(self.backend.state(first["id"]), "init")
+        self.assertIsNone(self.backend.state(second["id"]))
+        # other keys are independent
+        self.assertIsNone(
+            self.backend.insert_once("fp:other", [second], str(second["id"]), window)
+        )
+
+    def test_insert_once_after_window(self):
+        first, second = self._row(), self._row()
+        past = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+            seconds=1
+        )
+        self.backend.insert_once("fp:key", [first], str(first["id"]), past)
+        self.assertIsNone(
+            self.backend.insert_once("fp:key", [second], str(second["id"]), past)
+        )
+        self.assertEqual(self.backend.state(second["id"]), "init")
+
+    def test_validate(self):
+        token_id, missing = self._token(), uuid.uuid4()
+        self.assertEqual(
+            self.backend.validate([token_id, missing]),
+            {token_id: (Outcome.EXIST, None)},
+        )
+        self.assertEqual(self.backend.state(token_id), "init")
+        self.assertIsNone(self.backend.state(missing))
+        self.assertEqual(self.backend.status(token_id), ("init", False))
+        self.assertIsNone(self.backend.status(missing))
+
+    def test_invoke_counts_down_uses(self):
+        token_id = self._token(uses=2)
+        for _ in range(2):
+            self.assertEqual(
+                self.backend.invoke([token_id]), {token_id: (Outcome.REFRESH, "init")}
+            )
+        self.assertEqual(
+            self.backend.invoke([token_id]), {token_id: (Outcome.EXHAUSTED, "init")}
+        )
+        self.assertEqual(
+            self.backend.validate([token_id]), {token_id: (Outcome.EXHAUSTED, "init")}
+        )
+        self.assertEqual(self.backend.invoke([uuid.uuid4()]), {})
+
+    def test_invoke_once_per_batch(self):
+        token_id = self._token(uses=1)
+        self.assertEqual(
+            self.backend.invoke([token_id, token_id]),
+            {token_id: (Outcome.REFRESH, "init")},
+        )
+        self.assertEqual(
+            self.backend.invoke([token_id])[token_id].outcome, Outcome.EXHAUSTED
+        )
+
+    def test_expired(self):
+        token_id = self._token(seconds=-1)
+        for results in (
+            self.backend.validate([token_id]),
+            self.backend.invoke([token_id]),
+            self.backend.exhaust([token_id], "done"),
+        ):
+            self.assertEqual(results, {token_id: (Outcome.EXPIRED, None)})
+
+    def test_exhaust_records_state(self):
+        token_ids = [self._token(), self._token()]
+        self.assertEqual(
+            self.backend.exhaust(token_ids, "done"),
+            {token_id: (Outcome.EXHAUST, "done") for token_id in token_ids},
+        )
+        self.assertEqual(
+            self.backend.exhaust(token_ids, "again"),
+            {token_id: (Outcome.EXHAUSTED, "done") for token_id in token_ids},
+        )
+        self.assertEqual(self.backend.state(token_ids[0]), "done")
+        self.assertEqual(self.backend.status(token_ids[0]), ("done", True))
+
+    def test_concurrent_invoke_does_not_overuse(self):
+        uses = 3
+        token_id = self._token(uses=uses)
+        outcomes = []
+
+        def worker():
+            with app.app_context():
+                outcomes.append(self.backend.invoke([token_id])[token_id].outcome)
+                db.session.remove()
+
+        threads = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count(Outcome.REFRESH), uses)
+        self.assertEqual(outcomes.count(Outcome.EXHAUSTED), 10 - uses)
+
+
+class TestSQLBackend(BackendConformance, BaseTestCase):
+    def make_backend(self):
+        return SQLBackend()
+
+    @needs_pool
+    def test_concurrent_invoke_does_not_overuse(self):
+        super().test_concurrent_invoke_does_not_overuse()
+
+
+class TestMemoryBackend(BackendConformance, unittest.TestCase):
+    def make_backend(self):
+        return MemoryBackend(60)
+
+    def test_sweeps_dead_tokens(self):
+        self.backend._sweep_at = 2
+        dead = self._token(seconds=-120)
+        live = [self._token(), self._token()]
+        self.assertEqual(self.backend.validate([dead]), {})
+        self.assertEqual(len(self.backend.validate(live)), 2)
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class TestRedisBackend(BackendConformance, unittest.TestCase):
+    def make_backend(self):
+        return redis_backend()
+
+    def test_tokens_expire_after_grace(self):
+        token_id = self._token(seconds=30)
+        ttl = self.backend.client.ttl(f"token-service:token:{token_id}")
+        self.assertTrue(30 + 60 <= ttl <= 30 + 60 + 2)
+
+    def test_insert_once_failure_leaves_key_unclaimed(self):
+        window = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=60
+        )
+        row = self._row()
+        # storing the token fails: the key isn't a hash
+        self.backend.client.set(f"token-service:token:{row['id']}", "taken")
+        with self.assertRaises(Exception):
+            self.backend.insert_once("fp:key", [row], str(row["id"]), window)
+        self.assertIsNone(self.backend.client.get("token-service:idempotency:fp:key"))
+        self.backend.client.delete(f"token-service:token:{row['id']}")
+        self.assertIsNone(
+            self.backend.insert_once("fp:key", [row], str(row["id"]), window)
+        )
+        self.assertEqual(self.backend.state(row["id"]), "init")
+
+
+class BackendRoutes:
+    """
+    Run the route tests against another backend
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(store, "backend", self.make_backend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestMemoryBackendRoutes(BackendRoutes, test_auth.TestAuthBlueprint):
+    def make_backend(self):
+        return MemoryBackend(60)
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class TestRedisBackendRoutes(BackendRoutes, test_auth.TestAuthBlueprint):
+    def make_backend(self):
+        return redis_backend()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+# tests/test_bulkhead.py
+
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+from auth.main import config
+from auth import metrics, proxy, store
+from auth.bulkhead import Bulkhead, from_config, max_waiters
+from auth.config import ProdConfig
+from tests.base import BaseTestCase
+
+
+def _rejected(name):
+    return (
+        metrics.REGISTRY.get_sample_value("bulkhead_rejected_total", {"bulkhead": name})
+        or 0
+    )
+
+
+class TestBulkhead(unittest.TestCase):
+    def test_limit(self):
+        bulkhead = Bulkhead("test", 1, queue_timeout=0.05)
+        before = _rejected("test")
+        self.assertTrue(bulkhead.acquire())
+        start = time.monotonic()
+        self.assertFalse(bulkhead.acquire())
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(_rejected("test") - before, 1)
+        self.assertEqual(bulkhead.active, 1)
+        bulkhead.release()
+        self.assertTrue(bulkhead.acquire())
+        bulkhead.release()
+        self.assertEqual(bulkhead.active, 0)
+
+    def test_from_config(self):
+        bulkheads = from_config(
+            {
+                "WORKER_THREADS": 8,
+                "BULKHEAD_RESERVED": 3,
+                "BULKHEAD_LIMITS": '{"redirect": 2}',
+                "BULKHEAD_QUEUE_TIMEOUT": 0,
+            }
+        )
+        self.assertEqual(bulkheads["upstream"].limit, 5)
+        self.assertEqual(bulkheads["redirect"].limit, 2)
+        # at least one proxy request at a time
+        bulkheads = from_config({**config, "WORKER_THREADS": 1})
+        self.assertEqual(bulkheads["upstream"].limit, 1)
+
+    def test_from_config_keeps_a_token_thread(self):
+        with self.assertRaises(ValueError):
+            from_config({**config, "WORKER_THREADS": 4, "BULKHEAD_RESERVED": 0})
+
+    def test_max_waiters(self):
+        for threads, reserved, waiters in ((4, 2, 1), (16, 8, 2), (4, 4, 2), (1, 2, 0)):
+            settings = {
+                "WORKER_THREADS": threads,
+                "BULKHEAD_RESERVED": reserved,
+                "STATE_WAIT_MAX_WAITERS": 2,
+            }
+            self.assertEqual(max_waiters(settings), waiters)
+
+    def test_worker_threads_from_environment(self):
+        for threads, limit in (("16", 14), ("1", 1)):
+            settings = {
+                "DB_REPLICA_SERVICE": "",
+                "BULKHEAD_RESERVED": 2,
+                "BULKHEAD_LIMITS": "{}",
+                "BULKHEAD_QUEUE_TIMEOUT": 0,
+            }
+            environ = {"VCAP_SERVICES": "", "WORKER_THREADS": threads}
+            with mock.patch.dict(os.environ, environ):
+                ProdConfig.load_services(settings)
+            self.assertEqual(from_config(settings)["upstream"].limit, limit)
+
+
+class TestBulkheadRoutes(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = {"X-API-Key": config["SECRET_KEYS"][0]}
+        self.upstream = proxy.bulkheads["upstream"]
+
+    def _export(self):
+        return self.client.post(
+            "/export/survey-response",
+            headers=self.headers,
+            data=json.dumps({"surveyId": "SV_1", "responseId": "R_1"}),
+            content_type="application/json",
+        )
+
+    def test_slots_are_released(self):
+        for _ in range(self.upstream.limit + 1):
+            self.assertEqual(self._export().status_code, 200)
+        self.assertEqual(self.upstream.active, 0)
+
+    def test_full_bulkhead_sheds_proxy_routes_only(self):
+        token_id = store.register(60, 1)
+        held = 0
+        while self.upstream.acquire():
+            held += 1
+        try:
+            response = self._export()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers["Retry-After"], "1")
+            response = self.client.post("/redirect/", json={})
+            self.assertEqual(response.status_code, 503)
+            # the token routes keep their threads
+            response = self.client.get(f"/auth/{token_id}", headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+        finally:
+            for _ in range(held):
+                self.upstream.release()
+        self.assertEqual(self.upstream.active, 0)
+        self.assertEqual(self._export().status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# tests/test_cache.py
+
+import unittest
+from unittest import mock
+
+from auth import metrics
+from auth.cache import TerminalCache
+
+
+def _lookups():
+    get = metrics.REGISTRY.get_sample_value
+    return {
+        "local": get("token_cache_hits_total", {"tier": "local"}) or 0,
+        "shared": get("token_cache_hits_total", {"tier": "shared"}) or 0,
+        "misses": get("token_cache_misses_total") or 0,
+    }
+
+
+def _counted(before):
+    return {name: count - before[name] for name, count in _lookups().items()}
+
+
+class TestTerminalCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = TerminalCache(10, 60)
+        before = _lookups()
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", "expired:")
+        self.assertEqual(cache.get("a"), "expired:")
+        self.assertEqual(_counted(before), {"local": 1, "shared": 0, "misses": 1})
+
+    def test_evicts_least_recently_used(self):
+        cache = TerminalCache(2, 60)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        self.assertEqual(cache.get("a"), "1")
+        self.assertIsNone(cache.get("b"))
+
+    def test_entries_expire(self):
+        cache = TerminalCache(10, 60)
+        with mock.patch("auth.cache.time.monotonic", return_value=0):
+            cache.put("a", "1")
+        with mock.patch("auth.cache.time.monotonic", return_value=61):
+            self.assertIsNone(cache.get("a"))
+
+    def test_shorter_ttl(self):
+        cache = TerminalCache(10, 60)
+        with mock.patch("auth.cache.time.monotonic", return_value=0):
+            cache.put("a", "1", ttl=5)
+            cache.put("b", "2", ttl=0)
+        with mock.patch("auth.cache.time.monotonic", return_value=6):
+            self.assertIsNone(cache.get("a"))
+            self.assertIsNone(cache.get("b"))
+
+    def test_disabled(self):
+        cache = TerminalCache.from_config({"TOKEN_CACHE_ENABLED": False})
+        before = _lookups()
+        cache.put("a", "1")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(_counted(before)["misses"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+# tests/test_changes.py
+
+import threading
+import time
+import unittest
+import uuid
+from unittest import mock
+
+from sqlalchemy import text
+
+from auth.main import app, config, db
+from auth import changes, store
+from auth.portable import is_postgres
+from tests.base import BaseTestCase, needs_pool
+
+
+class TestHub(unittest.TestCase):
+    def test_notify(self):
+        hub = changes.Hub()
+        with hub.waiter("a") as a, hub.waiter("b") as b:
+            self.assertEqual(hub.waiting, 2)
+            hub.notify("a")
+            self.assertTrue(a.is_set())
+            self.assertFalse(b.is_set())
+            hub.notify_all()
+            self.assertTrue(b.is_set())
+        self.assertEqual(hub.waiting, 0)
+        # nobody waiting
+        hub.notify("a")
+
+
+class TestWatch(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = {"X-API-Key": config["SECRET_KEYS"][0]}
+        self.token_id = store.register(60, 1)
+
+    def _later(self, change, delay=0.2):
+        def run():
+            time.sleep(delay)
+            with app.app_context():
+                change()
+                db.session.remove()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def test_known_state_differs(self):
+        self.assertEqual(
+            store.watch(self.token_id, "done", timeout=5), (("init", False), True)
+        )
+
+    def test_timeout(self):
+        start = time.monotonic()
+        self.assertEqual(
+            store.watch(self.token_id, timeout=0.2), (("init", False), False)
+        )
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_not_exist(self):
+        self.assertEqual(store.watch(uuid.uuid4(), timeout=1), (None, False))
+
+    def test_busy(self):
+        with mock.patch.dict(config, {"STATE_WAIT_MAX_WAITERS": 0}):
+            start = time.monotonic()
+            self.assertEqual(
+                store.watch(self.token_id, timeout=5), (("init", False), False)
+            )
+            self.assertLess(time.monotonic() - start, 1)
+
+    @needs_pool
+    def test_woken_by_exhaust(self):
+        self._later(lambda: store.exhaust(self.token_id, "done"))
+        start = time.monotonic()
+        self.assertEqual(store.watch(self.token_id, timeout=5), (("done", True), True))
+        # well before the recheck
+        self.assertLess(time.monotonic() - start, 2)
+
+    @needs_pool
+    def test_woken_by_last_invoke(self):
+        # the first invoke uses the only use up, the second exhausts it
+        store.invoke(self.token_id)
+        self._later(lambda: store.invoke(self.token_id))
+        self.assertEqual(store.watch(self.token_id, timeout=5), (("init", True), True))
+
+    @unittest.skipUnless(
+        app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgresql"), "needs Postgres"
+    )
+    def test_woken_by_notify(self):
+        # changed behind the store's back, so only NOTIFY can wake the wait
+        def update():
+            db.session.execute(
+                text("UPDATE tokens SET state = 'done' WHERE id = :id"),
+                {"id": self.token_id},
+            )
+            db.session.commit()
+
+        self._later(update, delay=0.5)
+        start = time.monotonic()
+        self.assertEqual(store.watch(self.token_id, timeout=5), (("done", False), True))
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertTrue(changes.hub.listener.is_alive())
+
+    def test_route(self):
+        url = f"/auth/state/wait?token={self.token_id}"
+        response = self.client.get(f"{url}&timeout=0", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json,
+            {"status": "ok", "state": "init", "exhausted": False, "changed": False},
+        )
+        response = self.client.get(f"{url}&exhausted=true", headers=self.headers)
+        self.assertEqual(response.json["changed"], True)
+
+        response = self.client.get("/auth/state/wait?token=nope", headers=self.headers)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# tests/test_export.py
+
+import csv
+import datetime
+import io
+import json
+import unittest
+
+from auth.main import config
+from auth import export, store
+from tests.base import BaseTestCase
+
+
+class TestExport(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = {"X-API-Key": config["ADMIN_KEYS"][0]}
+        self.token_ids = [store.register(60, 2) for _ in range(5)]
+        store.exhaust(self.token_ids[0], "done")
+
+    def test_pages(self):
+        pages = list(export.pages())
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([row.id for page in pages for row in page], self.token_ids)
+
+    def test_ndjson(self):
+        response = self.client.get("/auth/export", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertTrue(response.is_streamed)
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [str(t) for t in self.token_ids])
+        self.assertEqual(list(rows[0]), export.COLUMNS)
+        self.assertEqual((rows[0]["state"], rows[0]["exhausted"]), ("done", True))
+        self.assertEqual(rows[1]["refresh"], 2)
+
+    def test_csv(self):
+        response = self.client.get("/auth/export?format=csv", headers=self.headers)
+        self.assertEqual(response.mimetype, "text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]["state"], "done")
+
+    def test_filters(self):
+        def ids(query):
+            response = self.client.get(f"/auth/export?{query}", headers=self.headers)
+            return [json.loads(line)["id"] for line in response.text.splitlines()]
+
+        self.assertEqual(ids("state=done"), [str(self.token_ids[0])])
+        self.assertEqual(len(ids("exhausted=false")), 4)
+        hour = datetime.timedelta(hours=1)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.assertEqual(ids(f"registered_to={(now - hour).isoformat()[:19]}"), [])
+        self.assertEqual(
+            len(ids(f"registered_from={(now - hour).isoformat()[:19]}")), 5
+        )
+
+    def test_requires_admin_key(self):
+        self.assertEqual(self.client.get("/auth/export").status_code, 403)
+        response = self.client.get(
+            "/auth/export", headers={"X-API-Key": config["SECRET_KEYS"][0]}
+        )
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get("/auth/export?format=xml", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
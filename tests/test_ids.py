@@ -0,0 +1,67 @@
+# tests/test_ids.py
+
+import datetime
+import unittest
+import uuid
+
+from auth.main import db
+from auth.models import Token
+from auth import ids, store
+from auth.store import Outcome
+from tests.base import BaseTestCase
+
+
+class TestIds(unittest.TestCase):
+    def test_uuid7_layout(self):
+        token_id = ids.uuid7()
+        self.assertEqual(token_id.version, 7)
+        self.assertEqual(token_id.variant, uuid.RFC_4122)
+
+    def test_uuid7_is_time_ordered(self):
+        generated = [ids.uuid7() for _ in range(1000)]
+        self.assertEqual(generated, sorted(generated))
+
+    def test_created_on(self):
+        before = datetime.datetime.now(datetime.timezone.utc)
+        for token_id in (ids.uuid7(), uuid.uuid1()):
+            created = ids.created_on(token_id)
+            self.assertLess(abs((created - before).total_seconds()), 1)
+        self.assertIsNone(ids.created_on(uuid.uuid4()))
+
+    def test_floor_bounds_creation_time(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        token_id = ids.uuid7()
+        self.assertLessEqual(ids.floor(now - datetime.timedelta(seconds=1)), token_id)
+        self.assertGreater(ids.floor(now + datetime.timedelta(seconds=1)), token_id)
+
+    def test_floor_of_naive_time_is_utc(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.assertEqual(ids.floor(now.replace(tzinfo=None)), ids.floor(now))
+
+
+class TestTokenIds(BaseTestCase):
+    def test_new_tokens_use_uuid7(self):
+        self.assertEqual(store.register(10, 1).version, 7)
+
+    def test_older_id_versions_are_accepted(self):
+        for token_id in (uuid.uuid1(), uuid.uuid4()):
+            token = Token(60, 1)
+            token.id = token_id
+            db.session.add(token)
+            db.session.commit()
+            self.assertEqual(store.validate(str(token_id)).outcome, Outcome.EXIST)
+
+    def test_creation_range_scan(self):
+        start = datetime.datetime.now(datetime.timezone.utc)
+        token_ids = [store.register(10, 1) for _ in range(3)]
+        found = db.session.execute(
+            db.select(Token.id).where(
+                Token.id >= ids.floor(start - datetime.timedelta(milliseconds=1)),
+                Token.id < ids.floor(start + datetime.timedelta(hours=1)),
+            )
+        ).scalars()
+        self.assertEqual(sorted(found), token_ids)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+# tests/test_import.py
+
+import datetime
+import io
+import json
+import threading
+import unittest
+import uuid
+
+from auth.main import app, config, db
+from auth import changes, export, importer, store
+from auth.backends import Outcome
+from auth.models import Token
+from tests.base import BaseTestCase
+
+
+def _ndjson(*records) -> io.BytesIO:
+    return io.BytesIO(b"".join(json.dumps(r).encode() + b"\n" for r in records))
+
+
+class TestImport(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = {"X-API-Key": config["ADMIN_KEYS"][0]}
+        self.expires_on = (
+            datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+        ).isoformat()
+
+    def _record(self, **fields):
+        return {"id": str(uuid.uuid4()), "expires_on": self.expires_on, **fields}
+
+    def test_load(self):
+        records = [self._record(uses=3) for _ in range(5)]
+        report = importer.load(_ndjson(*records))
+        self.assertEqual(
+            {k: report[k] for k in ("rows", "inserted", "updated", "skipped")},
+            {"rows": 5, "inserted": 5, "updated": 0, "skipped": 0},
+        )
+        self.assertIn("rows_per_second", report)
+        token = db.session.get(Token, uuid.UUID(records[0]["id"]))
+        self.assertEqual((token.refresh, token.state), (3, "init"))
+        self.assertEqual(token.expires_on.isoformat(), self.expires_on)
+        self.assertEqual(store.invoke(token.id).outcome, Outcome.REFRESH)
+
+    def test_conflicts(self):
+        token_id = store.register(60, 1)
+        records = [self._record(id=str(token_id), uses=5), self._record(uses=1)]
+
+        report = importer.load(_ndjson(*records), on_conflict="skip")
+        self.assertEqual((report["inserted"], report["skipped"]), (1, 1))
+        self.assertEqual(db.session.get(Token, token_id).refresh, 1)
+
+        report = importer.load(_ndjson(*records), on_conflict="update")
+        self.assertEqual((report["inserted"], report["updated"]), (0, 2))
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Token, token_id).refresh, 5)
+
+    def test_duplicate_ids_last_wins(self):
+        record = self._record(uses=1)
+        report = importer.load(_ndjson(record, {**record, "uses": 4}))
+        self.assertEqual((report["inserted"], report["skipped"]), (1, 1))
+        self.assertEqual(db.session.get(Token, uuid.UUID(record["id"])).refresh, 4)
+
+    def test_invalid_records(self):
+        stream = io.BytesIO(
+            json.dumps(self._record(uses=1)).encode()
+            + b"\nnot json\n"
+            + json.dumps({"id": "nope", "uses": 1}).encode()
+            + b"\n"
+        )
+        report = importer.load(stream)
+        self.assertEqual((report["rows"], report["invalid"]), (1, 2))
+        self.assertTrue(report["errors"][0].startswith("line 2:"))
+        self.assertTrue(report["errors"][1].startswith("line 3:"))
+
+    def test_discards_cached_results(self):
+        record = self._record(uses=1)
+        token_id = uuid.UUID(record["id"])
+        self.assertEqual(store.validate(token_id).outcome, Outcome.NOT_EXIST)
+        importer.load(_ndjson(record))
+        self.assertEqual(store.validate(token_id).outcome, Outcome.EXIST)
+
+    @unittest.skipUnless(
+        app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgresql"), "needs Postgres"
+    )
+    def test_flushes_other_caches(self):
+        flushed = threading.Event()
+        changes.hub.on_flush(flushed.set)
+        self.addCleanup(changes.hub._flushes.remove, flushed.set)
+        changes.hub.listen(app)
+        # a listener that is just connecting flushes once it is
+        flushed.wait(1)
+        flushed.clear()
+        importer.load(_ndjson(self._record(uses=1)))
+        self.assertTrue(flushed.wait(5))
+
+    def test_export_round_trip(self):
+        store.register(60, 2)
+        store.exhaust(store.register(60, 1), "done")
+        for export_format in importer.FORMATS:
+            exported = b"".join(export.stream(export_format))
+            db.session.query(Token).delete()
+            db.session.commit()
+            report = importer.load(io.BytesIO(exported), export_format)
+            self.assertEqual((report["inserted"], report["invalid"]), (2, 0))
+            self.assertEqual(b"".join(export.stream(export_format)), exported)
+
+    def test_csv_round_trip_keeps_empty_state(self):
+        token_id = store.register(60, 1)
+        store.exhaust(token_id, "")
+        exported = b"".join(export.stream("csv"))
+        db.session.query(Token).delete()
+        db.session.commit()
+        report = importer.load(io.BytesIO(exported), "csv")
+        self.assertEqual((report["inserted"], report["invalid"]), (1, 0))
+        token = db.session.get(Token, token_id)
+        self.assertEqual((token.state, token.exhausted), ("", True))
+
+    def test_route(self):
+        record = self._record(uses=2)
+        body = (
+            f"id,expires_on,uses,registered_on\n{record['id']},{self.expires_on},2,\n"
+        )
+        response = self.client.post(
+            "/auth/import?format=csv", data=body, headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["inserted"], 1)
+        self.assertEqual(store.state(record["id"]), "init")
+
+        self.assertEqual(self.client.post("/auth/import").status_code, 403)
+        # client keys can't rewrite tokens
+        response = self.client.post(
+            "/auth/import?format=csv&on_conflict=update",
+            data=body,
+            headers={"X-API-Key": config["SECRET_KEYS"][0]},
+        )
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(
+            "/auth/import?on_conflict=merge", data=body, headers=self.headers
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+# tests/test_main.py
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from auth.main import app, enabled_blueprints
+from auth.config import ProdConfig
+
+
+def _loaded(blueprints: str) -> dict:
+    """
+    Routes and route modules of an app created in a fresh process
+    """
+    script = (
+        "import json, sys\n"
+        "from auth.main import create_app\n"
+        f"app = create_app(blueprints={blueprints!r})\n"
+        "print(json.dumps({\n"
+        "    'blueprints': sorted(app.blueprints),\n"
+        "    'modules': [m for m in ('auth.store', 'auth.upstream', 'requests')\n"
+        "                if m in sys.modules],\n"
+        "}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        env={**os.environ, "START_BACKGROUND_WORKERS": "false"},
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+class TestCreateApp(unittest.TestCase):
+    def test_enabled_blueprints(self):
+        self.assertEqual(
+            enabled_blueprints("all"), ["auth", "export", "redirect", "health"]
+        )
+        self.assertEqual(enabled_blueprints("auth, health"), ["auth", "health"])
+        self.assertEqual(
+            enabled_blueprints(["proxy", "export"]), ["export", "redirect", "health"]
+        )
+        with self.assertRaises(ValueError):
+            enabled_blueprints("auth,admin")
+
+    def test_default_app(self):
+        self.assertEqual(set(app.blueprints), {"auth", "gdrive", "redirect", "health"})
+
+    def test_auth_only(self):
+        loaded = _loaded("auth")
+        self.assertEqual(loaded["blueprints"], ["auth", "health"])
+        self.assertEqual(loaded["modules"], ["auth.store"])
+
+    def test_proxy_only(self):
+        loaded = _loaded("proxy")
+        self.assertEqual(loaded["blueprints"], ["gdrive", "health", "redirect"])
+        self.assertNotIn("auth.store", loaded["modules"])
+
+
+class TestLoadServices(unittest.TestCase):
+    def test_vcap_services(self):
+        services = {
+            "user-provided": [
+                {"name": "token-service-secret", "credentials": {"keys": ["k"]}}
+            ],
+            "aws-rds": [
+                {"name": "tokendb", "credentials": {"uri": "postgres://db/a"}},
+                {"name": "tokendb-replica", "credentials": {"uri": "postgres://db/b"}},
+            ],
+        }
+        config = {"DB_REPLICA_SERVICE": "tokendb-replica"}
+        with mock.patch.dict(os.environ, {"VCAP_SERVICES": json.dumps(services)}):
+            ProdConfig.load_services(config)
+        self.assertEqual(config["SECRET_KEYS"], ["k"])
+        self.assertEqual(config["TOKEN_SIGNING_KEYS"], [])
+        self.assertEqual(config["SQLALCHEMY_DATABASE_URI"], "postgresql://db/a")
+        self.assertEqual(config["SQLALCHEMY_BINDS"], {"replica": "postgresql://db/b"})
+
+    def test_environment(self):
+        config = {"DB_REPLICA_SERVICE": "", "SQLALCHEMY_DATABASE_URI": "sqlite://"}
+        environ = {"VCAP_SERVICES": "", "TOKEN_SECRET_KEY": "k"}
+        with mock.patch.dict(os.environ, environ):
+            ProdConfig.load_services(config)
+        self.assertEqual(config["SECRET_KEYS"], ["k"])
+        # set by the config class
+        self.assertEqual(config["SQLALCHEMY_DATABASE_URI"], "sqlite://")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# tests/test_metrics.py
+
+import json
+import unittest
+
+from tests.base import BaseTestCase, needs_pool
+from auth import metrics
+from auth.main import config, db
+
+
+class TestMetrics(BaseTestCase):
+    def _sample(self, name, **labels):
+        return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_route_and_token_metrics(self):
+        """Requests, queries and token operations are recorded"""
+        headers = {"X-API-Key": config["SECRET_KEYS"][0]}
+        before = {
+            "requests": self._sample(
+                "http_request_duration_seconds_count",
+                endpoint="auth.validate",
+                method="GET",
+                status="200",
+            ),
+            "registered": self._sample("tokens_registered_total", format="uuid"),
+            "invoked": self._sample(
+                "token_operations_total", operation="invoke", outcome="refresh"
+            ),
+            "selects": self._sample(
+                "db_query_duration_seconds_count", statement="SELECT"
+            ),
+        }
+
+        response = self.client.post("/auth", headers=headers)
+        token = json.loads(response.data)["auth_token"]
+        self.client.get(f"/auth/{token}", headers=headers)
+        self.client.post(f"/auth/{token}/decrement", headers=headers)
+
+        self.assertEqual(
+            self._sample(
+                "http_request_duration_seconds_count",
+                endpoint="auth.validate",
+                method="GET",
+                status="200",
+            ),
+            before["requests"] + 1,
+        )
+        self.assertEqual(
+            self._sample("tokens_registered_total", format="uuid"),
+            before["registered"] + 1,
+        )
+        self.assertEqual(
+            self._sample(
+                "token_operations_total", operation="invoke", outcome="refresh"
+            ),
+            before["invoked"] + 1,
+        )
+        self.assertGreater(
+            self._sample("db_query_duration_seconds_count", statement="SELECT"),
+            before["selects"],
+        )
+
+    def test_failed_query(self):
+        """A failing statement leaves later query timings intact"""
+        before = self._sample("db_query_duration_seconds_count", statement="SELECT")
+        with self.assertRaises(Exception):
+            db.session.execute(db.text("SELECT * FROM no_such_table"))
+        db.session.rollback()
+        db.session.execute(db.text("SELECT 1"))
+        self.assertEqual(
+            self._sample("db_query_duration_seconds_count", statement="SELECT"),
+            before + 1,
+        )
+
+    @needs_pool
+    def test_pool_checkout_wait(self):
+        self.assertIsInstance(db.engine.pool, metrics.TimedQueuePool)
+        before = self._sample("db_pool_checkout_wait_seconds_count")
+        with db.engine.connect():
+            pass
+        self.assertEqual(
+            self._sample("db_pool_checkout_wait_seconds_count"), before + 1
+        )
+
+    def test_export(self):
+        self.client.get("/health")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            b'http_request_duration_seconds_count{endpoint="health.health"',
+            response.data,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
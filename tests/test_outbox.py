@@ -0,0 +1,102 @@
+# tests/test_outbox.py
+
+import http.server
+import json
+import threading
+import unittest
+from unittest import mock
+
+from auth.main import config, db
+from auth.models import SurveyOutbox
+from auth.upstream import Upstream
+from auth import metrics, outbox
+from tests.base import BaseTestCase
+from tests.test_upstream import StubHandler
+
+
+def _deliveries(result):
+    return (
+        metrics.REGISTRY.get_sample_value("outbox_deliveries_total", {"result": result})
+        or 0
+    )
+
+
+class TestOutbox(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = http.server.ThreadingHTTPServer(("localhost", 0), StubHandler)
+        self.server.status = 200
+        self.server.connections = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        gdrive = Upstream(
+            "gdrive", f"http://localhost:{self.server.server_port}", retries=0
+        )
+        self.patch = mock.patch.object(outbox, "gdrive", gdrive)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def _export(self):
+        return self.client.post(
+            "/export/survey-response",
+            headers={"X-API-Key": config["SECRET_KEYS"][0]},
+            data=json.dumps({"surveyId": "SV_1", "responseId": "R_1"}),
+            content_type="application/json",
+        )
+
+    def test_export_is_queued_and_dispatched(self):
+        with self.client:
+            response = self._export()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(outbox.stats()["depth"], 1)
+
+            self.assertEqual(outbox.dispatch()["sent"], 1)
+            self.assertEqual(outbox.stats()["depth"], 0)
+
+    def test_server_errors_are_retried_then_dead_lettered(self):
+        self.server.status = 500
+        with self.client:
+            self._export()
+            self.assertEqual(outbox.dispatch()["retried"], 1)
+            self.assertEqual(outbox.dispatch()["dead"], 1)
+            self.assertEqual(outbox.dispatch()["claimed"], 0)
+
+            row = db.session.execute(db.select(SurveyOutbox)).scalar_one()
+            self.assertTrue(row.dead)
+            self.assertEqual(row.attempts, config["OUTBOX_MAX_ATTEMPTS"])
+            self.assertTrue(row.last_error.startswith("HTTP 500"))
+            self.assertEqual(outbox.stats()["dead_letters"], 1)
+
+    def test_metrics(self):
+        self.server.status = 500
+        with self.client:
+            self._export()
+            before = {r: _deliveries(r) for r in ("sent", "retried", "dead")}
+            outbox.dispatch()
+            outbox.dispatch()
+            self.server.status = 200
+            self._export()
+            outbox.dispatch()
+            self.assertEqual(
+                {r: _deliveries(r) - before[r] for r in before},
+                {"sent": 1, "retried": 1, "dead": 1},
+            )
+            outbox.stats()
+            get = metrics.REGISTRY.get_sample_value
+            self.assertEqual(get("outbox_queued_responses"), 0)
+            self.assertEqual(get("outbox_dead_letters"), 1)
+            self.assertEqual(get("outbox_oldest_age_seconds"), 0)
+
+    def test_client_errors_are_dead_lettered(self):
+        self.server.status = 400
+        with self.client:
+            self._export()
+            self.assertEqual(outbox.dispatch()["dead"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
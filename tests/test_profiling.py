@@ -0,0 +1,77 @@
+# tests/test_profiling.py
+
+import unittest
+
+from auth.main import app, config
+from auth import profiling
+from tests.base import BaseTestCase
+
+
+class TestProfiling(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = {"X-API-Key": config["SECRET_KEYS"][0]}
+        self.admin = {"X-Profile": config["PROFILING_ADMIN_KEYS"][0]}
+
+    def test_installed(self):
+        self.assertIsInstance(app.wsgi_app, profiling.Profiler)
+
+    def test_profiled_request(self):
+        response = self.client.post("/auth", headers={**self.headers, **self.admin})
+        self.assertEqual(response.status_code, 201)
+        profile_id = response.headers["X-Profile-Id"]
+        self.assertIn('sql;desc="1 queries"', response.headers["Server-Timing"])
+
+        listing = self.client.get("/profiles", headers=self.admin).json["profiles"]
+        summary = next(p for p in listing if p["id"] == profile_id)
+        self.assertEqual(summary["path"], "/auth")
+        self.assertEqual(summary["status"], 201)
+        self.assertEqual(summary["sql_count"], 1)
+
+        folded = self.client.get(f"/profiles/{profile_id}", headers=self.admin)
+        self.assertEqual(folded.status_code, 200)
+        for line in folded.text.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+
+    def test_requires_admin_key(self):
+        response = self.client.post(
+            "/auth", headers={**self.headers, "X-Profile": "wrong"}
+        )
+        self.assertNotIn("X-Profile-Id", response.headers)
+        self.assertEqual(self.client.get("/profiles").status_code, 403)
+        self.assertEqual(
+            self.client.get("/profiles", headers={"X-Profile": "wrong"}).status_code,
+            403,
+        )
+        self.assertEqual(
+            self.client.get("/profiles/not-an-id", headers=self.admin).status_code,
+            404,
+        )
+
+    def test_unprofiled_request(self):
+        response = self.client.post("/auth", headers=self.headers)
+        self.assertNotIn("Server-Timing", response.headers)
+
+    def test_keeps_newest(self):
+        for _ in range(config["PROFILING_KEEP"] + 2):
+            self.client.get("/health", headers=self.admin)
+        listing = self.client.get("/profiles", headers=self.admin).json["profiles"]
+        self.assertEqual(len(listing), config["PROFILING_KEEP"])
+
+    def test_sampling(self):
+        profiler = profiling.Profiler(
+            lambda environ, start_response: start_response("200 OK", []) or [b""],
+            ["key"],
+            config["PROFILING_DIR"],
+            sample_rate=1,
+        )
+        headers = []
+        profiler({"PATH_INFO": "/"}, lambda status, h, exc_info=None: headers.extend(h))
+        # sampled profiles are stored but not announced
+        self.assertEqual(headers, [])
+        self.assertTrue(profiler._summaries())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+# tests/test_ratelimit.py
+
+import json
+import unittest
+from unittest import mock
+
+from tests.base import BaseTestCase
+from auth import access
+from auth.main import config
+from auth.ratelimit import Limit, RateLimiter, fingerprint
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_bucket_refills(self):
+        limiter = RateLimiter(10, 2)
+        with mock.patch("auth.ratelimit.time.monotonic", return_value=100.0):
+            self.assertEqual(limiter.acquire("key", "auth.invoke"), 0)
+            self.assertEqual(limiter.acquire("key", "auth.invoke"), 0)
+            self.assertAlmostEqual(limiter.acquire("key", "auth.invoke"), 0.1)
+            # buckets are per route and per key
+            self.assertEqual(limiter.acquire("key", "auth.register"), 0)
+            self.assertEqual(limiter.acquire("other", "auth.invoke"), 0)
+        with mock.patch("auth.ratelimit.time.monotonic", return_value=100.2):
+            self.assertEqual(limiter.acquire("key", "auth.invoke"), 0)
+
+        self.assertEqual(
+            limiter.stats(fingerprint("key")), {"allowed": 4, "limited": 1}
+        )
+
+    def test_overrides(self):
+        key_id = fingerprint("key")
+        limiter = RateLimiter(
+            10,
+            20,
+            {
+                f"{key_id}:auth.invoke": Limit(1, 1),
+                key_id: Limit(0, 0),
+                "*:auth.register": Limit(2, 4),
+            },
+        )
+        self.assertEqual(limiter.limit_for(key_id, "auth.invoke"), Limit(1, 1))
+        self.assertEqual(limiter.limit_for(key_id, "auth.register"), Limit(0, 0))
+        self.assertEqual(limiter.limit_for("other", "auth.register"), Limit(2, 4))
+        self.assertEqual(limiter.limit_for("other", "auth.invoke"), Limit(10, 20))
+        # a rate of 0 is unlimited
+        for _ in range(5):
+            self.assertEqual(limiter.acquire("key", "auth.register"), 0)
+
+    def test_from_config(self):
+        limiter = RateLimiter.from_config(
+            {
+                "RATE_LIMIT_RATE": 5,
+                "RATE_LIMIT_BURST": 10,
+                "RATE_LIMITS": '{"abc": {"rate": 1}}',
+            }
+        )
+        self.assertEqual(limiter.default, Limit(5, 10))
+        self.assertEqual(limiter.limits, {"abc": Limit(1, 1)})
+
+
+class TestRateLimitedRoutes(BaseTestCase):
+    def test_over_limit(self):
+        """Requests over the key's limit get a 429 with Retry-After"""
+        headers = {"X-API-Key": config["SECRET_KEYS"][0]}
+        with mock.patch.object(access, "limiter", RateLimiter(0.5, 2)):
+            for _ in range(2):
+                response = self.client.post("/auth", headers=headers)
+                self.assertEqual(response.status_code, 201)
+
+            response = self.client.post("/auth", headers=headers)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers["Retry-After"], "2")
+            self.assertEqual(json.loads(response.data)["message"], "Too many requests")
+
+            # invalid keys are rejected by authentication, not counted
+            response = self.client.post("/auth", headers={"X-API-Key": "nope"})
+            self.assertEqual(response.status_code, 403)
+
+            response = self.client.get("/auth/rate-limit", headers=headers)
+            data = json.loads(response.data)
+            self.assertEqual(data["key"], fingerprint(config["SECRET_KEYS"][0]))
+            self.assertEqual(data["limited"], 1)
+            self.assertEqual(data["allowed"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+# tests/test_replica.py
+
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+
+from auth.main import config, db
+from auth import metrics, replica, store
+from auth.backends import Outcome
+from auth.backends.sql import SQLBackend
+from auth.models import Token
+from tests.base import BaseTestCase
+
+
+@unittest.skipUnless(
+    "replica" in config.get("SQLALCHEMY_BINDS", {}), "no replica configured"
+)
+class TestReplica(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.replica = replica.Replica(max_lag=5, check_interval=0)
+        self.backend = SQLBackend(self.replica)
+        self.token_id = store.register(60, 1)
+
+    def _reads(self, target):
+        return (
+            metrics.REGISTRY.get_sample_value("db_reads_total", {"target": target}) or 0
+        )
+
+    def _validate(self, consistent=False):
+        before = self._reads("replica"), self._reads("primary")
+        with replica.reads(consistent):
+            self.assertIn(self.token_id, self.backend.validate([self.token_id]))
+        return (
+            self._reads("replica") - before[0],
+            self._reads("primary") - before[1],
+        )
+
+    def test_reads_use_replica(self):
+        self.assertEqual(self._validate(), (1, 0))
+        self.assertEqual(self.replica.lag, 0)
+
+    def test_outside_reads_use_primary(self):
+        before = self._reads("primary")
+        self.assertEqual(self.backend.state(self.token_id), "init")
+        self.assertEqual(self._reads("primary") - before, 1)
+
+    def test_read_after_write_uses_primary(self):
+        self.assertEqual(self._validate(consistent=True), (0, 1))
+
+    def test_lagging_replica_falls_back(self):
+        with mock.patch.object(self.replica, "_check", return_value=False):
+            self.assertEqual(self._validate(), (0, 1))
+
+    def test_failing_replica_falls_back(self):
+        engine = mock.Mock()
+        engine.connect.side_effect = OperationalError("SELECT", {}, Exception())
+        with mock.patch.object(self.replica, "usable", return_value=True):
+            with mock.patch.object(self.replica, "engine", return_value=engine):
+                self.assertEqual(self._validate(), (0, 1))
+        # left alone until the next check
+        self.assertFalse(self.replica._usable)
+
+    def test_routes(self):
+        headers = {"X-API-Key": config["SECRET_KEYS"][0]}
+        before = self._reads("replica")
+        response = self.client.get(f"/auth/{self.token_id}", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            f"/auth/{self.token_id}",
+            headers={**headers, "X-Consistency": "strong"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._reads("replica") - before, 1)
+
+
+class TestLaggingReplica(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # a replica that hasn't replayed anything yet
+        self.engine = create_engine("sqlite://", poolclass=StaticPool)
+        Token.__table__.create(self.engine)
+        for name, value in (("engine", self.engine), ("usable", True)):
+            patcher = mock.patch.object(replica.Replica, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.token_id = store.register(60, 2)
+
+    def test_missing_rows_are_read_from_primary(self):
+        with replica.reads():
+            self.assertEqual(store.validate(self.token_id).outcome, Outcome.EXIST)
+            self.assertEqual(store.state(self.token_id), "init")
+
+    def test_missing_tokens_are_not_cached(self):
+        with replica.reads():
+            store.validate(self.token_id)
+        self.assertEqual(store.invoke(self.token_id).outcome, Outcome.REFRESH)
+
+    def test_strong_reads_and_writes_skip_the_cache(self):
+        # e.g. remembered by another instance before the token was imported
+        store.terminal_cache.put(str(self.token_id), "not_exist:")
+        with replica.reads(consistent=True):
+            self.assertEqual(store.validate(self.token_id).outcome, Outcome.EXIST)
+            self.assertEqual(store.state(self.token_id), "init")
+        self.assertEqual(store.invoke(self.token_id).outcome, Outcome.REFRESH)
+        self.assertEqual(store.exhaust(self.token_id, "done").outcome, Outcome.EXHAUST)
+
+
+if __name__ == "__main__":
+    unittest.main()
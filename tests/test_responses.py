@@ -0,0 +1,45 @@
+# tests/test_responses.py
+
+import json
+import unittest
+import uuid
+from unittest import mock
+
+from auth import responses
+from auth.main import app
+from auth.responses import BODIES, Responses
+
+
+class TestResponses(unittest.TestCase):
+    def test_constant_bodies(self):
+        """Constant responses carry the prebuilt payload"""
+        with app.test_request_context():
+            for name in ("exist", "refresh", "expired", "not_exist"):
+                response, status = getattr(Responses, name)()
+                self.assertEqual(status, BODIES[name][1])
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response.content_type, "application/json")
+                self.assertEqual(json.loads(response.get_data()), BODIES[name][0])
+
+    def test_dynamic_bodies(self):
+        """Dynamic responses are serialized per call"""
+        token = uuid.uuid4()
+        with app.test_request_context():
+            response, status = Responses.registered(token)
+            self.assertEqual(status, 201)
+            self.assertEqual(json.loads(response.get_data())["auth_token"], str(token))
+
+            response, status = Responses.exhausted("completed")
+            self.assertEqual(status, 403)
+            self.assertEqual(json.loads(response.get_data())["state"], "completed")
+
+    def test_dumps_without_orjson(self):
+        """The stdlib fallback produces the same JSON"""
+        body = {"status": "success", "auth_token": uuid.uuid4()}
+        fast = responses.dumps(body)
+        with mock.patch.object(responses, "orjson", None):
+            self.assertEqual(json.loads(responses.dumps(body)), json.loads(fast))
+
+
+if __name__ == "__main__":
+    unittest.main()
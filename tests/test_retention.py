@@ -0,0 +1,117 @@
+# tests/test_retention.py
+
+import datetime
+import unittest
+from unittest import mock
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from auth.main import app, db
+from auth.models import IdempotencyKey, Token, TokenArchive
+from auth import retention, store
+from tests.base import BaseTestCase
+
+
+class TestRetention(BaseTestCase):
+    def _token(self, expired_ago=None, exhausted_ago=None):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        token = Token(60, 1)
+        if expired_ago is not None:
+            token.expires_on = now - datetime.timedelta(seconds=expired_ago)
+        if exhausted_ago is not None:
+            token.exhausted = True
+            token.exhausted_on = now - datetime.timedelta(seconds=exhausted_ago)
+        db.session.add(token)
+        db.session.commit()
+        return token.id
+
+    def setUp(self):
+        super().setUp()
+        self.old = [self._token(expired_ago=3600) for _ in range(3)]
+        self.old += [self._token(exhausted_ago=3600) for _ in range(2)]
+        self.kept = [
+            self._token(),
+            self._token(expired_ago=10),
+            self._token(exhausted_ago=10),
+        ]
+
+    def _remaining(self):
+        return set(db.session.execute(db.select(Token.id)).scalars())
+
+    def test_purge_deletes_past_grace_period(self):
+        stats = retention.purge()
+        self.assertEqual(stats["removed"], 5)
+        self.assertEqual(self._remaining(), set(self.kept))
+        self.assertEqual(db.session.query(TokenArchive).count(), 0)
+
+    def test_purge_without_grace_period(self):
+        stats = retention.purge(grace_seconds=0)
+        self.assertEqual(stats["removed"], 7)
+        self.assertEqual(self._remaining(), {self.kept[0]})
+
+    def test_purge_archives(self):
+        stats = retention.purge(archive=True)
+        self.assertEqual(stats["removed"], 5)
+        archived = set(db.session.execute(db.select(TokenArchive.id)).scalars())
+        self.assertEqual(archived, set(self.old))
+
+    def test_purge_expired_idempotency_keys(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for key, expires_on in (("fp:old", -1), ("fp:new", 60)):
+            db.session.add(
+                IdempotencyKey(
+                    key=key,
+                    token="t",
+                    expires_on=now + datetime.timedelta(seconds=expires_on),
+                )
+            )
+        db.session.commit()
+        self.assertEqual(retention.purge()["idempotency_keys"], 1)
+        self.assertEqual(
+            list(db.session.execute(db.select(IdempotencyKey.key)).scalars()),
+            ["fp:new"],
+        )
+
+    @unittest.skipUnless(
+        app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgresql"), "needs Postgres"
+    )
+    def test_failed_batch_releases_lock(self):
+        def fail(connection, *args):
+            connection.execute(text("SELECT 1 / 0"))
+
+        with mock.patch.object(retention, "_batch", side_effect=fail):
+            with self.assertRaisesRegex(DBAPIError, "division by zero"):
+                retention.purge()
+        locks = db.session.execute(
+            text("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory'")
+        ).scalar()
+        self.assertEqual(locks, 0)
+        self.assertEqual(retention.purge()["removed"], 5)
+
+    @unittest.skipUnless(
+        app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgresql"), "needs Postgres"
+    )
+    def test_purge_skipped_while_locked(self):
+        with db.engine.connect() as connection:
+            connection.execute(
+                text("SELECT pg_advisory_lock(:key)"), {"key": retention.LOCK_KEY}
+            )
+            try:
+                stats = retention.purge()
+            finally:
+                connection.execute(
+                    text("SELECT pg_advisory_unlock(:key)"),
+                    {"key": retention.LOCK_KEY},
+                )
+        self.assertEqual((stats["removed"], stats["idempotency_keys"]), (0, 0))
+        self.assertEqual(len(self._remaining()), 8)
+
+    def test_exhaust_records_time(self):
+        store.exhaust(self.kept[0], "done")
+        token = db.session.get(Token, self.kept[0])
+        self.assertIsNotNone(token.exhausted_on)
+
+
+if __name__ == "__main__":
+    unittest.main()
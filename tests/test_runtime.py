@@ -0,0 +1,77 @@
+# tests/test_runtime.py
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from tests.base import BaseTestCase, needs_pool
+from auth import runtime
+from auth.main import app, db
+
+
+class TestRuntime(BaseTestCase):
+    def test_health(self):
+        """Readiness check reports a reachable database"""
+        response = self.client.get("/health")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["status"], "ok")
+
+    def test_health_unavailable(self):
+        """Readiness check fails while the database is unreachable"""
+        with mock.patch.object(db.session, "execute", side_effect=Exception("down")):
+            response = self.client.get("/health")
+        self.assertEqual(response.status_code, 503)
+
+    @needs_pool
+    def test_warm_pool(self):
+        """Warmup opens connections and returns them to the pool"""
+        self.assertEqual(runtime.warm_pool(app, 3), 3)
+        self.assertEqual(db.engine.pool.checkedout(), 0)
+        self.assertGreaterEqual(db.engine.pool.checkedin(), 3)
+
+
+class TestWorkerSizing(unittest.TestCase):
+    def test_memory_limit(self):
+        for value, expected in [("128m", 128), ("1G", 1024), ("512", 512), ("", 7)]:
+            with mock.patch.dict(os.environ, {"MEMORY_LIMIT": value}):
+                self.assertEqual(runtime.memory_limit_mb(default=7), expected)
+
+    def test_worker_count(self):
+        # memory bound, CPU bound, and never less than one
+        self.assertEqual(runtime.worker_count(128, 4, 48), 2)
+        self.assertEqual(runtime.worker_count(4096, 2, 48), 5)
+        self.assertEqual(runtime.worker_count(32, 1, 48), 1)
+
+
+class TestGunicornConfig(unittest.TestCase):
+    def test_sets_environment_before_config(self):
+        """The config classes see the environment gunicorn.conf.py sets up"""
+        script = (
+            "import json, runpy, sys\n"
+            "runpy.run_path('gunicorn.conf.py')\n"
+            "loaded = 'auth.config' in sys.modules\n"
+            "from auth.config import ProdConfig\n"
+            "print(json.dumps([loaded, ProdConfig.START_BACKGROUND_WORKERS,\n"
+            "    ProdConfig.SQLALCHEMY_ENGINE_OPTIONS['pool_size']]))\n"
+        )
+        environ = {
+            key: value
+            for key, value in os.environ.items()
+            if key not in ("DB_POOL_SIZE", "WORKER_THREADS")
+        }
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            env={**environ, "GUNICORN_THREADS": "8", "START_BACKGROUND_WORKERS": ""},
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        self.assertEqual(json.loads(output.splitlines()[-1]), [False, False, 9])
+
+
+if __name__ == "__main__":
+    unittest.main()
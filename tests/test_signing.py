@@ -0,0 +1,131 @@
+# tests/test_signing.py
+
+import datetime
+import json
+import unittest
+import uuid
+from unittest import mock
+
+from tests.base import BaseTestCase
+from auth import store
+from auth.main import config, db
+from auth.signing import Signer
+from auth.store import Outcome
+
+
+class TestSigner(unittest.TestCase):
+    def setUp(self):
+        self.token_id = uuid.uuid4()
+        self.expires_on = datetime.datetime.now(datetime.timezone.utc).replace(
+            microsecond=0
+        )
+
+    def test_round_trip(self):
+        signer = Signer(["key"])
+        token = signer.sign(self.token_id, self.expires_on, 3)
+        self.assertEqual(signer.verify(token), (self.token_id, self.expires_on, 3))
+
+    def test_rotation(self):
+        """Tokens signed with any active key verify"""
+        token = Signer(["old"]).sign(self.token_id, self.expires_on, 1)
+        self.assertEqual(Signer(["new", "old"]).verify(token).id, self.token_id)
+        with self.assertRaises(ValueError):
+            Signer(["new"]).verify(token)
+
+    def test_tampering(self):
+        signer = Signer(["key"])
+        token = signer.sign(self.token_id, self.expires_on, 1)
+        forged = Signer(["other"]).sign(self.token_id, self.expires_on, 100)
+        message, _, signature = token.rpartition(".")
+        for bad in (
+            forged,
+            f"{forged.rpartition('.')[0]}.{signature}",
+            token[:-2],
+            "s1.garbage.sig",
+            str(self.token_id),
+        ):
+            with self.assertRaises(ValueError):
+                signer.verify(bad)
+
+
+class TestSignedTokens(BaseTestCase):
+    headers = {"X-API-Key": config["SECRET_KEYS"][0]}
+
+    def test_register_signed(self):
+        """Signed tokens can be registered, validated and invoked"""
+        response = self.client.post(
+            "/auth",
+            headers=self.headers,
+            data=json.dumps({"format": "signed", "uses": 1}),
+            content_type="application/json",
+        )
+        token = json.loads(response.data)["auth_token"]
+        self.assertTrue(token.startswith("s1."))
+
+        for method, path, message in (
+            ("get", "", "Token exists"),
+            ("post", "/decrement", "Token successfully invoked"),
+        ):
+            response = getattr(self.client, method)(
+                f"/auth/{token}{path}", headers=self.headers
+            )
+            self.assertEqual(json.loads(response.data)["message"], message)
+
+        response = self.client.get(f"/auth/state?token={token}", headers=self.headers)
+        self.assertEqual(json.loads(response.data)["state"], "init")
+
+    def test_batch_register_signed(self):
+        response = self.client.post(
+            "/auth/batch",
+            headers=self.headers,
+            data=json.dumps({"count": 2, "format": "signed"}),
+            content_type="application/json",
+        )
+        tokens = json.loads(response.data)["auth_tokens"]
+        response = self.client.post(
+            "/auth/batch/validate",
+            headers=self.headers,
+            data=json.dumps({"tokens": tokens + ["s1.forged.token"]}),
+            content_type="application/json",
+        )
+        results = json.loads(response.data)["results"]
+        self.assertEqual(
+            [result["message"] for result in results],
+            ["Token exists", "Token exists", "Unauthorized"],
+        )
+
+    def test_rejected_without_database(self):
+        """Forged and expired signed tokens never reach the database"""
+        token_id = store.register(60, 1)
+        expired = store.signer.sign(
+            token_id,
+            datetime.datetime.now(datetime.timezone.utc)
+            - datetime.timedelta(seconds=1),
+            1,
+        )
+        forged = Signer(["not a configured key"]).sign(
+            token_id,
+            datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1),
+            1,
+        )
+        with mock.patch.object(db.session, "execute") as execute:
+            self.assertEqual(store.validate(expired).outcome, Outcome.EXPIRED)
+            self.assertEqual(store.invoke(expired).outcome, Outcome.EXPIRED)
+            with self.assertRaises(ValueError):
+                store.validate(forged)
+            execute.assert_not_called()
+
+    def test_revocation_check(self):
+        """Exhausted signed tokens are caught unless the check is disabled"""
+        token = store.register(60, 1, signed=True)
+        self.assertEqual(store.exhaust(token, "done").outcome, Outcome.EXHAUST)
+        self.assertEqual(store.validate(token), (Outcome.EXHAUSTED, "done"))
+
+        with mock.patch.dict(config, {"SIGNED_TOKEN_REVOCATION_CHECK": False}):
+            with mock.patch.object(db.session, "execute") as execute:
+                self.assertEqual(store.validate(token).outcome, Outcome.EXIST)
+                execute.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
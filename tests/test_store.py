@@ -0,0 +1,132 @@
+# tests/test_store.py
+
+import datetime
+import threading
+import unittest
+import uuid
+from unittest import mock
+
+from auth.main import app, db
+from auth.models import Token
+from auth import metrics, store
+from auth.store import Outcome
+from tests.base import BaseTestCase, needs_pool
+
+
+def _local_hits():
+    return (
+        metrics.REGISTRY.get_sample_value("token_cache_hits_total", {"tier": "local"})
+        or 0
+    )
+
+
+class TestTokenStore(BaseTestCase):
+    def _token(self, seconds=60, uses=1):
+        token = Token(seconds, uses)
+        db.session.add(token)
+        db.session.commit()
+        return token.id
+
+    def test_invoke_counts_down_uses(self):
+        token_id = self._token(uses=2)
+        self.assertEqual(store.invoke(token_id).outcome, Outcome.REFRESH)
+        self.assertEqual(store.invoke(token_id).outcome, Outcome.REFRESH)
+        self.assertEqual(store.invoke(token_id), (Outcome.EXHAUSTED, "init"))
+        self.assertEqual(store.validate(token_id), (Outcome.EXHAUSTED, "init"))
+
+    def test_invoke_not_exist(self):
+        self.assertEqual(store.invoke(uuid.uuid4()).outcome, Outcome.NOT_EXIST)
+
+    def test_invoke_expired(self):
+        token_id = self._token()
+        token = db.session.get(Token, token_id)
+        token.expires_on = datetime.datetime.now(
+            datetime.timezone.utc
+        ) - datetime.timedelta(seconds=1)
+        db.session.commit()
+        self.assertEqual(store.invoke(token_id).outcome, Outcome.EXPIRED)
+        self.assertEqual(store.exhaust(token_id, "done").outcome, Outcome.EXPIRED)
+
+    def test_exhaust_records_state(self):
+        token_id = self._token()
+        self.assertEqual(store.exhaust(token_id, "done").outcome, Outcome.EXHAUST)
+        self.assertEqual(store.exhaust(token_id, "again"), (Outcome.EXHAUSTED, "done"))
+        self.assertEqual(store.state(token_id), "done")
+
+    def test_terminal_results_are_cached(self):
+        token_id = self._token()
+        store.exhaust(token_id, "done")
+        db.session.execute(db.delete(Token))
+        db.session.commit()
+        hits = _local_hits()
+        # served from the cache although the row is gone
+        self.assertEqual(store.validate(token_id), (Outcome.EXHAUSTED, "done"))
+        self.assertEqual(store.state(token_id), "done")
+        self.assertEqual(_local_hits() - hits, 2)
+
+    def test_missing_tokens_are_cached_briefly(self):
+        token_id = uuid.uuid4()
+        with mock.patch("auth.cache.time.monotonic", return_value=0):
+            self.assertEqual(store.validate(token_id).outcome, Outcome.NOT_EXIST)
+        token = Token(60, 1)
+        token.id = token_id
+        db.session.add(token)
+        db.session.commit()
+        with mock.patch("auth.cache.time.monotonic", return_value=1):
+            self.assertEqual(store.validate(token_id).outcome, Outcome.NOT_EXIST)
+        with mock.patch("auth.cache.time.monotonic", return_value=60):
+            self.assertEqual(store.validate(token_id).outcome, Outcome.EXIST)
+
+    def test_invoke_many(self):
+        fresh, spent, expired = self._token(), self._token(), self._token()
+        store.exhaust(spent, "done")
+        token = db.session.get(Token, expired)
+        token.expires_on = datetime.datetime.now(
+            datetime.timezone.utc
+        ) - datetime.timedelta(seconds=1)
+        db.session.commit()
+        missing = uuid.uuid4()
+
+        results = store.invoke_many([fresh, spent, expired, missing, fresh])
+        self.assertEqual(
+            results,
+            [
+                (Outcome.REFRESH, "init"),
+                (Outcome.EXHAUSTED, "done"),
+                (Outcome.EXPIRED, None),
+                (Outcome.NOT_EXIST, None),
+                (Outcome.REFRESH, "init"),
+            ],
+        )
+        self.assertEqual(store.invoke_many([fresh])[0].outcome, Outcome.EXHAUSTED)
+
+    def test_exhaust_many(self):
+        token_ids = [self._token() for _ in range(3)]
+        results = store.exhaust_many(token_ids, "done")
+        self.assertEqual([r.outcome for r in results], [Outcome.EXHAUST] * 3)
+        results = store.validate_many(token_ids)
+        self.assertEqual(results, [(Outcome.EXHAUSTED, "done")] * 3)
+
+    @needs_pool
+    def test_concurrent_invoke_does_not_overuse(self):
+        uses = 3
+        token_id = self._token(uses=uses)
+        outcomes = []
+
+        def worker():
+            with app.app_context():
+                outcomes.append(store.invoke(token_id).outcome)
+                db.session.remove()
+
+        threads = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count(Outcome.REFRESH), uses)
+        self.assertEqual(outcomes.count(Outcome.EXHAUSTED), 10 - uses)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+# tests/test_upstream.py
+
+import http.server
+import socket
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+from auth import metrics
+from auth.upstream import CircuitBreaker, CircuitOpenError, Upstream
+
+
+def _sample(name, **labels):
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    status = 200
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.connections.add(self.client_address)
+        body = b'{"ok": true}'
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestUpstream(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("localhost", 0), StubHandler)
+        self.server.status = 200
+        self.server.connections = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.upstream = Upstream(
+            "stub",
+            f"http://localhost:{self.server.server_port}",
+            retries=0,
+            breaker_failures=2,
+            breaker_reset=60,
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuses_connections(self):
+        before = _sample(
+            "upstream_request_duration_seconds_count",
+            upstream="stub",
+            outcome="success",
+        )
+        for _ in range(5):
+            self.assertEqual(self.upstream.post("/", data="{}").status_code, 200)
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(
+            _sample(
+                "upstream_request_duration_seconds_count",
+                upstream="stub",
+                outcome="success",
+            )
+            - before,
+            5,
+        )
+
+    def test_breaker_opens_on_server_errors(self):
+        self.server.status = 500
+        errors = _sample(
+            "upstream_request_duration_seconds_count", upstream="stub", outcome="error"
+        )
+        rejected = _sample("upstream_rejected_total", upstream="stub")
+        self.upstream.post("/", data="{}")
+        self.upstream.post("/", data="{}")
+        with self.assertRaises(CircuitOpenError):
+            self.upstream.post("/", data="{}")
+        self.assertEqual(
+            _sample(
+                "upstream_request_duration_seconds_count",
+                upstream="stub",
+                outcome="error",
+            )
+            - errors,
+            2,
+        )
+        self.assertEqual(
+            _sample("upstream_rejected_total", upstream="stub") - rejected, 1
+        )
+        self.assertTrue(self.upstream.breaker.open)
+
+    def test_connection_errors_are_raised(self):
+        with socket.socket() as sock:
+            sock.bind(("localhost", 0))
+            port = sock.getsockname()[1]
+        upstream = Upstream("down", f"http://localhost:{port}", retries=1)
+        with self.assertRaises(requests.ConnectionError):
+            upstream.post("/", data="{}")
+
+    def test_unexpected_trial_error_reopens_breaker(self):
+        upstream = Upstream(
+            "stub", self.upstream.base_url, breaker_failures=1, breaker_reset=0
+        )
+        self.server.status = 500
+        upstream.post("/", data="{}")
+        self.assertTrue(upstream.breaker.open)
+        with mock.patch.object(upstream.session, "post", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                upstream.post("/", data="{}")
+        # the trial ended, so the next call is another trial
+        self.server.status = 200
+        self.assertEqual(upstream.post("/", data="{}").status_code, 200)
+        self.assertFalse(upstream.breaker.open)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_half_open_trial(self):
+        breaker = CircuitBreaker(1, 0)
+        breaker.record_failure()
+        self.assertTrue(breaker.open)
+        # one trial call is let through once the reset time has passed
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertFalse(breaker.open)
+        self.assertTrue(breaker.allow())
+
+
+if __name__ == "__main__":
+    unittest.main()